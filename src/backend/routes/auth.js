@@ -5,6 +5,7 @@ const {
   readUserStatus,
   setCurrentProject,
   findTextbookWithContent,
+  resolveTextbookContent,
   writeUserStatus,
 } = require("../services/storage");
 
@@ -106,7 +107,7 @@ router.post("/select-project", (req, res) => {
   if (result.found && result.path) {
     try {
       const raw = fs.readFileSync(result.path, "utf-8");
-      textbookWithContentData = JSON.parse(raw);
+      textbookWithContentData = resolveTextbookContent(JSON.parse(raw), result.path);
       isStep3Complete = hasStep3Completion(textbookWithContentData);
     } catch (err) {
       return res.status(500).json({
@@ -194,6 +194,54 @@ function findTextbookWithContent(username, projectName) {
   }
 }
 
+// Chunk files are a JSON array, or one chunk per line when streamed to .jsonl.
+function readChunkFile(filePath) {
+  const text = fs.readFileSync(filePath, "utf-8");
+  if (path.extname(filePath) !== ".jsonl") {
+    return JSON.parse(text);
+  }
+  return text
+    .split(/\r?\n/)
+    .filter((line) => line.trim())
+    .map((line) => JSON.parse(line));
+}
+
+// textbook_with_content.json nodes reference chunk ranges (chunk_start / chunk_end) in the
+// chunk file named by chunk_source; fill in `content` so clients keep reading node.content.
+// Mirrors TextbookContent in src/core/llm/textbook_content.py.
+function resolveTextbookContent(textbookData, documentPath) {
+  const source = textbookData?.chunk_source;
+  if (!source) {
+    return textbookData;
+  }
+
+  const chunks = readChunkFile(path.join(path.dirname(documentPath), source));
+  const fill = (node) => {
+    if (node.content === undefined) {
+      const start = node.chunk_start;
+      const end = node.chunk_end ?? start + 1;
+      node.content =
+        start === null || start === undefined
+          ? ""
+          : chunks
+              .slice(start, end)
+              .map((chunk) => chunk.content || "")
+              .join("\n\n");
+    }
+  };
+
+  for (const chapter of textbookData.chapters || []) {
+    fill(chapter);
+    for (const section of chapter.sections || []) {
+      fill(section);
+      for (const subsection of section.sub_sections || []) {
+        fill(subsection);
+      }
+    }
+  }
+  return textbookData;
+}
+
 module.exports = {
   USERS_DIR,
   DATA_DIR,
@@ -210,4 +258,5 @@ module.exports = {
   addUploadedProject,
   setCurrentProject,
   findTextbookWithContent,
+  resolveTextbookContent,
 };
\ No newline at end of file
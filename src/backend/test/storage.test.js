@@ -0,0 +1,55 @@
+const test = require("node:test");
+const assert = require("node:assert");
+const fs = require("fs");
+const os = require("os");
+const path = require("path");
+
+const { resolveTextbookContent } = require("../services/storage");
+
+function writeProject(chunkFile, chunkText) {
+  const dir = fs.mkdtempSync(path.join(os.tmpdir(), "textbook-"));
+  fs.writeFileSync(path.join(dir, chunkFile), chunkText, "utf-8");
+  return path.join(dir, "textbook_with_content.json");
+}
+
+const chunks = ["intro", "1.1 body", "1.2 body", "1.2 more"].map((content, i) => ({
+  Header: `h${i}`,
+  content,
+}));
+
+test("resolves chunk ranges from a .jsonl chunk source", () => {
+  const documentPath = writeProject(
+    "chunker_step_1.jsonl",
+    chunks.map((chunk) => JSON.stringify(chunk)).join("\n") + "\n"
+  );
+  const textbook = resolveTextbookContent(
+    {
+      chunk_source: "chunker_step_1.jsonl",
+      chapters: [
+        {
+          chunk_start: 0,
+          chunk_end: 1,
+          sections: [{ chunk_start: 2, chunk_end: 4, sub_sections: [] }],
+        },
+      ],
+    },
+    documentPath
+  );
+
+  assert.strictEqual(textbook.chapters[0].content, "intro");
+  assert.strictEqual(textbook.chapters[0].sections[0].content, "1.2 body\n\n1.2 more");
+});
+
+test("a missing chunk_end covers one chunk, as in textbook_content.py", () => {
+  const documentPath = writeProject("chunker_step_1.json", JSON.stringify(chunks));
+  const textbook = resolveTextbookContent(
+    {
+      chunk_source: "chunker_step_1.json",
+      chapters: [{ chunk_start: 1, sections: [{ chunk_start: null, sub_sections: [] }] }],
+    },
+    documentPath
+  );
+
+  assert.strictEqual(textbook.chapters[0].content, "1.1 body");
+  assert.strictEqual(textbook.chapters[0].sections[0].content, "");
+});
@@ -2,13 +2,26 @@
 Textbook Analysis Module - Analyzes textbook structure and content
 Integrates chunker data and table of contents to generate comprehensive learning content
 """
+import os
 import json
+import asyncio
 import logging
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Tuple, AsyncIterator, Callable
 from datetime import datetime
-
-from .llm_client import LLMClient, ModelProvider, OpenAIClient, DeepseekClient, GeminiClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .llm_client import LLMClient, ModelProvider, OpenAIClient, DeepseekClient, GeminiClient, get_rate_limiter
+from .checkpoint import CheckpointJournal
+from .textbook_content import TextbookContent
+from .toc_extractor import (
+    extract_toc,
+    extract_toc_from_text,
+    load_content_list,
+    split_toc_text,
+    stitch_toc_fragments,
+)
+from .llm_cache import with_cache
 from .prompts import *
 
 # Configure logging
@@ -29,39 +42,77 @@ class TextbookAnalyzer:
         Initialize TextbookAnalyzer
         
         Args:
-            llm_client: LLM client instance. If None, creates OpenAI client
+            llm_client: LLM client instance. If None, creates an OpenAI client, wrapped in the
+                persistent response cache only when LLM_CACHE=1 (see llm_cache.get_llm_cache)
         """
         if llm_client is None:
-            llm_client = OpenAIClient()
+            llm_client = with_cache(OpenAIClient())
         
         self.llm_client = llm_client
         self.chunker_path = chunker_path 
+        # Shared per-provider limiter, so concurrent analyzers never exceed the provider's request rate
+        provider = getattr(llm_client, "provider", None)
+        self.rate_limiter = get_rate_limiter(provider) if provider else None
         
 
     # 解析目录结构
-    def parse_table_of_content(self, toc_string: str, save_to_disk: bool = True) -> Optional[Dict[str, Any]]:
+    def parse_table_of_content(
+        self,
+        toc_string: str = "",
+        save_to_disk: bool = True,
+        content_list_path: Optional[PathLike] = None,
+        strategy: Optional[str] = None,
+        min_confidence: Optional[float] = None,
+        max_workers: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
         """
-        Parse string-formatted table of content using LLM and optionally save to disk
+        Parse the table of content and optionally save it to disk.
+        The ToC is first built locally (see toc_extractor) from MinerU's content_list, or from
+        toc_string itself; the LLM only parses toc_string when the local result is missing or
+        less confident than min_confidence.
         
         Args:
-            toc_string: String-formatted table of content
+            toc_string: String-formatted table of content; may be empty when a content_list is available
             save_to_disk: Whether to save the result to the same directory as chunker_path
+            content_list_path: MinerU *_content_list.json; defaults to the one next to chunker_path
+            strategy: "auto" (local, LLM fallback), "local" or "llm"; defaults to the
+                TOC_STRATEGY environment variable (or "auto")
+            min_confidence: Lowest local confidence accepted in "auto" mode; defaults to the
+                TOC_MIN_CONFIDENCE environment variable (or 0.8)
+            max_workers: Concurrent LLM requests when a long toc_string is parsed in per-chapter
+                fragments (see _parse_toc_with_llm); defaults to the TOC_MAX_WORKERS environment
+                variable (or 4)
             
         Returns:
-            Parsed JSON structure or None if failed
+            Parsed JSON structure or None if failed (including when nothing could be built locally
+            and toc_string is empty, so there is nothing to send to the LLM)
         """
         try:
-            prompt = ASK_TABLE_CONTENT_PROMPT.replace(
-                "[PASTE_YOUR_TOC_HERE]",
-                toc_string
-            )
-            
-            toc_json = self.llm_client.generate_json(
-                prompt=prompt,
-                system_prompt="You are a precise data extraction script. Extract table of contents and return ONLY valid JSON without any markdown formatting."
-            )
-            
-            logger.info("Successfully parsed table of content")
+            strategy = strategy or os.getenv("TOC_STRATEGY", "auto")
+            if min_confidence is None:
+                min_confidence = float(os.getenv("TOC_MIN_CONFIDENCE", "0.8"))
+
+            toc_json = None
+            if strategy != "llm":
+                toc_json = self._extract_toc_locally(toc_string, content_list_path)
+                confidence = toc_json["extraction"]["confidence"] if toc_json else 0.0
+                if toc_json and (strategy == "local" or confidence >= min_confidence or not toc_string.strip()):
+                    logger.info(f"Table of content built locally ({toc_json['extraction']['method']}, confidence {confidence})")
+                    # Extraction details are for logging only; the saved ToC keeps the prompt's schema
+                    toc_json.pop("extraction")
+                elif strategy == "local":
+                    logger.error("No table of content could be built locally")
+                    return None
+                else:
+                    logger.info(f"Local table of content confidence {confidence} < {min_confidence}, falling back to LLM")
+                    toc_json = None
+
+            if toc_json is None:
+                if not toc_string.strip():
+                    logger.error("No table of content could be built locally and toc_string is empty")
+                    return None
+                toc_json = self._parse_toc_with_llm(toc_string, max_workers)
+                logger.info("Successfully parsed table of content")
 
             # Store the result to the same path as chunker_path if requested
             if save_to_disk and self.chunker_path and toc_json:
@@ -84,6 +135,68 @@ class TextbookAnalyzer:
         except Exception as e:
             logger.error(f"Failed to parse table of content: {str(e)}")
             return None
+
+    def _generate_toc_json(self, toc_string: str) -> Dict[str, Any]:
+        prompt = ASK_TABLE_CONTENT_PROMPT.replace(
+            "[PASTE_YOUR_TOC_HERE]",
+            toc_string
+        )
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        return self.llm_client.generate_json(
+            prompt=prompt,
+            system_prompt="You are a precise data extraction script. Extract table of contents and return ONLY valid JSON without any markdown formatting."
+        )
+
+    def _parse_toc_with_llm(self, toc_string: str, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        LLM parse of toc_string. Text longer than TOC_FRAGMENT_CHARS (default 4000, 0 disables)
+        is cut at chapter boundaries, the fragments are parsed concurrently and their chapters
+        stitched and validated (toc_extractor.stitch_toc_fragments). Any failed fragment sends
+        the whole text through a single request instead.
+        """
+        fragment_chars = int(os.getenv("TOC_FRAGMENT_CHARS", "4000"))
+        fragments = split_toc_text(toc_string, fragment_chars) if 0 < fragment_chars < len(toc_string) else []
+        if len(fragments) <= 1:
+            return self._generate_toc_json(toc_string)
+
+        max_workers = max_workers or int(os.getenv("TOC_MAX_WORKERS", "4"))
+        logger.info(f"Parsing table of content in {len(fragments)} fragments (max_workers={max_workers})")
+
+        def parse_fragment(numbered: Tuple[int, str]) -> Optional[Dict[str, Any]]:
+            index, fragment = numbered
+            hint = f"(Part {index + 1} of {len(fragments)} of the table of contents; keep the chapter numbers as printed.)\n"
+            try:
+                return self._generate_toc_json(hint + fragment)
+            except Exception as e:
+                logger.warning(f"Table of content fragment {index + 1}/{len(fragments)} failed: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="toc-fragment") as executor:
+            tocs = list(executor.map(parse_fragment, enumerate(fragments)))
+
+        try:
+            return stitch_toc_fragments(tocs)
+        except Exception as e:
+            logger.warning(f"Could not stitch table of content fragments, parsing it in one request: {str(e)}")
+            return self._generate_toc_json(toc_string)
+
+    def _extract_toc_locally(self, toc_string: str, content_list_path: Optional[PathLike]) -> Optional[Dict[str, Any]]:
+        """Most confident local ToC from the content_list and from toc_string, or None"""
+        if content_list_path is None and self.chunker_path:
+            # MinerU writes {name}_content_list.json next to the markdown the chunker reads
+            found = sorted(Path(self.chunker_path).parent.glob("*_content_list.json"))
+            content_list_path = found[0] if found else None
+
+        candidates = []
+        if content_list_path and Path(content_list_path).exists():
+            candidates.append(extract_toc(load_content_list(content_list_path)))
+        if toc_string.strip():
+            candidates.append(extract_toc_from_text(toc_string))
+        candidates = [toc for toc in candidates if toc]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda toc: toc["extraction"]["confidence"])
     
     # 从 chunks 中提取关键信息和主题
     def extract_key_topics(self, section_header: str, section_content: str) -> Dict[str, Any]:
@@ -108,6 +221,8 @@ class TextbookAnalyzer:
             )
             
             # Generate JSON analysis from LLM
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
             analysis = self.llm_client.generate_json(
                 prompt=prompt,
                 system_prompt="You are a subject matter expert. Analyze educational content and return ONLY valid JSON without any markdown formatting."
@@ -117,75 +232,221 @@ class TextbookAnalyzer:
             return analysis
         except Exception as e:
             logger.error(f"Failed to extract key topics for section '{section_header}': {str(e)}")
-            return {f"ERROR GENERATING CONTENT FOR '{section_header}': {str(e)}"}
+            return {"error": f"ERROR GENERATING CONTENT FOR '{section_header}': {str(e)}"}
+
+
+    def extract_key_topics_batch(self, sections: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """
+        Extract key topics for several small sections in a single LLM request.
+        
+        Args:
+            sections: List of (key, section_header, section_content) tuples; keys must be unique
+            
+        Returns:
+            List of analyses aligned with `sections`. Sections missing from (or malformed in) the
+            batched response, or all of them if the response cannot be parsed, fall back to
+            individual extract_key_topics calls
+        """
+        items = "".join(
+            ANALYZE_SECTIONS_BATCH_ITEM_TEMPLATE.format(key=key, header=header, content=content)
+            for key, header, content in sections
+        )
+        prompt = ANALYZE_SECTIONS_BATCH_PROMPT.replace("[PASTE_SECTIONS_HERE]", items)
 
+        try:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            batch = self.llm_client.generate_json(
+                prompt=prompt,
+                system_prompt="You are a subject matter expert. Analyze educational content and return ONLY valid JSON without any markdown formatting."
+            )
+            if not isinstance(batch, dict):
+                raise ValueError(f"Expected a JSON object keyed by section, got {type(batch).__name__}")
+        except Exception as e:
+            logger.warning(f"Batched analysis of {len(sections)} sections failed, falling back to single calls: {str(e)}")
+            batch = {}
+
+        analyses = []
+        for key, header, content in sections:
+            analysis = batch.get(key)
+            if isinstance(analysis, dict) and analysis:
+                logger.info(f"Successfully generated batched analysis for section: {header}")
+                analyses.append(analysis)
+            else:
+                analyses.append(self.extract_key_topics(header, content))
+        return analyses
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Rough token estimate (~4 characters per token) used for batch packing"""
+        return len(text) // 4 + 1
+
+    def _group_targets(
+        self,
+        targets: List[Tuple[str, Dict[str, Any], str, str]],
+        batch_token_budget: int,
+        contents: TextbookContent,
+    ) -> List[List[Tuple[str, Dict[str, Any], str, str]]]:
+        """
+        Pack consecutive sibling targets (same parent node) into groups whose estimated content
+        size stays within batch_token_budget. Nodes larger than half the budget are sent alone.
+        A budget <= 0 disables batching (one target per group).
+        """
+        if batch_token_budget <= 0:
+            return [[target] for target in targets]
+
+        groups = []
+        current: List[Tuple[str, Dict[str, Any], str, str]] = []
+        current_tokens = 0
+        current_parent = None
+        for target in targets:
+            node_id, node, title, _ = target
+            parent = node_id.rsplit('.', 1)[0]
+            tokens = self._estimate_tokens(title) + self._estimate_tokens(contents.get(node))
+
+            if tokens > batch_token_budget // 2:
+                if current:
+                    groups.append(current)
+                groups.append([target])
+                current, current_tokens, current_parent = [], 0, None
+                continue
+
+            if current and (parent != current_parent or current_tokens + tokens > batch_token_budget):
+                groups.append(current)
+                current, current_tokens = [], 0
+
+            current.append(target)
+            current_tokens += tokens
+            current_parent = parent
+
+        if current:
+            groups.append(current)
+        return groups
+
+    def _analyze_group(self, group: List[Tuple[str, Dict[str, Any], str, str]], contents: TextbookContent) -> List[Dict[str, Any]]:
+        if len(group) == 1:
+            _, node, title, _ = group[0]
+            return [self.extract_key_topics(title, contents.get(node))]
+        return self.extract_key_topics_batch([(node_id, title, contents.get(node)) for node_id, node, title, _ in group])
+
+    @staticmethod
+    def _iter_analysis_nodes(textbook_data: Dict[str, Any]):
+        """
+        Walk chapters -> sections -> sub_sections in document order.
+        
+        Yields:
+            (node_id, node, title, label) tuples. node_id is the node's position in the tree
+            (e.g. "2.5" or "2.5.1"), which stays stable for a given document
+        """
+        for c, chapter in enumerate(textbook_data.get('chapters', [])):
+            for s, section in enumerate(chapter.get('sections', [])):
+                yield f"{c}.{s}", section, section.get('section_title', 'Unknown Section'), section.get('section_id')
+                for ss, subsection in enumerate(section.get('sub_sections', [])):
+                    yield f"{c}.{s}.{ss}", subsection, subsection.get('sub_section_title', 'Unknown Subsection'), subsection.get('sub_section_id')
+
+    def _collect_analysis_targets(self, textbook_data: Dict[str, Any], contents: TextbookContent) -> List[Tuple[str, Dict[str, Any], str, str]]:
+        """Collect nodes that have content but no analysis yet, as (node_id, node, title, label) tuples"""
+        targets = []
+        for node_id, node, title, section_id in self._iter_analysis_nodes(textbook_data):
+            analysis = node.get('key_topics_analysis')
+            if analysis and not (isinstance(analysis, dict) and analysis.get('error')):
+                logger.info(f"Skipping (already analyzed): {section_id} {title}")
+            elif contents.has_content(node):
+                targets.append((node_id, node, title, f"{section_id} {title}"))
+            else:
+                logger.warning(f"No content for: {section_id} {title}")
+        return targets
 
     def generate_chapter_analysis(
         self, 
         path_to_toc_with_content: str,
+        max_workers: Optional[int] = None,
+        batch_token_budget: Optional[int] = None,
+        progress: Optional[Callable[[float], None]] = None,
     ) -> Dict[str, Any]:
         """
         Generate key point summaries for all sections and subsections in a textbook content JSON file.
         For each section and subsection with content, calls extract_key_topics to analyze content 
         and stores results back to the JSON.
         
+        Progress is appended to a checkpoint journal next to the JSON file after every node; the
+        journal is compacted into the document when the run completes, or when an interrupted run
+        is resumed.
+        
         Args:
             path_to_toc_with_content: Path to the textbook_with_content JSON file
+            max_workers: Maximum number of LLM calls in flight. 1 analyzes nodes sequentially;
+                defaults to the ANALYSIS_MAX_WORKERS environment variable (or 1)
+            batch_token_budget: Estimated token budget for packing several small sibling nodes into
+                one request (see extract_key_topics_batch). 0 sends one request per node; defaults
+                to the ANALYSIS_BATCH_TOKENS environment variable (or 0)
+            progress: Called with the fraction (0-1) of requests finished after each one completes
             
         Returns:
             Updated textbook structure with analysis added to each section and subsection
         """
+        journal = None
         try:
             path = Path(path_to_toc_with_content)
+            max_workers = max_workers or int(os.getenv("ANALYSIS_MAX_WORKERS", "1"))
+            if batch_token_budget is None:
+                batch_token_budget = int(os.getenv("ANALYSIS_BATCH_TOKENS", "0"))
             
             # Load the JSON file
             with open(path, 'r', encoding='utf-8') as f:
                 textbook_data = json.load(f)
             
             logger.info(f"Loaded textbook data from {path}")
-            
-            # Process each chapter
-            for chapter in textbook_data.get('chapters', []):
-                chapter_title = chapter.get('chapter_title', 'Unknown Chapter')
-                logger.info(f"Processing chapter: {chapter_title}")
-                
-                # Process each section in the chapter
-                for section in chapter.get('sections', []):
-                    section_title = section.get('section_title', 'Unknown Section')
-                    section_id = section.get('section_id')
-                    section_content = section.get('content', '')
-                    
-                    # Skip if already analyzed
-                    if section.get('key_topics_analysis'):
-                        logger.info(f"Skipping section (already analyzed): {section_id} {section_title}")
-                    # Analyze section content if it exists
-                    elif section_content:
-                        logger.info(f"Analyzing section: {section_id} {section_title}")
-                        analysis = self.extract_key_topics(section_title, section_content)
-                        section['key_topics_analysis'] = analysis
-                    else:
-                        logger.warning(f"No content for section: {section_id} {section_title}")
-                    
-                    # Process subsections within the section
-                    for subsection in section.get('sub_sections', []):
-                        sub_title = subsection.get('sub_section_title', 'Unknown Subsection')
-                        sub_section_id = section.get('sub_section_id')
-                        sub_content = subsection.get('content', '')
-                        
-                        # Skip if already analyzed
-                        if subsection.get('key_topics_analysis'):
-                            logger.info(f"Skipping subsection (already analyzed): {sub_title}")
-                        # Analyze subsection content if it exists
-                        elif sub_content:
-                            logger.info(f"Analyzing subsection: {sub_section_id} {sub_title}")
-                            sub_analysis = self.extract_key_topics(sub_title, sub_content)
-                            subsection['key_topics_analysis'] = sub_analysis
-                        else:
-                            logger.warning(f"No content for subsection: {sub_section_id} {sub_title}")
-            
-                    # Save the updated data back to the file once after all processing
-                    with open(path, 'w', encoding='utf-8') as f:
-                        json.dump(textbook_data, f, ensure_ascii=False, indent=4)
+
+            def save():
+                tmp_path = path.with_suffix(path.suffix + ".tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(textbook_data, f, ensure_ascii=False, indent=4)
+                os.replace(tmp_path, path)
+
+            # Resume: fold the journal of an interrupted run back into the document
+            journal = CheckpointJournal(path)
+            if journal.exists():
+                nodes_by_id = {node_id: node for node_id, node, _, _ in self._iter_analysis_nodes(textbook_data)}
+                applied = journal.compact_into(nodes_by_id, 'key_topics_analysis')
+                save()
+                journal.remove()
+                logger.info(f"Resumed {applied} analyses from checkpoint journal {journal.path}")
+
+            # Node text is read from the chunk file referenced by the document, only when a group is analyzed
+            contents = TextbookContent(textbook_data, path)
+            targets = self._collect_analysis_targets(textbook_data, contents)
+            groups = self._group_targets(targets, batch_token_budget, contents)
+            logger.info(f"{len(targets)} sections/subsections to analyze in {len(groups)} requests (max_workers={max_workers})")
+
+            if max_workers <= 1:
+                completed = ((group, self._analyze_group(group, contents)) for group in groups)
+                executor = None
+            else:
+                # Submit everything up front; the pool bounds the number of in-flight requests and
+                # the provider rate limiter bounds their rate
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="section-analysis")
+                futures = {executor.submit(self._analyze_group, group, contents): group for group in groups}
+                completed = ((futures[future], future.result()) for future in as_completed(futures))
+
+            try:
+                # Journal each result as soon as its request finishes, so a crash only loses requests
+                # still in flight. Appends stay on this thread (CheckpointJournal is single-writer);
+                # the document itself is written once at the end
+                for done, (group, analyses) in enumerate(completed, start=1):
+                    for (node_id, node, _, label), analysis in zip(group, analyses):
+                        logger.info(f"Analyzed: {label}")
+                        node['key_topics_analysis'] = analysis
+                        journal.append(node_id, analysis)
+                    if progress:
+                        progress(done / len(groups))
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+            if targets:
+                save()
+            journal.remove()
                 
             logger.info(f"Successfully saved updated textbook data to {path}")
             return textbook_data
@@ -193,6 +454,54 @@ class TextbookAnalyzer:
         except Exception as e:
             logger.error(f"Failed to generate chapter analysis: {str(e)}")
             return {}
+        finally:
+            if journal is not None:
+                journal.close()
+
+    @staticmethod
+    def find_toc_node(textbook_data: Dict[str, Any], node_id: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """
+        Find a TOC node by chapter_number, section_id or sub_section_id.
+        
+        Returns:
+            (node, title) tuple, or None if no node matches
+        """
+        node_id = str(node_id).strip()
+        for chapter in textbook_data.get('chapters', []):
+            if str(chapter.get('chapter_number')) == node_id:
+                return chapter, chapter.get('chapter_title', '')
+            for section in chapter.get('sections', []):
+                if str(section.get('section_id')) == node_id:
+                    return section, section.get('section_title', '')
+                for subsection in section.get('sub_sections', []):
+                    if str(subsection.get('sub_section_id')) == node_id:
+                        return subsection, subsection.get('sub_section_title', '')
+        return None
+
+    async def astream_explanation(
+        self,
+        title: str,
+        content: str,
+        difficulty: str = "intermediate",
+        max_content_chars: int = 12000,
+    ) -> AsyncIterator[str]:
+        """
+        Stream an explanation of a TOC node as text deltas, so the first tokens reach the learner
+        without waiting for the whole answer.
+        
+        Args:
+            title: Title of the section being explained
+            content: Section content used as grounding material (truncated to max_content_chars)
+            difficulty: Target learner level, appended to EXPLANATION_SYSTEM_PROMPT
+        """
+        knowledge_point = f"{title}\n\n{content[:max_content_chars]}" if content else title
+        system_prompt = f"{EXPLANATION_SYSTEM_PROMPT}5. 讲解难度：{difficulty}\n"
+        prompt = EXPLANATION_USER_PROMPT_TEMPLATE.format(knowledge_point=knowledge_point)
+
+        if self.rate_limiter:
+            await asyncio.to_thread(self.rate_limiter.acquire)
+        async for delta in self.llm_client.astream_text(prompt, system_prompt=system_prompt):
+            yield delta
 
 
 
@@ -0,0 +1,74 @@
+"""
+Checkpoint Journal - append-only progress log for long-running textbook analysis
+Each completed node is appended as one JSONL record, so progress is durable at O(1) cost per node
+instead of re-serializing the whole textbook document after every section.
+"""
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+
+class CheckpointJournal:
+    """
+    JSONL journal of {"node_id": ..., "analysis": ...} records stored next to the document it belongs to
+    (textbook_with_content.json -> textbook_with_content.journal.jsonl).
+    Not thread-safe: append from a single thread.
+    """
+
+    def __init__(self, document_path: PathLike):
+        document_path = Path(document_path)
+        self.path = document_path.with_name(f"{document_path.stem}.journal.jsonl")
+        self._file = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def append(self, node_id: str, analysis: Any):
+        """Append one record and flush it to disk"""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({"node_id": node_id, "analysis": analysis}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def replay(self) -> Iterator[Tuple[str, Any]]:
+        """Yield (node_id, analysis) records; a torn last line from a crash is skipped"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    yield record["node_id"], record["analysis"]
+                except (json.JSONDecodeError, KeyError):
+                    logger.warning(f"Ignoring corrupt journal record at {self.path}:{line_no}")
+
+    def compact_into(self, nodes_by_id: Dict[str, Dict[str, Any]], field: str) -> int:
+        """Apply journal records to their nodes. Returns the number of records applied"""
+        applied = 0
+        for node_id, analysis in self.replay():
+            node = nodes_by_id.get(node_id)
+            if node is not None:
+                node[field] = analysis
+                applied += 1
+        return applied
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Close and delete the journal once its records are part of the document"""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
@@ -0,0 +1,356 @@
+"""
+LLM Cache 模块 - 基于内容哈希的 LLM 响应持久化缓存
+相同的 (provider, model, system_prompt, prompt, temperature, schema) 请求直接返回缓存结果，
+重复运行和断点续跑几乎零耗时、零费用。需要显式开启（LLM_CACHE=1）
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Union, Iterator, AsyncIterator
+from dotenv import load_dotenv
+
+from .llm_client import LLMClient
+
+load_dotenv()
+
+PathLike = Union[str, Path]
+
+
+class LLMResponseCache:
+    """
+    SQLite 存储的 LLM 响应缓存
+    - 键：请求参数的 SHA-256 哈希
+    - 超过 max_bytes 时按最近访问时间（LRU）淘汰；总大小在写事务内从数据库统计，
+      多个进程共用同一个缓存文件时也不会超限
+    - 记录命中/未命中次数
+    """
+
+    def __init__(self, db_path: PathLike, max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        # 覆盖索引：统计总大小时不必读取 value
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_size ON responses(size)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(**fields) -> str:
+        """对请求参数做规范化 JSON 序列化后取 SHA-256"""
+        payload = json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE 事务先拿到写锁，其他进程的写入不会插在统计和淘汰之间
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, data, size, now, now),
+                )
+                self._evict()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        """淘汰最久未访问的条目，直到总大小回到上限以内（在 put 的写事务内调用）"""
+        total = self._total_bytes()
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size_bytes = self._total_bytes()
+        lookups = self.hits + self.misses
+        return {
+            "db_path": str(self.db_path),
+            "entries": entries,
+            "size_bytes": size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class CachedLLMClient(LLMClient):
+    """
+    包装任意 LLMClient，在调用提供商之前先查询 LLMResponseCache
+    只缓存成功的响应；异常和 JSON 解析失败不会写入缓存
+    JSON 请求（固定的 json_temperature）总是缓存；文本和流式请求只在 temperature 为 0 时缓存，
+    采样生成的讲解每次调用都重新生成（“重新生成”不会返回相同的文本）
+    """
+
+    def __init__(self, client: LLMClient, cache: LLMResponseCache):
+        super().__init__(client.api_key, client.model_name, client.temperature)
+        self.client = client
+        self.cache = cache
+        self.provider = client.provider
+        self.json_temperature = client.json_temperature
+
+    def _key(self, kind: str, **fields) -> str:
+        return self.cache.make_key(
+            kind=kind,
+            provider=self.provider.value,
+            model=self.model_name,
+            **fields,
+        )
+
+    def generate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> str:
+        """带缓存的文本生成（temperature 为 0 时）"""
+        if temperature:
+            return self.client.generate_text(prompt, max_tokens, system_prompt, temperature)
+        key = self._key(
+            "text",
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        text = self.client.generate_text(prompt, max_tokens, system_prompt, temperature)
+        if text is not None:
+            self.cache.put(key, text)
+        return text
+
+    def generate_json(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """带缓存的 JSON 生成"""
+        key = self._key(
+            "json",
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=self.json_temperature,
+            schema=schema,
+            max_tokens=max_tokens,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = self.client.generate_json(prompt, schema, max_tokens, system_prompt)
+        self.cache.put(key, result)
+        return result
+
+    async def agenerate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> str:
+        """带缓存的异步文本生成（temperature 为 0 时）"""
+        if temperature:
+            return await self.client.agenerate_text(prompt, max_tokens, system_prompt, temperature)
+        key = self._key(
+            "text",
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        text = await self.client.agenerate_text(prompt, max_tokens, system_prompt, temperature)
+        if text is not None:
+            self.cache.put(key, text)
+        return text
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """带缓存的异步 JSON 生成"""
+        key = self._key(
+            "json",
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=self.json_temperature,
+            schema=schema,
+            max_tokens=max_tokens,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = await self.client.agenerate_json(prompt, schema, max_tokens, system_prompt)
+        self.cache.put(key, result)
+        return result
+
+    def stream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        """带缓存的流式生成（temperature 为 0 时）：命中时一次性产出，未命中时边转发边累积，完整结束后写入缓存"""
+        if temperature:
+            yield from self.client.stream_text(prompt, max_tokens, system_prompt, temperature)
+            return
+        key = self._key(
+            "text",
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        for delta in self.client.stream_text(prompt, max_tokens, system_prompt, temperature):
+            parts.append(delta)
+            yield delta
+        self.cache.put(key, "".join(parts))
+
+    async def astream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        """带缓存的异步流式生成（temperature 为 0 时）"""
+        if temperature:
+            async for delta in self.client.astream_text(prompt, max_tokens, system_prompt, temperature):
+                yield delta
+            return
+        key = self._key(
+            "text",
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for delta in self.client.astream_text(prompt, max_tokens, system_prompt, temperature):
+            parts.append(delta)
+            yield delta
+        self.cache.put(key, "".join(parts))
+
+
+_caches: Dict[str, LLMResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(db_path: Optional[PathLike] = None) -> Optional[LLMResponseCache]:
+    """
+    获取进程级共享的 LLMResponseCache
+    需要 LLM_CACHE=1 显式开启，否则返回 None
+    路径默认取 LLM_CACHE_PATH，其次 DATA_DIR/llm_cache.sqlite3；两者都未配置时返回 None
+    大小上限由 LLM_CACHE_MAX_MB 控制（默认 512）
+    """
+    if os.getenv("LLM_CACHE", "0") != "1":
+        return None
+
+    if db_path is None:
+        db_path = os.getenv("LLM_CACHE_PATH")
+        if not db_path:
+            data_dir = os.getenv("DATA_DIR")
+            if not data_dir:
+                return None
+            db_path = os.path.join(data_dir, "llm_cache.sqlite3")
+
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024)
+            cache = LLMResponseCache(key, max_bytes=max_bytes)
+            _caches[key] = cache
+        return cache
+
+
+def with_cache(client: LLMClient, db_path: Optional[PathLike] = None) -> LLMClient:
+    """如果缓存可用则包装客户端，否则原样返回"""
+    if isinstance(client, CachedLLMClient):
+        return client
+    cache = get_llm_cache(db_path)
+    return CachedLLMClient(client, cache) if cache else client
@@ -4,13 +4,17 @@ LLM Client 模块 - 封装 GPT、Deepseek、Gemini 的统一接口
 """
 
 import os
+import time
+import asyncio
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, AsyncIterator
 from enum import Enum
 from dotenv import load_dotenv
 import json
+import httpx
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import google.generativeai as genai
 
 load_dotenv()
@@ -23,9 +27,157 @@ class ModelProvider(Enum):
     GOOGLE = "google"  # Gemini
 
 
+class RateLimiter:
+    """
+    令牌桶限流器（线程安全）
+    requests_per_minute <= 0 表示不限流
+    """
+
+    def __init__(self, requests_per_minute: float = 0):
+        self.requests_per_minute = requests_per_minute
+        self.capacity = max(1.0, requests_per_minute / 60.0) if requests_per_minute > 0 else 0
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到获得一个请求令牌"""
+        if self.requests_per_minute <= 0:
+            return
+
+        rate = self.requests_per_minute / 60.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / rate
+            time.sleep(wait)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: "ModelProvider") -> RateLimiter:
+    """
+    获取某个提供商的进程级共享限流器
+    每分钟请求数从环境变量 {PROVIDER}_RPM 读取（如 OPENAI_RPM、DEEPSEEK_RPM、GOOGLE_RPM），未配置则不限流
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider.value)
+        if limiter is None:
+            rpm = float(os.getenv(f"{provider.value.upper()}_RPM", "0") or 0)
+            limiter = RateLimiter(rpm)
+            _rate_limiters[provider.value] = limiter
+        return limiter
+
+
+# 进程级共享的 SDK 客户端：每个 (提供商, api_key, base_url) 只创建一次，
+# 所有 LLMClient 实例复用同一个 keep-alive 连接池
+_sdk_clients: Dict[tuple, Any] = {}
+_sdk_clients_lock = threading.Lock()
+
+
+def _connection_limits() -> httpx.Limits:
+    max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    """获取共享的同步 OpenAI 兼容客户端（OpenAI / Deepseek）"""
+    key = ("openai", api_key, base_url)
+    with _sdk_clients_lock:
+        client = _sdk_clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=httpx.Client(limits=_connection_limits(), timeout=httpx.Timeout(600.0, connect=10.0)),
+            )
+            _sdk_clients[key] = client
+        return client
+
+
+def get_async_openai_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """
+    获取共享的异步 OpenAI 兼容客户端（OpenAI / Deepseek）
+    连接池绑定在首次使用它的事件循环上，应在服务的主事件循环中使用
+    """
+    key = ("openai-async", api_key, base_url)
+    with _sdk_clients_lock:
+        client = _sdk_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=httpx.AsyncClient(limits=_connection_limits(), timeout=httpx.Timeout(600.0, connect=10.0)),
+            )
+            _sdk_clients[key] = client
+        return client
+
+
+def get_gemini_client(api_key: str):
+    """获取共享的 Gemini 客户端（同步接口与 .aio 异步接口共用）"""
+    key = ("gemini", api_key, None)
+    with _sdk_clients_lock:
+        client = _sdk_clients.get(key)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            _sdk_clients[key] = client
+        return client
+
+
+async def close_shared_clients():
+    """关闭所有共享的异步连接池（服务关闭时调用）"""
+    with _sdk_clients_lock:
+        clients = [(key, client) for key, client in _sdk_clients.items() if key[0] == "openai-async"]
+        for key, _ in clients:
+            _sdk_clients.pop(key, None)
+    for _, client in clients:
+        await client.close()
+
+
+def _build_messages(prompt: str, system_prompt: Optional[str]) -> List[Dict[str, str]]:
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def _json_prompt(prompt: str, schema: Optional[Dict[str, Any]]) -> str:
+    if schema:
+        json_schema_prompt = f"\n\n返回符合以下 JSON Schema 的数据：\n{json.dumps(schema, ensure_ascii=False, indent=2)}"
+    else:
+        json_schema_prompt = "\n\n请返回有效的 JSON 格式。"
+    return prompt + json_schema_prompt
+
+
+def _parse_json_response(text_response: str) -> Dict[str, Any]:
+    try:
+        # 尝试从响应中提取 JSON
+        json_str = text_response
+        if "```json" in text_response:
+            json_str = text_response.split("```json")[1].split("```")[0]
+        elif "```" in text_response:
+            json_str = text_response.split("```")[1].split("```")[0]
+
+        return json.loads(json_str.strip())
+    except json.JSONDecodeError:
+        raise ValueError(f"Failed to parse JSON response: {text_response}")
+
+
 class LLMClient(ABC):
     """LLM 客户端抽象基类"""
 
+    provider: ModelProvider
+    # generate_json 使用的温度（结构化输出需要稳定），也是响应缓存键的一部分
+    json_temperature: float = 0.3
+
     def __init__(self, api_key: str, model_name: str, temperature: float = 0.7):
         self.api_key = api_key
         self.model_name = model_name
@@ -53,10 +205,53 @@ class LLMClient(ABC):
         """生成符合 JSON Schema 的结构化数据"""
         pass
 
+    async def agenerate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> str:
+        """异步生成文本（默认在线程池中执行同步实现，子类可用原生异步 SDK 覆盖）"""
+        return await asyncio.to_thread(self.generate_text, prompt, max_tokens, system_prompt, temperature)
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """异步生成结构化数据（默认在线程池中执行同步实现，子类可用原生异步 SDK 覆盖）"""
+        return await asyncio.to_thread(self.generate_json, prompt, schema, max_tokens, system_prompt)
+
+    def stream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        """流式生成文本，逐个产出增量片段（默认一次性产出完整结果，子类可覆盖为真正的流式）"""
+        yield self.generate_text(prompt, max_tokens, system_prompt, temperature)
+
+    async def astream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        """异步流式生成文本，逐个产出增量片段（默认一次性产出完整结果，子类可覆盖为真正的流式）"""
+        yield await self.agenerate_text(prompt, max_tokens, system_prompt, temperature)
+
 
 class OpenAIClient(LLMClient):
     """OpenAI GPT 客户端"""
 
+    provider = ModelProvider.OPENAI
+    base_url: Optional[str] = None
+
     def __init__(
         self,
         api_key: Optional[str] = None,
@@ -68,7 +263,12 @@ class OpenAIClient(LLMClient):
             raise ValueError("OpenAI API key not found")
         super().__init__(api_key, model_name, temperature)
 
-        self.client = openai.OpenAI(api_key=self.api_key)
+        # 同步与异步客户端均为进程级共享，多个实例复用同一个连接池
+        self.client = get_openai_client(self.api_key, self.base_url)
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return get_async_openai_client(self.api_key, self.base_url)
 
     def generate_text(
         self,
@@ -78,14 +278,9 @@ class OpenAIClient(LLMClient):
         temperature: float = 0.7,
     ) -> str:
         """调用 OpenAI API 生成文本"""
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
-
         response = self.client.chat.completions.create(
             model=self.model_name,
-            messages=messages,
+            messages=_build_messages(prompt, system_prompt),
             temperature=temperature,
             max_tokens=max_tokens,
         )
@@ -99,104 +294,102 @@ class OpenAIClient(LLMClient):
         system_prompt: Optional[str] = None,
     ) -> Dict[str, Any]:
         """生成 JSON 格式的结构化数据"""
-        if schema:
-            json_schema_prompt = f"\n\n返回符合以下 JSON Schema 的数据：\n{json.dumps(schema, ensure_ascii=False, indent=2)}"
-        else:
-            json_schema_prompt = "\n\n请返回有效的 JSON 格式。"
-
-        full_prompt = prompt + json_schema_prompt
-
         text_response = self.generate_text(
-            full_prompt, max_tokens, system_prompt, temperature=0.3
+            _json_prompt(prompt, schema), max_tokens, system_prompt, temperature=self.json_temperature
         )
+        return _parse_json_response(text_response)
 
-        try:
-            # 尝试从响应中提取 JSON
-            json_str = text_response
-            if "```json" in text_response:
-                json_str = text_response.split("```json")[1].split("```")[0]
-            elif "```" in text_response:
-                json_str = text_response.split("```")[1].split("```")[0]
-
-            return json.loads(json_str.strip())
-        except json.JSONDecodeError:
-            raise ValueError(f"Failed to parse JSON response: {text_response}")
-
-
-class DeepseekClient(LLMClient):
-    """Deepseek 客户端"""
-
-    def __init__(
-        self,
-        api_key: Optional[str] = None,
-        model_name: str = "deepseek-chat",
-        temperature: float = 0.7,
-    ):
-        api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
-        if not api_key:
-            raise ValueError("Deepseek API key not found")
-        super().__init__(api_key, model_name, temperature)
-            
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.deepseek.com",
-        )
-
-    def generate_text(
+    async def agenerate_text(
         self,
         prompt: str,
         max_tokens: Optional[int] = None,
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
     ) -> str:
-        """调用 Deepseek API 生成文本"""
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
-
-        response = self.client.chat.completions.create(
+        """使用异步 SDK 生成文本"""
+        response = await self.async_client.chat.completions.create(
             model=self.model_name,
-            messages=messages,
+            messages=_build_messages(prompt, system_prompt),
             temperature=temperature,
             max_tokens=max_tokens,
         )
         return response.choices[0].message.content
 
-    def generate_json(
+    async def agenerate_json(
         self,
         prompt: str,
         schema: Optional[Dict[str, Any]] = None,
         max_tokens: Optional[int] = None,
         system_prompt: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """生成 JSON 格式的结构化数据"""
-        if schema:
-            json_schema_prompt = f"\n\n返回符合以下 JSON Schema 的数据：\n{json.dumps(schema, ensure_ascii=False, indent=2)}"
-        else:
-            json_schema_prompt = "\n\n请返回有效的 JSON 格式。"
+        """使用异步 SDK 生成 JSON 格式的结构化数据"""
+        text_response = await self.agenerate_text(
+            _json_prompt(prompt, schema), max_tokens, system_prompt, temperature=self.json_temperature
+        )
+        return _parse_json_response(text_response)
 
-        full_prompt = prompt + json_schema_prompt
+    def stream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        """调用 OpenAI API 流式生成文本"""
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=_build_messages(prompt, system_prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
-        text_response = self.generate_text(
-            full_prompt, max_tokens, system_prompt, temperature=0.3
+    async def astream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        """使用异步 SDK 流式生成文本"""
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=_build_messages(prompt, system_prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
         )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
-        try:
-            json_str = text_response
-            if "```json" in text_response:
-                json_str = text_response.split("```json")[1].split("```")[0]
-            elif "```" in text_response:
-                json_str = text_response.split("```")[1].split("```")[0]
 
-            return json.loads(json_str.strip())
-        except json.JSONDecodeError:
-            raise ValueError(f"Failed to parse JSON response: {text_response}")
+class DeepseekClient(OpenAIClient):
+    """Deepseek 客户端（OpenAI 兼容接口）"""
+
+    provider = ModelProvider.DEEPSEEK
+    base_url = "https://api.deepseek.com"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model_name: str = "deepseek-chat",
+        temperature: float = 0.7,
+    ):
+        api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise ValueError("Deepseek API key not found")
+        super().__init__(api_key, model_name, temperature)
 
 
 class GeminiClient(LLMClient):
     """Google Gemini 客户端"""
 
+    provider = ModelProvider.GOOGLE
+
     def __init__(
         self,
         api_key: Optional[str] = None,
@@ -208,7 +401,35 @@ class GeminiClient(LLMClient):
             raise ValueError("Gemini API key not found")
         super().__init__(api_key, model_name, temperature)
 
-        self.client = genai.Client(api_key=self.api_key)
+        self.client = get_gemini_client(self.api_key)
+
+    @staticmethod
+    def _text_config(max_tokens: Optional[int], system_prompt: Optional[str], temperature: float) -> Dict[str, Any]:
+        config = {
+            "temperature": temperature,
+        }
+        if max_tokens:
+            config["max_output_tokens"] = max_tokens
+        return {"system_instruction": system_prompt, **config} if system_prompt else config
+
+    def _json_config(self, schema: Optional[Dict[str, Any]], system_prompt: Optional[str]) -> Dict[str, Any]:
+        config = {
+            "temperature": self.json_temperature,
+            "response_mime_type": "application/json",
+        }
+        if schema:
+            config["response_schema"] = schema
+        return {"system_instruction": system_prompt, **config} if system_prompt else config
+
+    @staticmethod
+    def _parse_fallback(text_response: str, error: Exception) -> Dict[str, Any]:
+        try:
+            json_str = text_response
+            if "```json" in text_response:
+                json_str = text_response.split("```json")[1].split("```")[0]
+            return json.loads(json_str.strip())
+        except:
+            raise ValueError(f"Failed to parse JSON for Gemini: {str(error)}")
 
     def generate_text(
         self,
@@ -218,20 +439,11 @@ class GeminiClient(LLMClient):
         temperature: float = 0.7,
     ) -> str:
         """调用 Gemini API 生成文本"""
-        config = {
-            "temperature": temperature,
-        }
-        if max_tokens:
-            config["max_output_tokens"] = max_tokens
-
         try:
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=prompt,
-                config={
-                    "system_instruction": system_prompt,
-                    **config
-                } if system_prompt else config
+                config=self._text_config(max_tokens, system_prompt, temperature)
             )
             return response.text
         except Exception as e:
@@ -245,33 +457,93 @@ class GeminiClient(LLMClient):
         system_prompt: Optional[str] = None,
     ) -> Dict[str, Any]:
         """生成 JSON 格式的结构化数据"""
-        config = {
-            "temperature": 0.3,
-            "response_mime_type": "application/json",
-        }
-        if schema:
-            config["response_schema"] = schema
-        
         try:
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=prompt,
-                config={
-                    "system_instruction": system_prompt,
-                    **config
-                } if system_prompt else config
+                config=self._json_config(schema, system_prompt)
             )
             return json.loads(response.text)
         except Exception as e:
             # Fallback to text parsing if structured generation fails
             text_response = self.generate_text(prompt, max_tokens, system_prompt)
-            try:
-                json_str = text_response
-                if "```json" in text_response:
-                    json_str = text_response.split("```json")[1].split("```")[0]
-                return json.loads(json_str.strip())
-            except:
-                raise ValueError(f"Failed to parse JSON for Gemini: {str(e)}")
+            return self._parse_fallback(text_response, e)
+
+    async def agenerate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> str:
+        """使用异步 SDK 生成文本"""
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=self._text_config(max_tokens, system_prompt, temperature)
+            )
+            return response.text
+        except Exception as e:
+            raise ValueError(f"Gemini generation failed: {str(e)}")
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """使用异步 SDK 生成 JSON 格式的结构化数据"""
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=self._json_config(schema, system_prompt)
+            )
+            return json.loads(response.text)
+        except Exception as e:
+            text_response = await self.agenerate_text(prompt, max_tokens, system_prompt)
+            return self._parse_fallback(text_response, e)
+
+    def stream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        """调用 Gemini API 流式生成文本"""
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model_name,
+                contents=prompt,
+                config=self._text_config(max_tokens, system_prompt, temperature)
+            ):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise ValueError(f"Gemini generation failed: {str(e)}")
+
+    async def astream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        """使用异步 SDK 流式生成文本"""
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=prompt,
+                config=self._text_config(max_tokens, system_prompt, temperature)
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise ValueError(f"Gemini generation failed: {str(e)}")
 
 
 class LLMFactory:
@@ -283,6 +555,7 @@ class LLMFactory:
         api_key: Optional[str] = None,
         model_name: Optional[str] = None,
         temperature: float = 0.7,
+        use_cache: bool = False,
     ) -> LLMClient:
         """
         创建对应的 LLM 客户端
@@ -292,10 +565,24 @@ class LLMFactory:
             api_key: API 密钥，不提供则从环境变量读取
             model_name: 模型名称，不提供则使用默认值
             temperature: 生成的随机性，0-2
+            use_cache: 是否用持久化响应缓存包装客户端（见 llm_cache.py）
 
         Returns:
             LLMClient 实例
         """
+        client = LLMFactory._create_uncached_client(provider, api_key, model_name, temperature)
+        if use_cache:
+            from .llm_cache import with_cache
+            client = with_cache(client)
+        return client
+
+    @staticmethod
+    def _create_uncached_client(
+        provider: ModelProvider,
+        api_key: Optional[str],
+        model_name: Optional[str],
+        temperature: float,
+    ) -> LLMClient:
         if provider == ModelProvider.OPENAI:
             return OpenAIClient(
                 api_key=api_key,
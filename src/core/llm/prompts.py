@@ -78,6 +78,45 @@ Break down the text above into the following four categories:
 """
 
 
+ANALYZE_SECTIONS_BATCH_PROMPT = f"""
+Act as a subject matter expert. Your task is to analyze each of the following educational sections independently and extract the essential information for a student's study guide.
+
+### Input Sections:
+[PASTE_SECTIONS_HERE]
+
+### Instructions:
+For EACH section, break down its text into the following four categories:
+1. **Key Concepts & Definitions:** Identify the primary terms, variables, or laws introduced.
+2. **Core Principles & Rules:** List the fundamental logic, formulas, or "laws of the land" (e.g., Syntax rules in CS, Theorems in Math, or Laws in Physics).
+3. **Common Pitfalls or Errors:** What are the typical mistakes, "illegal" operations, or common misconceptions mentioned?
+4. **Practical Examples:** Briefly summarize any specific problems, code snippets, or use cases provided to illustrate the concepts.
+
+### Output Requirements:
+- Use concise, high-density bullet points.
+- Maintain the technical rigor of the original text.
+- Omit all introductory or concluding conversational filler.
+- Do not mix content between sections.
+- Return ONE JSON object whose keys are exactly the section keys given above (e.g. "0.3.1").
+
+### JSON Template / Schema:
+{{
+  "<section key>": {{
+    "core_concepts": ["string"],
+    "fundamental_rules": ["string"],
+    "common_pitfalls": ["string"],
+    "examples": ["string"],
+    "one_sentence_summary": "string"
+  }}
+}}
+"""
+
+ANALYZE_SECTIONS_BATCH_ITEM_TEMPLATE = """
+--- Section key: {key} ---
+Section Header: {header}
+
+{content}
+"""
+
 # explanation prompts
 EXPLANATION_SYSTEM_PROMPT = (
     "你是一位经验丰富的教师。"  # 其余部分由难度参数拼接
@@ -0,0 +1,88 @@
+"""
+Textbook Content - lazy access to the text behind textbook_with_content.json nodes
+Nodes reference a contiguous range of the chunk file ("chunk_start" / "chunk_end") instead of
+carrying a copy of the text, so the document stays small and content is only materialized for the
+node being analyzed or explained.
+"""
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+
+class ChunkStore:
+    """Chunk file (JSON array or .jsonl), loaded on first access and shared between threads"""
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self._chunks: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def chunks(self) -> List[Dict[str, Any]]:
+        if self._chunks is None:
+            with self._lock:
+                if self._chunks is None:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        if self.path.suffix == '.jsonl':
+                            self._chunks = [json.loads(line) for line in f if line.strip()]
+                        else:
+                            self._chunks = json.load(f)
+        return self._chunks
+
+    def content(self, start: int, end: int) -> str:
+        return "\n\n".join(chunk.get("content", "") for chunk in self.chunks[start:end])
+
+
+class TextbookContent:
+    """
+    Resolves node content for one textbook_with_content document.
+    The chunk file is read from the document's "chunk_source" (relative to the document) on the
+    first call; documents written before chunk references existed keep their inline "content".
+    """
+
+    def __init__(self, textbook_data: Dict[str, Any], document_path: PathLike):
+        self.textbook_data = textbook_data
+        source = textbook_data.get("chunk_source")
+        self.store = ChunkStore(Path(document_path).parent / source) if source else None
+        self._checked = False
+
+    def get(self, node: Dict[str, Any]) -> str:
+        if "content" in node:
+            return node["content"] or ""
+        start = node.get("chunk_start")
+        if start is None or self.store is None:
+            return ""
+        if not self._checked:
+            self._check_source()
+        end = node.get("chunk_end")
+        return self.store.content(start, start + 1 if end is None else end)
+
+    def has_content(self, node: Dict[str, Any]) -> bool:
+        """Cheap check that does not load the chunk file"""
+        if "content" in node:
+            return bool(node["content"])
+        start, end = node.get("chunk_start"), node.get("chunk_end")
+        return start is not None and (end is None or end > start)
+
+    def _check_source(self):
+        # Ranges only line up with the chunk file they were computed from
+        self._checked = True
+        expected = self.textbook_data.get("chunk_count")
+        if expected is not None and expected != len(self.store.chunks):
+            logger.warning(
+                f"{self.store.path} has {len(self.store.chunks)} chunks but the ToC was aligned against {expected}; "
+                f"re-run map_chunks_to_toc to refresh the chunk ranges"
+            )
+
+
+def load_textbook_content(path: PathLike) -> TextbookContent:
+    """Load a textbook_with_content document together with its content accessor"""
+    with open(path, 'r', encoding='utf-8') as f:
+        textbook_data = json.load(f)
+    return TextbookContent(textbook_data, path)
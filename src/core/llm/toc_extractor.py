@@ -0,0 +1,539 @@
+"""
+TOC Extractor - deterministic table-of-contents builder for MinerU output
+Builds the ASK_TABLE_CONTENT_PROMPT schema (chapters -> sections -> sub_sections) without an LLM:
+- the printed contents pages of *_content_list.json: numbering ("2.1", "5.6.1", "A.1"), leader-dot
+  page references, heading flags (text_level) and indentation (bbox x0) give the hierarchy
+- otherwise the numbered body headings ("Chapter 3", "3.2 ..."), with printed page numbers
+  recovered from the page_number items
+- or plain contents text (the toc_string sent to the LLM), one entry per line
+Every result carries a confidence score; TextbookAnalyzer.parse_table_of_content only falls back to
+the LLM when it is too low. For that fallback, long contents text is cut at chapter boundaries
+(split_toc_text) so the fragments can be parsed concurrently and stitched back (stitch_toc_fragments).
+"""
+import re
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+_CONTENTS_KEYS = ("contents", "tableofcontents", "briefcontents", "contentsindetail", "目录")
+_ROMAN_RE = re.compile(r"^m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})$")
+# "... . . 42", "... 42", "... . xvii"
+_PAGE_RE = re.compile(r"(?:^|(?<=[\s.]))(\d{1,4}|[ivxlcdm]{1,7})$")
+_LEADER_RE = re.compile(r"(?:\s*\.){2,}\s*$|\s+\.\s*$")
+_NUMBERED_RE = re.compile(r"^(?:chapter\s+)?(\d+(?:\.\d+)*)[.:]?\s+(\S.*)$", re.IGNORECASE)
+_APPENDIX_SECTION_RE = re.compile(r"^([A-Z](?:\.\d+)+)\s+(\S.*)$")
+_APPENDIX_CHAPTER_RE = re.compile(r"^(?:appendix\s+)?([A-Z])[.:]?\s+(\S.*)$")
+_CHAPTER_MARKER_RE = re.compile(r"^(?:chapter\s+)?(\d{1,3})$", re.IGNORECASE)
+_SKIP_TITLES = {"index"}
+# Indentation (in content_list bbox units) that separates a sub-section from a section
+_INDENT_STEP = 30
+
+
+@dataclass
+class TocLine:
+    text: str
+    page_idx: Optional[int] = None
+    x0: Optional[float] = None
+    heading: bool = False
+    # Known printed page (body headings); the line text is then not searched for one
+    page: Optional[int] = None
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"[^0-9a-z一-鿿]", "", str(text).lower())
+
+
+def _split_page(text: str) -> Tuple[str, Optional[int], bool, bool]:
+    """Returns (title, arabic page, has roman page, has leader dots) for one contents line"""
+    text = " ".join(str(text).split())
+    page, roman = None, False
+    match = _PAGE_RE.search(text)
+    if match:
+        token, title = match.group(1), text[:match.start(1)]
+        if token.isdigit():
+            page = int(token)
+        elif _ROMAN_RE.match(token) and (not title.strip() or _LEADER_RE.search(title)):
+            # Roman numerals only count after leader dots or on their own, so "Mix" stays a word
+            roman = True
+        else:
+            title = text
+    else:
+        title = text
+    leader = bool(_LEADER_RE.search(title)) or ". ." in title
+    return re.sub(r"[\s.]+$", "", title).strip(), page, roman, leader
+
+
+class _TocBuilder:
+    """Single pass over contents lines that assembles chapters / sections / sub_sections"""
+
+    def __init__(self, numbered_only: bool = False):
+        self.numbered_only = numbered_only
+        self.chapters: List[Dict[str, Any]] = []
+        self.chapter: Optional[Dict[str, Any]] = None
+        self.section: Optional[Dict[str, Any]] = None
+        self.pending: Optional[Union[int, str]] = None
+        self.section_x0: Optional[float] = None
+        self.lines = 0
+        self.used = 0
+        self.explicit_pages = 0
+        self.entries = 0
+
+    def feed(self, line: TocLine):
+        raw = " ".join(line.text.split())
+        if not raw and not line.heading:
+            return
+        self.lines += 1
+
+        # A chapter number, "Appendix" or a lost glyph (empty / "text" heading) on its own line labels the next heading.
+        # A bare number must be set as a heading or continue the chapter sequence; otherwise it is a stray
+        # page number or list label
+        marker = _CHAPTER_MARKER_RE.match(raw)
+        if marker and not (line.heading or raw[0].isalpha() or self._continues_chapters(int(marker.group(1)))):
+            marker = None
+        if marker or raw.lower() in ("", "appendix", "text"):
+            self.pending = int(marker.group(1)) if marker else raw.lower()
+            self.used += 1
+            return
+
+        if line.page is not None:
+            title, page, roman, leader = raw, line.page, False, False
+        else:
+            title, page, roman, leader = _split_page(raw)
+        if roman or not title:
+            # Front-matter entries (xvii) and bare page numbers
+            self.used += roman
+            return
+        if title.lower() in _SKIP_TITLES:
+            self.used += 1
+            return
+
+        numbered = _NUMBERED_RE.match(title)
+        appendix_section = _APPENDIX_SECTION_RE.match(title)
+        appendix_chapter = _APPENDIX_CHAPTER_RE.match(title) if line.heading and not leader else None
+
+        if numbered and "." not in numbered.group(1):
+            self._add_chapter(int(numbered.group(1)), numbered.group(2), page, line)
+        elif numbered:
+            number = numbered.group(1)
+            if number.count(".") == 1:
+                self._add_section(number, numbered.group(2), page, line)
+            else:
+                self._add_sub_section(number, numbered.group(2), page)
+        elif appendix_section:
+            self._add_section(appendix_section.group(1), appendix_section.group(2), page, line)
+        elif self.pending is not None:
+            number = self.pending if isinstance(self.pending, int) else None
+            self._add_chapter(number, title, page, line)
+        elif appendix_chapter and self.chapters:
+            self._add_chapter(None, appendix_chapter.group(2), page, line)
+        elif line.heading and not leader and page is not None and not self.numbered_only:
+            # Chapter lines are set as headings with a bare page number; section headings keep their leader dots
+            self._add_chapter(None, title, page, line)
+        elif self.numbered_only or self.chapter is None:
+            # Unnumbered lines before the first chapter are front matter (Preface, Introduction, ...)
+            return
+        elif (
+            self.section is not None
+            and line.x0 is not None
+            and self.section_x0 is not None
+            and line.x0 > self.section_x0 + _INDENT_STEP
+        ):
+            self._add_sub_section(None, title, page)
+        else:
+            self._add_section(None, title, page, line)
+
+    def _continues_chapters(self, number: int) -> bool:
+        """Same tolerance as _chapter_boundary: the next chapter number, or up to two lost ones"""
+        expected = self.chapters[-1]["chapter_number"] + 1 if self.chapters else 0
+        return expected <= number <= expected + 2
+
+    def _count(self, page: Optional[int]):
+        self.used += 1
+        self.entries += 1
+        self.explicit_pages += page is not None
+
+    def _add_chapter(self, number: Optional[int], title: str, page: Optional[int], line: TocLine):
+        self._count(page)
+        if number is None:
+            number = (self.chapters[-1]["chapter_number"] + 1) if self.chapters else 1
+        self.chapter = {"chapter_number": number, "chapter_title": title, "start_page": page, "sections": []}
+        self.chapters.append(self.chapter)
+        self.section = None
+        self.section_x0 = None
+        self.pending = None
+
+    def _add_section(self, section_id: Optional[str], title: str, page: Optional[int], line: TocLine):
+        if self.chapter is None:
+            return
+        self._count(page)
+        sections = self.chapter["sections"]
+        if section_id is None:
+            section_id = f"{self.chapter['chapter_number']}.{len(sections) + 1}"
+        self.section = {"section_id": section_id, "section_title": title, "page": page, "sub_sections": []}
+        sections.append(self.section)
+        if self.section_x0 is None and line.x0 is not None:
+            self.section_x0 = line.x0
+
+    def _add_sub_section(self, sub_section_id: Optional[str], title: str, page: Optional[int]):
+        if self.section is None:
+            return
+        self._count(page)
+        sub_sections = self.section["sub_sections"]
+        if sub_section_id is None:
+            sub_section_id = f"{self.section['section_id']}.{len(sub_sections) + 1}"
+        sub_sections.append({"sub_section_id": sub_section_id, "sub_section_title": title, "page": page})
+
+    def result(self) -> List[Dict[str, Any]]:
+        """Chapters with missing pages filled from the neighbouring entries"""
+        for chapter in self.chapters:
+            # A chapter line without a page starts where its first section does
+            if chapter["start_page"] is None and chapter["sections"]:
+                chapter["start_page"] = chapter["sections"][0]["page"]
+        nodes = []
+        for chapter in self.chapters:
+            nodes.append((chapter, "start_page"))
+            for section in chapter["sections"]:
+                nodes.append((section, "page"))
+                for sub_section in section["sub_sections"]:
+                    nodes.append((sub_section, "page"))
+
+        # Forward fill, then back fill the leading gap
+        last = None
+        for node, key in nodes:
+            if node[key] is None:
+                node[key] = last
+            last = node[key]
+        following = None
+        for node, key in reversed(nodes):
+            if node[key] is None:
+                node[key] = following
+            following = node[key]
+        return self.chapters
+
+
+def _iter_nodes(chapters: List[Dict[str, Any]]):
+    for chapter in chapters:
+        yield chapter["chapter_title"], chapter["start_page"]
+        for section in chapter["sections"]:
+            yield section["section_title"], section["page"]
+            for sub_section in section["sub_sections"]:
+                yield sub_section["sub_section_title"], sub_section["page"]
+
+
+def _confidence(builder: _TocBuilder, chapters: List[Dict[str, Any]], heading_keys: Optional[set]) -> float:
+    """
+    0..1 from four signals: share of lines understood, share of entries with a printed page,
+    share of page references that never go backwards, and (when body headings are known)
+    share of entry titles that also appear as a heading in the book
+    """
+    if not chapters or builder.entries == 0:
+        return 0.0
+    parsed = builder.used / builder.lines if builder.lines else 0.0
+    with_page = builder.explicit_pages / builder.entries
+
+    nodes = list(_iter_nodes(chapters))
+    pages = [page for _, page in nodes if isinstance(page, int)]
+    steps = len(pages) - 1
+    monotonic = sum(1 for a, b in zip(pages, pages[1:]) if b >= a) / steps if steps > 0 else 1.0
+
+    if heading_keys:
+        found = sum(1 for title, _ in nodes if _compact(title) in heading_keys) / len(nodes)
+    else:
+        found = parsed
+    # A flat list of chapters is rarely the whole story
+    structured = sum(1 for chapter in chapters if chapter["sections"]) / len(chapters)
+    score = (0.2 * parsed + 0.25 * with_page + 0.25 * monotonic + 0.3 * found) * (0.5 + 0.5 * structured)
+    return round(score, 3)
+
+
+def _heading_keys(content_list: List[Dict[str, Any]]) -> set:
+    """Compact body heading texts, with and without their number ("2.1 Values" -> "21values", "values")"""
+    keys = set()
+    for item in content_list:
+        if item.get("text_level"):
+            text = " ".join(str(item.get("text", "")).split())
+            keys.add(_compact(text))
+            numbered = _NUMBERED_RE.match(text) or _APPENDIX_SECTION_RE.match(text)
+            if numbered:
+                keys.add(_compact(numbered.group(2)))
+    keys.discard("")
+    return keys
+
+
+def _content_list_lines(items: List[Dict[str, Any]]) -> List[TocLine]:
+    """One TocLine per text item / list item; page furniture is dropped"""
+    lines = []
+    for item in items:
+        x0 = item.get("bbox", [None])[0]
+        if item.get("type") == "text":
+            lines.append(TocLine(item.get("text", ""), item.get("page_idx"), x0, bool(item.get("text_level"))))
+        elif item.get("type") == "list":
+            for text in item.get("list_items", []):
+                lines.append(TocLine(text, item.get("page_idx"), x0, False))
+    return lines
+
+
+def _has_page_reference(text: str) -> bool:
+    _, page, roman, leader = _split_page(text)
+    return page is not None or roman or leader
+
+
+def _contents_blocks(content_list: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Items of each printed contents listing: from a "Contents" heading through the following pages
+    that still look like a contents page (at least two lines ending in a page reference)
+    """
+    starts = [
+        i for i, item in enumerate(content_list)
+        if item.get("text_level") and _compact(item.get("text", "")).startswith(_CONTENTS_KEYS)
+    ]
+    blocks = []
+    for n, start in enumerate(starts):
+        stop = starts[n + 1] if n + 1 < len(starts) else len(content_list)
+        by_page: Dict[int, List[Dict[str, Any]]] = {}
+        for item in content_list[start + 1:stop]:
+            by_page.setdefault(item.get("page_idx"), []).append(item)
+
+        block = []
+        page = content_list[start].get("page_idx")
+        while page in by_page:
+            referenced = sum(1 for line in _content_list_lines(by_page[page]) if _has_page_reference(line.text))
+            if referenced < 2:
+                break
+            block.extend(by_page[page])
+            page += 1
+        blocks.append(block)
+    return blocks
+
+
+def _printed_page_offset(content_list: List[Dict[str, Any]]) -> int:
+    """Median (printed page number - page_idx) over the page_number items"""
+    offsets = sorted(
+        int(item["text"].strip()) - item["page_idx"]
+        for item in content_list
+        if item.get("type") == "page_number" and str(item.get("text", "")).strip().isdigit()
+    )
+    return offsets[len(offsets) // 2] if offsets else 1
+
+
+def _book_title(content_list: List[Dict[str, Any]]) -> str:
+    for item in content_list:
+        if item.get("text_level") and item.get("text", "").strip():
+            return " ".join(item["text"].split())
+    return ""
+
+
+def _package(chapters, book_title: str, method: str, confidence: float) -> Dict[str, Any]:
+    return {
+        "book_title": book_title,
+        "chapters": chapters,
+        "extraction": {"method": method, "confidence": confidence},
+    }
+
+
+def extract_toc(content_list: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Best ToC derived from a MinerU content_list: the printed contents pages when the book has them,
+    else the numbered body headings. Returns None when neither yields a chapter.
+    The result has an extra "extraction" {"method", "confidence"} entry, outside the ToC schema;
+    callers drop it before saving.
+    """
+    heading_keys = _heading_keys(content_list)
+    book_title = _book_title(content_list)
+    candidates = []
+    listed = set()
+
+    for block in _contents_blocks(content_list):
+        listed.update(id(item) for item in block)
+        builder = _TocBuilder()
+        for line in _content_list_lines(block):
+            builder.feed(line)
+        chapters = builder.result()
+        if chapters:
+            candidates.append(_package(chapters, book_title, "contents_pages", _confidence(builder, chapters, heading_keys)))
+
+    # Body headings: only numbered lines and "Chapter N" markers are trusted
+    offset = _printed_page_offset(content_list)
+    builder = _TocBuilder(numbered_only=True)
+    for item in content_list:
+        if item.get("type") == "text" and item.get("text_level") and id(item) not in listed:
+            page_idx = item.get("page_idx")
+            page = page_idx + offset if page_idx is not None else None
+            builder.feed(TocLine(item.get("text", ""), page_idx, None, True, page))
+    chapters = builder.result()
+    if chapters:
+        candidates.append(_package(chapters, book_title, "headings", _confidence(builder, chapters, None)))
+
+    if not candidates:
+        return None
+    return max(candidates, key=lambda toc: (toc["extraction"]["confidence"], len(list(_iter_nodes(toc["chapters"])))))
+
+
+def extract_toc_from_text(toc_string: str, book_title: str = "") -> Optional[Dict[str, Any]]:
+    """ToC from plain contents text, one entry per line; hierarchy comes from numbering only"""
+    builder = _TocBuilder()
+    for text in str(toc_string).splitlines():
+        builder.feed(TocLine(text))
+    chapters = builder.result()
+    if not chapters:
+        return None
+    return _package(chapters, book_title, "text", _confidence(builder, chapters, None))
+
+
+def _chapter_boundary(raw: str, expected: Optional[int], appendix: str) -> Optional[int]:
+    """
+    Chapter number (0 for an appendix) when a contents line opens a chapter, else None.
+    Numbered chapters must continue the sequence, allowing a couple of lost numbers, so a stray
+    page number is not taken for a boundary.
+    """
+    lowered = raw.lower()
+    if lowered == "appendix" or lowered.startswith("appendix "):
+        return 0
+    title, _, _, leader = _split_page(raw)
+    marker = _CHAPTER_MARKER_RE.match(raw)
+    numbered = _NUMBERED_RE.match(title)
+    number = marker.group(1) if marker else (numbered.group(1) if numbered and not leader else None)
+    if number is not None and "." not in number and (expected is None or expected <= int(number) <= expected + 2):
+        return int(number)
+    letter = _APPENDIX_CHAPTER_RE.match(title)
+    if letter and not leader and letter.group(1) == appendix:
+        return 0
+    return None
+
+
+def split_toc_text(toc_string: str, max_chars: int) -> List[str]:
+    """
+    Cut contents text at chapter boundaries into fragments of whole chapters, each at most max_chars
+    long unless a single chapter is longer. Lines before the first chapter go with the first fragment.
+    Returns the text as a single fragment when no chapter line is recognised (unnumbered chapters).
+    """
+    chapters: List[List[str]] = []
+    preamble: List[str] = []
+    expected, appendix = None, "A"
+    for line in str(toc_string).splitlines():
+        raw = " ".join(line.split())
+        number = _chapter_boundary(raw, expected, appendix) if raw else None
+        # "Appendix" on its own line and the title below it are one chapter
+        after_appendix = bool(chapters) and chapters[-1][-1].strip().lower() == "appendix"
+        if number is not None and not after_appendix:
+            if number:
+                expected = number + 1
+            elif _APPENDIX_CHAPTER_RE.match(_split_page(raw)[0]):
+                appendix = chr(ord(appendix) + 1)
+            chapters.append([])
+        (chapters[-1] if chapters else preamble).append(line)
+
+    if not chapters:
+        return [str(toc_string)]
+
+    fragments: List[str] = []
+    for chapter_lines in chapters:
+        text = "\n".join(chapter_lines)
+        if fragments and len(fragments[-1]) + len(text) + 1 <= max_chars:
+            fragments[-1] += "\n" + text
+        else:
+            fragments.append(text)
+    if preamble:
+        fragments[0] = "\n".join(preamble) + "\n" + fragments[0]
+    return fragments
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_toc(toc: Any) -> Dict[str, Any]:
+    """
+    Coerce an LLM-produced ToC to the ASK_TABLE_CONTENT_PROMPT schema (integer numbers and pages,
+    string ids, list children); a chapter without an integer number (appendix "A") follows the
+    previous one. Raises ValueError when it has no usable chapters.
+    """
+    if not isinstance(toc, dict) or not isinstance(toc.get("chapters"), list):
+        raise ValueError("ToC has no chapters array")
+    chapters = []
+    for chapter in toc["chapters"]:
+        if not isinstance(chapter, dict):
+            raise ValueError(f"Invalid chapter entry: {chapter!r}")
+        number = _as_int(chapter.get("chapter_number"))
+        if number is None:
+            number = (chapters[-1]["chapter_number"] + 1) if chapters else 1
+        sections = []
+        for section in chapter.get("sections") or []:
+            sub_sections = [
+                {
+                    "sub_section_id": str(sub_section.get("sub_section_id", "")),
+                    "sub_section_title": str(sub_section.get("sub_section_title", "")),
+                    "page": _as_int(sub_section.get("page")),
+                }
+                for sub_section in section.get("sub_sections") or []
+            ]
+            sections.append({
+                "section_id": str(section.get("section_id", "")),
+                "section_title": str(section.get("section_title", "")),
+                "page": _as_int(section.get("page")),
+                "sub_sections": sub_sections,
+            })
+        chapters.append({
+            "chapter_number": number,
+            "chapter_title": str(chapter.get("chapter_title", "")),
+            "start_page": _as_int(chapter.get("start_page")),
+            "sections": sections,
+        })
+    if not chapters:
+        raise ValueError("ToC has no chapters")
+    return {"book_title": str(toc.get("book_title") or ""), "chapters": chapters}
+
+
+def _renumber_chapter(chapter: Dict[str, Any], number: int):
+    """Give a chapter a new number, carrying it into section / sub-section ids that start with the old one"""
+    old = f"{chapter['chapter_number']}."
+    chapter["chapter_number"] = number
+    for section in chapter["sections"]:
+        if section["section_id"].startswith(old):
+            section["section_id"] = f"{number}." + section["section_id"][len(old):]
+        for sub_section in section["sub_sections"]:
+            if sub_section["sub_section_id"].startswith(old):
+                sub_section["sub_section_id"] = f"{number}." + sub_section["sub_section_id"][len(old):]
+
+
+def stitch_toc_fragments(tocs: List[Any]) -> Dict[str, Any]:
+    """
+    One ToC from the per-fragment results, in fragment order. A fragment that restarts the chapter
+    numbering (its request could not see the preceding fragments) continues from the last stitched
+    chapter; a chapter continued across a fragment boundary (same title) has its sections merged.
+    Raises ValueError if a fragment is unusable or numbering still goes backwards.
+    """
+    book_title = ""
+    chapters: List[Dict[str, Any]] = []
+    for toc in tocs:
+        part = validate_toc(toc)
+        book_title = book_title or part["book_title"]
+        part_chapters = part["chapters"]
+        if chapters and _compact(part_chapters[0]["chapter_title"]) == _compact(chapters[-1]["chapter_title"]):
+            chapters[-1]["sections"].extend(part_chapters.pop(0)["sections"])
+        if chapters and part_chapters and part_chapters[0]["chapter_number"] <= chapters[-1]["chapter_number"]:
+            shift = chapters[-1]["chapter_number"] + 1 - part_chapters[0]["chapter_number"]
+            for chapter in part_chapters:
+                _renumber_chapter(chapter, chapter["chapter_number"] + shift)
+        for chapter in part_chapters:
+            if chapters and chapter["chapter_number"] <= chapters[-1]["chapter_number"]:
+                raise ValueError(
+                    f"Chapter {chapter['chapter_number']} ({chapter['chapter_title']!r}) follows chapter "
+                    f"{chapters[-1]['chapter_number']} when stitching fragments"
+                )
+            chapters.append(chapter)
+    return {"book_title": book_title, "chapters": chapters}
+
+
+def load_content_list(path: PathLike) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -2,13 +2,20 @@ import os
 import json
 
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Callable
 from microservices.chunker import MarkdownChunker
-from microservices.vectorization import VectorStorageManager
+from microservices.vectorization import VectorStoreRegistry, build_scope_filter, close_shared_chroma_clients
+from microservices.search_cache import get_search_cache
 from microservices.mineru_client import MinerUClient
+from microservices.job_queue import JobManager
 from llm.analyze_textbook import TextbookAnalyzer
-from scripts.merge_toc_content import map_chunks_to_toc
+from llm.llm_cache import get_llm_cache
+from llm.llm_client import close_shared_clients
+from llm.textbook_content import load_textbook_content
+from scripts.merge_toc_content import map_chunks_to_toc, tag_chunks_with_toc
 import uvicorn
 from dotenv import load_dotenv
 
@@ -28,37 +35,201 @@ class ChunkerProcessRequest(BaseModel):
     username: str
     file_name: str
     output_filename: str = "chunker_step_1.json"
+    min_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None
     description: str = "需要分块的Markdown文件名"
 
 class VectorizationStoreRequest(BaseModel):
     username: str
     json_path: str
     collection_name: str = "default_collection"
-    description: str = "需要向量化的chunks.json文件路径"
+    mode: str = "skip"
+    toc_path: Optional[str] = None
+    description: str = "需要向量化的chunks.json文件路径；mode=sync 时增量同步已修改的分块；toc_path 默认使用同目录的 textbook_toc.json"
+
+class SearchScope(BaseModel):
+    chapter_number: Optional[int] = None
+    section_id: Optional[str] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
 
 class SearchRequest(BaseModel):
     username: str
     collection_name: str
     query: str
     n_results: int = 3
+    mode: str = "dense"
+    scope: Optional[SearchScope] = None
+    description: str = "mode=dense 纯向量检索；mode=hybrid BM25 + 向量的 RRF 融合检索；scope 限定章节/小节/页码范围"
+
+class BatchSearchRequest(BaseModel):
+    username: str
+    collection_name: str
+    queries: List[str]
+    n_results: int = 3
+    mode: str = "dense"
+    scope: Optional[SearchScope] = None
+    description: str = "批量搜索，一次请求多个查询"
+
+class LibrarySearchRequest(BaseModel):
+    username: str
+    query: str
+    collection_names: Optional[List[str]] = None
+    n_results: int = 5
+    scope: Optional[SearchScope] = None
+    description: str = "跨集合搜索；collection_names 为空时搜索该用户的所有集合"
 
 class TextbookAnalysisRequest(BaseModel):
     username: str
     project_name: str
+    max_workers: Optional[int] = None
+    batch_token_budget: Optional[int] = None
     description: str = "分析教科书内容并生成学习材料"
 
 class ParseTocRequest(BaseModel):
     username: str
     project_name: Optional[str] = None
     filename: Optional[str] = None
-    toc_string: str
+    toc_string: str = ""
     save_to_disk: bool = True
-    description: str = "使用LLM解析目录文本并生成结构化TOC"
+    # auto：先从 MinerU 输出本地解析，置信度不足时交给 LLM；local / llm 只用其中一种（默认 TOC_STRATEGY）
+    strategy: Optional[str] = None
+    # 已向量化的集合（默认与流水线相同：{username}-{project_name}），保存目录后为其分块重新标注章节范围
+    collection_name: Optional[str] = None
+    description: str = "解析目录并生成结构化TOC（本地优先，LLM 兜底）"
+
+class PipelineJobRequest(BaseModel):
+    username: str
+    file_name: str
+    output_filename: str = "chunker_step_1.json"
+    # 与 /api/chunker/process 相同的 token 窗口，后台任务和同步调用的分块结果一致
+    min_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None
+    collection_name: Optional[str] = None
+    vectorize: bool = True
+    vectorize_mode: str = "skip"
+    description: str = "后台执行 PDF → Markdown → chunks → vectors 流水线"
 
 # --- 初始化组件 ---
 chunker = MarkdownChunker()
-vector_manager = None
+vector_registry = VectorStoreRegistry()
 mineru_client = MinerUClient()
+job_manager = JobManager()
+
+
+@app.on_event("startup")
+async def warmup_vector_registry():
+    """启动时预加载 Embedding 模型，避免首个请求承担模型加载时间"""
+    try:
+        vector_registry.warmup()
+    except Exception as e:
+        print(f"⚠️ Embedding 模型预加载失败: {e}")
+
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    """取消排队中的后台任务，等待运行中的任务结束（先于下面关闭连接池和 Chroma 客户端）"""
+    job_manager.shutdown(wait=True)
+
+
+@app.on_event("shutdown")
+async def close_llm_connection_pools():
+    """关闭共享的 LLM 异步连接池"""
+    await close_shared_clients()
+
+
+@app.on_event("shutdown")
+def close_vector_store_clients():
+    """关闭 shared 布局下每个用户共享的 Chroma 客户端"""
+    close_shared_chroma_clients()
+
+
+def _require_data_dir() -> str:
+    data_dir = os.getenv("DATA_DIR")
+    if not data_dir:
+        raise HTTPException(status_code=500, detail="DATA_DIR 环境变量未配置")
+    return data_dir
+
+
+def _load_chunks_with_scope(vm, chunks_path: str, toc_path: Optional[str] = None) -> Iterable[Dict[str, Any]]:
+    """
+    惰性读取分块；有目录文件时（默认同目录的 textbook_toc.json）为每个分块标注章节/小节/页码范围，
+    写入向量库后即可按范围过滤搜索。
+    返回生成器，直接交给 process_and_store 流式处理，不在内存中保存整本书的分块列表
+    """
+    chunks = vm.iter_chunks(chunks_path)
+    toc_path = toc_path or os.path.join(os.path.dirname(chunks_path), "textbook_toc.json")
+    if os.path.exists(toc_path):
+        with open(toc_path, "r", encoding="utf-8") as f:
+            toc_data = json.load(f)
+        chunks = tag_chunks_with_toc(chunks, toc_data)
+    return chunks
+
+
+class _ChunkCounter:
+    """包装分块迭代器并计数：流式写入后仍能报告读取的分块总数"""
+
+    def __init__(self, chunks: Iterable[Dict[str, Any]]):
+        self.chunks = chunks
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for chunk in self.chunks:
+            self.count += 1
+            yield chunk
+
+
+def _vectorize_file(
+    db_path: str,
+    collection_name: str,
+    chunks_path: str,
+    toc_path: Optional[str] = None,
+    mode: str = "skip",
+    report: Optional[Callable[[float], None]] = None,
+) -> Dict[str, Any]:
+    """
+    租用 manager，把分块文件流式标注范围后写入向量库（阻塞调用，异步端点中通过 run_in_threadpool 执行）
+    写入可能超过空闲超时，租用期间 manager 不会被关闭
+    report(fraction) 按已处理的分块比例报告进度（后台任务）
+    """
+    with vector_registry.lease(collection_name, db_path=db_path) as vm:
+        chunks = _ChunkCounter(_load_chunks_with_scope(vm, chunks_path, toc_path))
+        progress = None
+        if report:
+            total = vm.count_chunks(chunks_path)
+
+            def progress(processed: int):
+                report(processed / total if total else 1.0)
+
+        stored = vm.process_and_store(chunks, mode=mode, progress=progress)
+        return {
+            "chunks_count": chunks.count,
+            "stored_count": stored,
+            "collection_name": vm.collection.name,
+            "db_path": vm.db_path,
+        }
+
+
+def _sync_collection_scope(username: str, collection_name: str, chunks_path: str, toc_path: str) -> bool:
+    """
+    流水线先向量化、后解析目录，此时集合里的分块还没有章节范围。
+    目录保存后为集合中已有的分块补上范围元数据（分块 id 不含范围）：不计算向量，不新增也不删除分块，
+    集合由其他分块文件构建时匹配不到的分块保持不变。
+    集合不存在时返回 False
+    """
+    user_db_path = os.path.join(_require_data_dir(), username, "chroma_db")
+    if collection_name not in vector_registry.list_collections(user_db_path):
+        return False
+    with vector_registry.lease(collection_name, db_path=user_db_path) as vm:
+        vm.update_scope(_load_chunks_with_scope(vm, chunks_path, toc_path))
+    return True
+
+
+def _scope_filter(scope: Optional[SearchScope]) -> Optional[Dict[str, Any]]:
+    if scope is None:
+        return None
+    return build_scope_filter(scope.chapter_number, scope.section_id, scope.page_start, scope.page_end)
+
 
 # ============================================================================
 # 1. MinerU PDF 处理端点
@@ -72,7 +243,8 @@ async def process_pdf(request: MinerUProcessRequest):
     - 输出：Markdown 文件路径和状态
     """
     try:
-        result = mineru_client.process_file(
+        result = await run_in_threadpool(
+            mineru_client.process_file,
             username=request.username,
             file_name=request.file_name
         )
@@ -117,9 +289,12 @@ async def process_chunking(request: ChunkerProcessRequest):
             request.file_name,
         )
 
-        success, error = chunker.process_markdown(
+        success, error = await run_in_threadpool(
+            chunker.process_markdown,
             markdown_file=markdown_path,
             output_file=request.output_filename,
+            min_tokens=request.min_tokens,
+            max_tokens=request.max_tokens,
         )
 
         if not success:
@@ -139,8 +314,11 @@ async def process_chunking(request: ChunkerProcessRequest):
         chunks_count = None
         try:
             with open(output_path, "r", encoding="utf-8") as f:
-                chunks = json.load(f)
-            chunks_count = len(chunks) if isinstance(chunks, list) else None
+                if output_path.endswith(".jsonl"):
+                    chunks_count = sum(1 for line in f if line.strip())
+                else:
+                    chunks = json.load(f)
+                    chunks_count = len(chunks) if isinstance(chunks, list) else None
         except Exception:
             chunks_count = None
 
@@ -170,7 +348,7 @@ async def vectorize_and_store(request: VectorizationStoreRequest):
     - 注入标题上下文
     - 修复元数据
     - 批量写入数据库
-    - 如果集合已存在，则跳过向量化（幂等性）
+    - 如果集合已存在，则跳过向量化（幂等性）；mode=sync 时只对新增/修改的分块计算向量并删除已不存在的分块
     """
     try:
         # 构建用户特定的数据库路径
@@ -179,25 +357,21 @@ async def vectorize_and_store(request: VectorizationStoreRequest):
             raise HTTPException(status_code=500, detail="DATA_DIR 环境变量未配置")
         
         user_db_path = os.path.join(data_dir, request.username, "chroma_db")
-        
-        # 创建 VectorStorageManager 并指定用户特定的db路径
-        vector_manager = VectorStorageManager(request.collection_name, db_path=user_db_path)
-        
-        # 加载分块数据
-        chunks = vector_manager.load_chunks(request.json_path)
-        
-        # 执行向量化和存储（如果已存在则跳过）
-        vector_manager.process_and_store(chunks)
-        
+
+        if request.mode not in ("skip", "sync"):
+            raise HTTPException(status_code=400, detail=f"不支持的 mode: {request.mode}（可选 skip / sync）")
+
+        # 从共享注册表租用 manager、读取并标注分块、写入向量库都涉及文件和 Chroma 读写，整体放到线程池执行，
+        # 不阻塞事件循环（如果集合已存在则跳过）
+        data = await run_in_threadpool(
+            _vectorize_file, user_db_path, request.collection_name, request.json_path, request.toc_path, request.mode
+        )
+
         return {
             "success": True,
             "status_code": 200,
-            "message": f"成功向量化 {len(chunks)} 个分块",
-            "data": {
-                "chunks_count": len(chunks),
-                "collection_name": vector_manager.collection.name,
-                "db_path": vector_manager.db_path
-            }
+            "message": f"成功向量化 {data['chunks_count']} 个分块",
+            "data": data,
         }
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -210,6 +384,36 @@ async def vectorize_and_store(request: VectorizationStoreRequest):
 # 4. 语义搜索端点
 # ============================================================================
 
+def _format_search_results(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """把 VectorStorageManager.search 的结果格式化为接口响应"""
+    formatted_results = []
+    if results.get('documents') and len(results['documents']) > 0:
+        for doc, meta, dist, score in zip(
+            results['documents'][0], 
+            results['metadatas'][0], 
+            results.get('distances', [[]])[0],
+            results.get('scores', [[]])[0]
+        ):
+            formatted_results.append({
+                "content": doc,
+                "metadata": {
+                    "source": meta.get("source"),
+                    "header_1": meta.get("header_1"),
+                    "header_2": meta.get("header_2"),
+                    "header_3": meta.get("header_3"),
+                    "has_image": meta.get("has_image"),
+                    "referenced_images": meta.get("referenced_images"),
+                    "chapter_number": meta.get("chapter_number"),
+                    "section_id": meta.get("section_id"),
+                    "sub_section_id": meta.get("sub_section_id"),
+                    "page": meta.get("page")
+                },
+                "distance": dist,
+                "score": score
+            })
+    return formatted_results
+
+
 @app.post("/api/vectorization/search")
 async def semantic_search(request: SearchRequest):
     """
@@ -223,44 +427,133 @@ async def semantic_search(request: SearchRequest):
         
         user_db_path = os.path.join(data_dir, request.username, "chroma_db")
         
-        # 根据 collection_name 加载 VectorStorageManager
-        vm = VectorStorageManager(request.collection_name, db_path=user_db_path)
+        # 根据 collection_name 从共享注册表租用 VectorStorageManager
+        with vector_registry.lease(request.collection_name, db_path=user_db_path) as vm:
+            # 检查集合是否存在
+            if not vm.collection_exists():
+                raise HTTPException(
+                    status_code=404, 
+                    detail=f"集合 '{request.collection_name}' 不存在或为空。请先执行向量化操作。"
+                )
         
-        # 检查集合是否存在
-        if not vm.collection_exists():
-            raise HTTPException(
-                status_code=404, 
-                detail=f"集合 '{request.collection_name}' 不存在或为空。请先执行向量化操作。"
+            # 执行搜索
+            if request.mode not in ("dense", "hybrid"):
+                raise HTTPException(status_code=400, detail=f"不支持的 mode: {request.mode}（可选 dense / hybrid）")
+            results = await run_in_threadpool(
+                vm.search, request.query, n_results=request.n_results, mode=request.mode, where=_scope_filter(request.scope)
             )
         
-        # 执行搜索
-        results = vm.search(request.query, n_results=request.n_results)
-        
         # 格式化响应
-        formatted_results = []
-        if results.get('documents') and len(results['documents']) > 0:
-            for doc, meta, dist in zip(
-                results['documents'][0], 
-                results['metadatas'][0], 
-                results.get('distances', [[]])[0]
-            ):
-                formatted_results.append({
-                    "content": doc,
-                    "metadata": {
-                        "source": meta.get("source"),
-                        "header_1": meta.get("header_1"),
-                        "header_2": meta.get("header_2"),
-                        "header_3": meta.get("header_3"),
-                        "has_image": meta.get("has_image"),
-                        "referenced_images": meta.get("referenced_images")
-                    },
-                    "distance": dist
-                })
+        formatted_results = _format_search_results(results)
         
         return {
             "success": True,
             "collection_name": request.collection_name,
             "query": request.query,
+            "mode": request.mode,
+            "results_count": len(formatted_results),
+            "results": formatted_results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"搜索出错: {str(e)}")
+
+
+@app.post("/api/vectorization/search/batch")
+async def batch_semantic_search(request: BatchSearchRequest):
+    """
+    批量语义搜索：一次请求多个查询（例如为一个小节生成测验题时的多次检索）
+    所有查询的向量一次算完，并合并为一次 collection.query，按输入顺序返回每个查询的结果
+    """
+    try:
+        data_dir = _require_data_dir()
+        user_db_path = os.path.join(data_dir, request.username, "chroma_db")
+
+        if not request.queries:
+            raise HTTPException(status_code=400, detail="queries 不能为空")
+        if request.mode not in ("dense", "hybrid"):
+            raise HTTPException(status_code=400, detail=f"不支持的 mode: {request.mode}（可选 dense / hybrid）")
+
+        with vector_registry.lease(request.collection_name, db_path=user_db_path) as vm:
+            if not vm.collection_exists():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"集合 '{request.collection_name}' 不存在或为空。请先执行向量化操作。"
+                )
+
+            batch_results = await run_in_threadpool(
+                vm.search_batch,
+                request.queries,
+                n_results=request.n_results,
+                mode=request.mode,
+                where=_scope_filter(request.scope),
+            )
+
+        return {
+            "success": True,
+            "collection_name": request.collection_name,
+            "mode": request.mode,
+            "queries_count": len(request.queries),
+            "results": [
+                {"query": query, "results": _format_search_results(results)}
+                for query, results in zip(request.queries, batch_results)
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"搜索出错: {str(e)}")
+
+
+@app.post("/api/vectorization/search-all")
+async def library_search(request: LibrarySearchRequest):
+    """
+    跨集合语义搜索：并行查询用户的所有（或指定的）集合，按距离合并出全局 top-k
+    每条结果带有来源集合（书）和章节路径
+    """
+    try:
+        data_dir = _require_data_dir()
+        user_db_path = os.path.join(data_dir, request.username, "chroma_db")
+
+        searched = await run_in_threadpool(
+            vector_registry.search_collections,
+            request.query,
+            user_db_path,
+            collection_names=request.collection_names,
+            n_results=request.n_results,
+            where=_scope_filter(request.scope),
+        )
+
+        formatted_results = []
+        for hit in searched["results"]:
+            meta = hit["metadata"]
+            headers = [meta.get("header_1"), meta.get("header_2"), meta.get("header_3")]
+            formatted_results.append({
+                "collection_name": hit["collection_name"],
+                "chunk_id": hit["id"],
+                "section": " > ".join(h for h in headers if h),
+                "content": hit["document"],
+                "metadata": {
+                    "source": meta.get("source"),
+                    "header_1": meta.get("header_1"),
+                    "header_2": meta.get("header_2"),
+                    "header_3": meta.get("header_3"),
+                    "has_image": meta.get("has_image"),
+                    "referenced_images": meta.get("referenced_images"),
+                    "chapter_number": meta.get("chapter_number"),
+                    "section_id": meta.get("section_id"),
+                    "sub_section_id": meta.get("sub_section_id"),
+                    "page": meta.get("page")
+                },
+                "distance": hit["distance"]
+            })
+
+        return {
+            "success": True,
+            "query": request.query,
+            "collections_searched": searched["searched"],
+            "errors": searched["errors"],
             "results_count": len(formatted_results),
             "results": formatted_results
         }
@@ -298,7 +591,12 @@ async def analyze_textbook(request: TextbookAnalysisRequest):
         analyzer = TextbookAnalyzer()
         
         # 运行分析
-        result = analyzer.generate_chapter_analysis(textbook_with_content_path)
+        result = await run_in_threadpool(
+            analyzer.generate_chapter_analysis,
+            textbook_with_content_path,
+            max_workers=request.max_workers,
+            batch_token_budget=request.batch_token_budget,
+        )
         
         return {
             "success": True,
@@ -320,7 +618,9 @@ async def analyze_textbook(request: TextbookAnalysisRequest):
 @app.post("/api/analyze/parse-toc")
 async def parse_table_of_content(request: ParseTocRequest):
     """
-    使用 LLM 解析目录文本并返回结构化 TOC JSON。
+    解析目录并返回结构化 TOC JSON。
+    优先根据 MinerU 的 content_list（目录页 / 编号标题）在本地构建，置信度低于 TOC_MIN_CONFIDENCE 时
+    再用 LLM 解析 toc_string；content_list 可用时 toc_string 可以为空。
     当 save_to_disk=True 时，将结果保存到项目目录中的 textbook_toc.json。
     """
     try:
@@ -352,24 +652,32 @@ async def parse_table_of_content(request: ParseTocRequest):
 
         analyzer = TextbookAnalyzer(chunker_path=chunker_path)
 
-        toc_json = analyzer.parse_table_of_content(
+        toc_json = await run_in_threadpool(
+            analyzer.parse_table_of_content,
             toc_string=request.toc_string,
             save_to_disk=request.save_to_disk,
+            strategy=request.strategy,
         )
 
         if not toc_json:
             raise HTTPException(status_code=500, detail="目录解析失败，请检查 toc_string 内容")
 
+        scope_synced = False
         if request.save_to_disk:
             if not os.path.exists(chunker_path):
                 raise HTTPException(status_code=404, detail=f"chunker_step_1.json not found at {chunker_path}")
             if not os.path.exists(toc_path):
                 raise HTTPException(status_code=500, detail=f"textbook_toc.json was not saved at {toc_path}")
 
-            merged_ok = map_chunks_to_toc(toc_path, chunker_path, textbook_with_content_path)
+            merged_ok = await run_in_threadpool(map_chunks_to_toc, toc_path, chunker_path, textbook_with_content_path)
             if not merged_ok:
                 raise HTTPException(status_code=500, detail="目录与分块内容合并失败")
 
+            collection_name = request.collection_name or f"{request.username}-{project_name}"
+            scope_synced = await run_in_threadpool(
+                _sync_collection_scope, request.username, collection_name, chunker_path, toc_path
+            )
+
         output_path = toc_path if request.save_to_disk else None
 
         return {
@@ -381,6 +689,7 @@ async def parse_table_of_content(request: ParseTocRequest):
                 "save_to_disk": request.save_to_disk,
                 "output_path": output_path,
                 "textbook_with_content_path": textbook_with_content_path if request.save_to_disk else None,
+                "scope_synced": scope_synced,
                 "toc": toc_json,
             },
         }
@@ -389,8 +698,174 @@ async def parse_table_of_content(request: ParseTocRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"目录解析出错: {str(e)}")
 
+@app.get("/api/explain/stream")
+async def stream_explanation(username: str, project_name: str, node_id: str, difficulty: str = "intermediate"):
+    """
+    以 SSE（text/event-stream）流式返回某个目录节点的讲解
+    - node_id：chapter_number / section_id / sub_section_id
+    - 每个增量片段为一条 `data: {"delta": "..."}` 事件，结束时发送 `event: done`，出错时发送 `event: error`
+    """
+    data_dir = _require_data_dir()
+    textbook_with_content_path = os.path.join(
+        data_dir, username, "output", project_name, "hybrid_auto", "textbook_with_content.json"
+    )
+    if not os.path.exists(textbook_with_content_path):
+        raise HTTPException(
+            status_code=404,
+            detail=f"textbook_with_content.json not found at {textbook_with_content_path}"
+        )
+
+    # 读取并解析整本书的 JSON，放到线程池中避免阻塞事件循环
+    textbook = await run_in_threadpool(load_textbook_content, textbook_with_content_path)
+    found = TextbookAnalyzer.find_toc_node(textbook.textbook_data, node_id)
+    if not found:
+        raise HTTPException(status_code=404, detail=f"目录节点不存在: {node_id}")
+    node, title = found
+    # 节点只保存分块范围，讲解前才从分块文件取出正文
+    content = await run_in_threadpool(textbook.get, node)
+
+    async def event_stream():
+        try:
+            # 在生成器内创建：缺少 API key 等配置错误也以 `event: error` 返回，而不是中断响应
+            analyzer = TextbookAnalyzer()
+            async for delta in analyzer.astream_explanation(title, content, difficulty=difficulty):
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ============================================================================
+# 6. 后台任务端点 - 提交后立即返回 job_id，由线程池执行流水线
+# ============================================================================
+
+def _stage_mineru(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    result = mineru_client.process_file(username=ctx["username"], file_name=ctx["file_name"])
+    if not result["success"]:
+        raise RuntimeError(f"MinerU 处理失败 [{result['status_code']}]: {result['message']}")
+    return {"mineru": result["data"]}
+
+
+def _stage_chunker(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    project_dir = os.path.join(ctx["data_dir"], ctx["username"], "output", ctx["project_name"], "hybrid_auto")
+    markdown_path = os.path.join(project_dir, f"{ctx['project_name']}.md")
+    success, error = chunker.process_markdown(
+        markdown_file=markdown_path,
+        output_file=ctx["output_filename"],
+        min_tokens=ctx.get("min_tokens"),
+        max_tokens=ctx.get("max_tokens"),
+    )
+    if not success:
+        raise RuntimeError(error or "分块处理失败")
+    return {"markdown_path": markdown_path, "chunks_path": os.path.join(project_dir, ctx["output_filename"])}
+
+
+def _stage_vectorize(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    user_db_path = os.path.join(ctx["data_dir"], ctx["username"], "chroma_db")
+    result = _vectorize_file(
+        user_db_path,
+        ctx["collection_name"],
+        ctx["chunks_path"],
+        mode=ctx.get("vectorize_mode", "skip"),
+        report=ctx.get("report"),
+    )
+    return {"chunks_count": result["chunks_count"], "stored_count": result["stored_count"], "db_path": result["db_path"]}
+
+
+def _stage_analyze(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    result = TextbookAnalyzer().generate_chapter_analysis(
+        ctx["textbook_with_content_path"],
+        max_workers=ctx.get("max_workers"),
+        batch_token_budget=ctx.get("batch_token_budget"),
+        progress=ctx.get("report"),
+    )
+    if not result:
+        raise RuntimeError("教科书分析失败")
+    return {"chapters_processed": len(result.get("chapters", []))}
+
+
+@app.post("/api/jobs/pipeline")
+async def submit_pipeline_job(request: PipelineJobRequest):
+    """
+    提交 PDF → Markdown → chunks → vectors 后台任务，立即返回 job_id
+    通过 GET /api/jobs/{job_id} 查询状态和进度
+    """
+    data_dir = _require_data_dir()
+    project_name = os.path.splitext(request.file_name)[0]
+
+    stages = [("mineru", _stage_mineru), ("chunker", _stage_chunker)]
+    if request.vectorize:
+        stages.append(("vectorize", _stage_vectorize))
+
+    job_id = job_manager.submit(
+        job_type="pipeline",
+        username=request.username,
+        stages=stages,
+        params={
+            "data_dir": data_dir,
+            "username": request.username,
+            "file_name": request.file_name,
+            "project_name": project_name,
+            "output_filename": request.output_filename,
+            "min_tokens": request.min_tokens,
+            "max_tokens": request.max_tokens,
+            "collection_name": request.collection_name or f"{request.username}-{project_name}",
+            "vectorize_mode": request.vectorize_mode,
+        },
+    )
+    return {"success": True, "status_code": 202, "message": "任务已提交", "data": {"job_id": job_id}}
+
+
+@app.post("/api/jobs/analyze")
+async def submit_analyze_job(request: TextbookAnalysisRequest):
+    """提交教科书分析后台任务，立即返回 job_id"""
+    data_dir = _require_data_dir()
+    textbook_with_content_path = os.path.join(
+        data_dir, request.username, "output", request.project_name, "hybrid_auto", "textbook_with_content.json"
+    )
+    if not os.path.exists(textbook_with_content_path):
+        raise HTTPException(
+            status_code=404,
+            detail=f"textbook_with_content.json not found at {textbook_with_content_path}"
+        )
+
+    job_id = job_manager.submit(
+        job_type="analyze",
+        username=request.username,
+        stages=[("analyze", _stage_analyze)],
+        params={
+            "username": request.username,
+            "project_name": request.project_name,
+            "textbook_with_content_path": textbook_with_content_path,
+            "max_workers": request.max_workers,
+            "batch_token_budget": request.batch_token_budget,
+        },
+    )
+    return {"success": True, "status_code": 202, "message": "任务已提交", "data": {"job_id": job_id}}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """查询任务状态：status / current_stage / progress / result / error"""
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {"success": True, "data": job}
+
+
+@app.get("/api/jobs")
+async def list_jobs(username: Optional[str] = None):
+    """列出任务（可按用户过滤）"""
+    jobs = job_manager.list_jobs(username)
+    return {"success": True, "count": len(jobs), "data": jobs}
+
 # ============================================================================
-# 6. 健康检查和状态端点
+# 7. 健康检查和状态端点
 # ============================================================================
 
 @app.get("/health")
@@ -413,6 +888,8 @@ async def get_status():
     """
     获取系统状态和配置信息
     """
+    llm_cache = get_llm_cache()
+    search_cache = get_search_cache()
     return {
         "success": True,
         "services": {
@@ -428,9 +905,21 @@ async def get_status():
             },
             "vectorization": {
                 "status": "ready",
-                "db_path": "DATA_DIR/{username}/chroma_db/{collection_name}",
-                "note": "每个用户和 collection 有独立的数据库文件夹"
-            }
+                "db_path": (
+                    "DATA_DIR/{username}/chroma_db"
+                    if os.getenv("VECTOR_STORE_LAYOUT") == "shared"
+                    else "DATA_DIR/{username}/chroma_db/{collection_name}"
+                ),
+                "note": (
+                    "每个用户的所有 collection 共用一个数据库"
+                    if os.getenv("VECTOR_STORE_LAYOUT") == "shared"
+                    else "每个用户和 collection 有独立的数据库文件夹"
+                ),
+                "pool": vector_registry.stats(),
+                "search_cache": search_cache.stats() if search_cache else {"status": "disabled"}
+            },
+            "jobs": job_manager.stats(),
+            "llm_cache": llm_cache.stats() if llm_cache else {"status": "disabled"}
         }
     }
 
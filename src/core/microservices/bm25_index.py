@@ -0,0 +1,162 @@
+"""
+BM25 Index 模块 - 与向量集合配套的本地倒排索引
+稠密向量（MiniLM）对代码标识符（JTextField、onDraw()、SeekBar）这类精确词不敏感，
+BM25 词法检索与向量检索通过 Reciprocal Rank Fusion 融合成混合检索
+"""
+
+import os
+import re
+import json
+import math
+import heapq
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+PathLike = Union[str, Path]
+
+# 标识符 / 数字 / 单个 CJK 字符
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+|[一-鿿]")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    小写化的词项列表
+    驼峰和下划线标识符同时保留整体和各组成部分：JTextField -> jtextfield, j, text, field
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        lowered = token.lower()
+        tokens.append(lowered)
+        if not token.isalpha() or not (token.islower() or token.isupper()):
+            parts = [part.lower() for part in _CAMEL_RE.findall(token)]
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 倒排索引，按分块 id 增删，和 process_and_store 的增量同步保持一致
+    持久化为 JSON（每个分块的词频表），加载时重建倒排表
+    """
+
+    def __init__(self, path: PathLike, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def add(self, chunk_id: str, text: str):
+        with self._lock:
+            if chunk_id in self._docs:
+                self.remove(chunk_id)
+            tf: Dict[str, int] = {}
+            for token in tokenize(text):
+                tf[token] = tf.get(token, 0) + 1
+            self._index(chunk_id, tf)
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for chunk_id, text in items:
+                self.add(chunk_id, text)
+
+    def remove(self, chunk_id: str):
+        with self._lock:
+            tf = self._docs.pop(chunk_id, None)
+            if tf is None:
+                return
+            self._total_length -= self._lengths.pop(chunk_id)
+            for term in tf:
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self._postings[term]
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """返回按 BM25 分数降序的 (chunk_id, score)"""
+        with self._lock:
+            n_docs = len(self._docs)
+            if n_docs == 0:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for chunk_id, freq in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._lengths.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def load(self):
+        """从磁盘重新加载（丢弃内存中未保存的修改）"""
+        self.clear()
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                docs = json.load(f)["docs"]
+        except Exception as e:
+            logger.warning(f"读取 BM25 索引失败 {self.path}: {e}")
+            return
+        with self._lock:
+            for chunk_id, tf in docs.items():
+                self._index(chunk_id, tf)
+
+    def save(self):
+        """原子写入，避免崩溃时留下半个索引文件"""
+        with self._lock:
+            payload = json.dumps({"k1": self.k1, "b": self.b, "docs": self._docs}, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def _index(self, chunk_id: str, tf: Dict[str, int]):
+        self._docs[chunk_id] = tf
+        length = sum(tf.values())
+        self._lengths[chunk_id] = length
+        self._total_length += length
+        for term, freq in tf.items():
+            self._postings.setdefault(term, {})[chunk_id] = freq
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Reciprocal Rank Fusion：score(d) = Σ 1 / (k + rank_i(d))，rank 从 1 开始
+    只依赖名次，不需要把 BM25 分数和向量距离换算到同一尺度
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
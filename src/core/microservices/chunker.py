@@ -3,7 +3,7 @@ import re
 import json
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union, Tuple
+from typing import List, Dict, Any, Optional, Union, Tuple, Callable, Iterable, Iterator
 from dotenv import load_dotenv
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 
@@ -12,6 +12,54 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 PathLike = Union[str, Path]
 
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken (cl100k_base) when it is installed,
+    otherwise fall back to a ~4 characters per token estimate
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def save_chunks_to_jsonl(chunks: Iterable[Dict], output_path: PathLike) -> Tuple[bool, Optional[str]]:
+    """
+    Write chunks one JSON object per line as they are produced, flushing after every chunk,
+    so readers can consume the file before chunking finishes and memory stays flat.
+    """
+    try:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        with output_path.open("w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                f.flush()
+                count += 1
+        logger.info(f"Streamed {count} chunks to {output_path}")
+        return True, None
+    except Exception as e:
+        logger.exception("Failed to save chunks jsonl")
+        return False, str(e)
+
+
+def iter_chunks_file(path: PathLike) -> Iterator[Dict]:
+    """Read chunks from a .jsonl file lazily, or from a .json array file"""
+    path = Path(path)
+    with path.open("r", encoding="utf-8") as f:
+        if path.suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
 def save_chunks_to_json(chunks: List[Dict], output_path: PathLike) -> Tuple[bool, Optional[str]]:
     try:
         output_path = Path(output_path)
@@ -108,14 +156,15 @@ class MarkdownChunker:
             logger.exception(f"Error splitting markdown by headers: {e}")
             return False, str(e)
 
-    def split_large_chunks(self, chunks: List[Dict], chunk_size: int = 1500, overlap: int = 150) -> List[Dict]:
+    def split_large_chunks(self, chunks: List[Dict], chunk_size: int = 1500, overlap: int = 150, length_function: Callable[[str], int] = len) -> List[Dict]:
         """
         Further split large chunks using RecursiveCharacterTextSplitter with markdown-aware separators.
         
         Args:
             chunks: List of chunks from header-based splitting
-            chunk_size: Maximum size of each chunk in characters (default: 1500)
-            overlap: Number of overlapping characters between chunks (default: 150)
+            chunk_size: Maximum size of each chunk, measured by length_function (default: 1500)
+            overlap: Number of overlapping units between chunks (default: 150)
+            length_function: How to measure size; len counts characters, count_tokens counts tokens
             
         Returns:
             List of refined chunks
@@ -125,6 +174,7 @@ class MarkdownChunker:
         recursive_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=overlap,
+            length_function=length_function,
             separators=[
                 "\n```\n",      # Code block boundaries
                 "\n\n",         # Paragraph breaks
@@ -142,7 +192,7 @@ class MarkdownChunker:
             header = chunk.get("Header", "")
             
             # If chunk is small enough, keep it as is
-            if len(content) <= chunk_size:
+            if length_function(content) <= chunk_size:
                 refined_chunks.append(chunk)
             else:
                 # Split large chunks recursively
@@ -160,13 +210,132 @@ class MarkdownChunker:
         
         return refined_chunks
 
-    def process_markdown(self, markdown_file: PathLike, output_file: str = "chunker_step_1.json") -> Tuple[bool, Optional[str]]:
+    @staticmethod
+    def iter_header_chunks(markdown_file: PathLike) -> Iterator[Dict]:
+        """
+        Single-pass generator: read the markdown file line by line and yield a chunk every time
+        a line starting with # closes the previous one. Memory use is bounded by the largest chunk.
+        """
+        with Path(markdown_file).open("r", encoding="utf-8") as f:
+            current_header = ""
+            current_content: List[str] = []
+
+            for line in f:
+                line = line.rstrip("\n")
+                # Check if line is a header (starts with #)
+                if line.strip().startswith('#'):
+                    # Emit previous chunk if it has content
+                    chunk_text = '\n'.join(current_content).strip()
+                    if chunk_text:
+                        yield {
+                            "content": chunk_text,
+                            "Header": current_header
+                        }
+
+                    # Extract header text (remove # symbols)
+                    current_header = line.strip().lstrip('#').strip()
+                    current_content = [line]  # Include the header line in content
+                else:
+                    current_content.append(line)
+
+            # Don't forget the last chunk
+            chunk_text = '\n'.join(current_content).strip()
+            if chunk_text:
+                yield {
+                    "content": chunk_text,
+                    "Header": current_header
+                }
+
+    def iter_token_window(self, chunks: Iterable[Dict], min_tokens: int = 64, max_tokens: int = 512, overlap: int = 0) -> Iterator[Dict]:
+        """
+        Streaming version of enforce_token_window: holds back at most one undersized chunk
+        (and the last emitted one, for end-of-book merging) at a time.
+        """
+        previous: Optional[Dict] = None
+        pending: Optional[Dict] = None
+        for chunk in chunks:
+            if pending is not None:
+                combined = pending["content"] + "\n\n" + chunk["content"]
+                if count_tokens(combined) <= max_tokens:
+                    chunk = {"content": combined, "Header": pending["Header"]}
+                else:
+                    if previous is not None:
+                        yield from self.split_large_chunks([previous], chunk_size=max_tokens, overlap=overlap, length_function=count_tokens)
+                    previous = pending
+                pending = None
+
+            if count_tokens(chunk["content"]) < min_tokens:
+                pending = chunk
+            else:
+                if previous is not None:
+                    yield from self.split_large_chunks([previous], chunk_size=max_tokens, overlap=overlap, length_function=count_tokens)
+                previous = chunk
+
+        if previous is not None:
+            yield from self._split_with_tail(previous, pending, max_tokens, overlap)
+        elif pending is not None:
+            yield pending
+
+    def _split_with_tail(self, chunk: Dict, tail: Optional[Dict], max_tokens: int, overlap: int) -> List[Dict]:
+        """
+        Split chunk into the token window (measuring length in tokens instead of characters) and
+        fold an undersized tail chunk into its last part when that still fits max_tokens.
+        """
+        parts = self.split_large_chunks([chunk], chunk_size=max_tokens, overlap=overlap, length_function=count_tokens)
+        if tail is not None:
+            if parts and count_tokens(parts[-1]["content"] + "\n\n" + tail["content"]) <= max_tokens:
+                parts[-1] = {"content": parts[-1]["content"] + "\n\n" + tail["content"], "Header": parts[-1]["Header"]}
+            else:
+                parts.append(tail)
+        return parts
+
+    def enforce_token_window(self, chunks: List[Dict], min_tokens: int = 64, max_tokens: int = 512, overlap: int = 0) -> List[Dict]:
+        """
+        Bring header-based chunks into a [min_tokens, max_tokens] token window.
+        
+        - Chunks below min_tokens (typically a bare title line) are merged into the following chunk,
+          or into the last part of the previous one at the end of the book, as long as the result
+          fits max_tokens.
+          The merged chunk keeps the first chunk's Header.
+        - Chunks above max_tokens are split on code-block, paragraph and line boundaries.
+        
+        Args:
+            chunks: List of chunks from header-based splitting
+            min_tokens: Minimum tokens per chunk (default: 64)
+            max_tokens: Maximum tokens per chunk (default: 512)
+            overlap: Number of overlapping tokens between split parts (default: 0)
+            
+        Returns:
+            List of chunks within the token window where possible
+        """
+        return list(self.iter_token_window(chunks, min_tokens=min_tokens, max_tokens=max_tokens, overlap=overlap))
+
+    def iter_markdown_chunks(self, markdown_file: PathLike, min_tokens: Optional[int] = None, max_tokens: Optional[int] = None) -> Iterator[Dict]:
+        """Yield header-based chunks, optionally passed through the token window, without materializing the book"""
+        chunks = self.iter_header_chunks(markdown_file)
+        if max_tokens:
+            chunks = self.iter_token_window(chunks, min_tokens=min_tokens or 0, max_tokens=max_tokens)
+        return chunks
+
+    def process_markdown(
+        self,
+        markdown_file: PathLike,
+        output_file: str = "chunker_step_1.json",
+        min_tokens: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+    ) -> Tuple[bool, Optional[str]]:
         """
         Main control method: Split content by # headers only using manual splitting.
         
+        The markdown file is read line by line. If output_file ends with ".jsonl", chunks are
+        streamed to disk one per line as they are produced (flat memory for very large books);
+        otherwise they are collected and saved as one JSON array.
+        
         Args:
             markdown_file: Path to the original markdown file
-            output_file: Name of the output JSON file (default: "chunker_step_1.json")
+            output_file: Name of the output JSON/JSONL file (default: "chunker_step_1.json")
+            min_tokens: If set together with max_tokens, merge chunks smaller than this (see enforce_token_window)
+            max_tokens: If set, enforce a token window on the header-based chunks (see enforce_token_window)
             
         Returns:
             Tuple of (success: bool, error_message: Optional[str])
@@ -175,48 +344,17 @@ class MarkdownChunker:
             markdown_path = Path(markdown_file)
             if not markdown_path.exists():
                 return False, f"Markdown file not found: {markdown_path}"
-            
-            # Read markdown content
-            with markdown_path.open("r", encoding="utf-8") as f:
-                content = f.read()
-            
-            # Split by # headers using regex - split on lines that start with #
-            lines = content.split('\n')
-            chunks = []
-            current_header = ""
-            current_content = []
-            
-            for line in lines:
-                # Check if line is a header (starts with #)
-                if line.strip().startswith('#'):
-                    # Save previous chunk if it has content
-                    if current_header or current_content:
-                        chunk_text = '\n'.join(current_content).strip()
-                        if chunk_text:
-                            chunks.append({
-                                "content": chunk_text,
-                                "Header": current_header
-                            })
-                    
-                    # Extract header text (remove # symbols)
-                    current_header = line.strip().lstrip('#').strip()
-                    current_content = [line]  # Include the header line in content
-                else:
-                    current_content.append(line)
-            
-            # Don't forget the last chunk
-            if current_header or current_content:
-                chunk_text = '\n'.join(current_content).strip()
-                if chunk_text:
-                    chunks.append({
-                        "content": chunk_text,
-                        "Header": current_header
-                    })
-            
+
+            chunks = self.iter_markdown_chunks(markdown_path, min_tokens=min_tokens, max_tokens=max_tokens)
+            output_path = markdown_path.parent / output_file
+
+            if output_path.suffix == ".jsonl":
+                return save_chunks_to_jsonl(chunks, output_path)
+
+            chunks = list(chunks)
             logger.info(f"Successfully split into {len(chunks)} chunks by # headers")
             
             # Save to output file
-            output_path = markdown_path.parent / output_file
             success, error = save_chunks_to_json(chunks, output_path)
             
             if success:
@@ -0,0 +1,305 @@
+"""
+Embedding Cache 模块 - 基于文本哈希的持久化向量缓存
+相同文本（重复的样板页、多本书共有的章节、重新索引）只计算一次向量，所有用户和集合共享
+- 向量：按行追加到 float32 矩阵文件，读取时通过 numpy.memmap 内存映射
+- 索引：SQLite 表 (sha256(text) -> 行号)
+每个模型使用单独的一对文件，不同模型的向量不会混用
+多个进程（服务、迁移脚本等）可以共用同一个缓存目录：追加在跨进程文件锁内完成
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+from dotenv import load_dotenv
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+PathLike = Union[str, Path]
+
+# SQLite 单条语句的参数个数上限较低，分批查询
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    单个模型的磁盘向量缓存
+    - {model}.f32：行优先的 float32 矩阵，只追加
+    - {model}.index.sqlite3：文本哈希到行号的索引，以及向量维度
+    先写入并刷盘矩阵行，再提交索引，崩溃后索引不会指向不完整的行
+    新行的行号取自矩阵文件的实际大小（而不是进程内计数），分配行号、追加和提交索引在同一个跨进程锁内完成
+    """
+
+    def __init__(self, cache_dir: PathLike, model_name: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        self.matrix_path = self.cache_dir / f"{slug}.f32"
+        self.index_path = self.cache_dir / f"{slug}.index.sqlite3"
+        self.lock_path = self.cache_dir / f"{slug}.lock"
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+        self.dim: Optional[int] = self._stored_dim()
+        self._rows = 0
+        self._matrix: Optional[np.memmap] = None
+        if self.dim:
+            self._rows = self._file_rows()
+
+    @staticmethod
+    def make_key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """按输入顺序返回缓存的向量，未命中的位置为 None"""
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        keys = [self.make_key(text) for text in texts]
+
+        with self._lock:
+            if self.dim is None:
+                # 其他进程可能已经写入了第一批向量
+                self.dim = self._stored_dim()
+            if self.dim is None:
+                self.misses += len(texts)
+                return results
+
+            rows: Dict[bytes, int] = {}
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), _SQL_BATCH):
+                batch = unique_keys[start : start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._conn.execute(
+                    f"SELECT key, row FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall())
+            if not rows:
+                self.misses += len(texts)
+                return results
+            if max(rows.values()) >= self._rows:
+                # 索引指向其他进程追加的行：按文件大小刷新行数（索引只在行写入并刷盘后提交）
+                self._rows = max(self._rows, self._file_rows())
+
+            matrix = self._mapped()
+            for i, key in enumerate(keys):
+                row = rows.get(key)
+                if row is not None and row < self._rows:
+                    results[i] = np.array(matrix[row])
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Any]):
+        """追加新向量；已存在的文本会被忽略"""
+        if not texts:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got shape {vectors.shape}")
+
+        with self._lock, self._matrix_lock() as f:
+            if self.dim is None:
+                self.dim = self._stored_dim()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+                self._conn.commit()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}")
+
+            # 同一批内的重复文本以及已缓存的文本只写一次
+            new_keys, new_rows, seen = [], [], set()
+            for i, text in enumerate(texts):
+                key = self.make_key(text)
+                if key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(i)
+
+            # 持有锁时文件大小就是所有进程已完成写入的行数；不整除时是某个写入者崩溃留下的半行，截掉
+            row_bytes = self.dim * 4
+            size = os.fstat(f.fileno()).st_size
+            first_row = size // row_bytes
+            if size != first_row * row_bytes:
+                logger.warning(f"截断向量缓存中不完整的尾部: {self.matrix_path}")
+                os.ftruncate(f.fileno(), first_row * row_bytes)
+            self._rows = first_row
+
+            existing = set()
+            for start in range(0, len(new_keys), _SQL_BATCH):
+                batch = new_keys[start : start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(key for key, row in self._conn.execute(
+                    f"SELECT key, row FROM embeddings WHERE key IN ({placeholders})", batch
+                ) if row < first_row)
+            pairs = [(key, i) for key, i in zip(new_keys, new_rows) if key not in existing]
+            if not pairs:
+                return
+
+            f.write(vectors[[i for _, i in pairs]].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, row) VALUES (?, ?)",
+                [(key, first_row + offset) for offset, (key, _) in enumerate(pairs)],
+            )
+            self._conn.commit()
+            self._rows = first_row + len(pairs)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.commit()
+            self._matrix = None
+            self._rows = 0
+            self.dim = None
+            if self.matrix_path.exists():
+                self.matrix_path.unlink()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "path": str(self.matrix_path),
+            "entries": self._rows,
+            "dim": self.dim,
+            "size_bytes": self._rows * (self.dim or 0) * 4,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _stored_dim(self) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _file_rows(self) -> int:
+        """矩阵文件中完整的行数；不完整的尾部（其他进程正在写入或崩溃留下）由 put_many 在锁内截断"""
+        size = self.matrix_path.stat().st_size if self.matrix_path.exists() else 0
+        return size // (self.dim * 4)
+
+    @contextmanager
+    def _matrix_lock(self) -> Iterator[BinaryIO]:
+        """
+        以追加方式打开矩阵文件并持有跨进程排它锁
+        POSIX 对矩阵文件本身 fcntl.flock；Windows 没有 flock，改为锁同目录的 .lock 文件
+        """
+        with open(self.matrix_path, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield f
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                return
+
+            with open(self.lock_path, "a+b") as lock:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield f
+                finally:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _mapped(self) -> np.memmap:
+        """返回覆盖当前所有行的只读内存映射，文件增长后重新映射"""
+        if self._matrix is None or len(self._matrix) < self._rows:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._matrix
+
+
+class CachedEmbeddingFunction:
+    """
+    包装 Chroma 的 Embedding 函数：先查 EmbeddingCache，只对未命中的文本调用模型
+    其余属性（name、get_config、embed_query 等）转发给被包装的函数，查询向量不写入磁盘缓存
+    """
+
+    def __init__(self, embedding_fn: Any, cache: EmbeddingCache):
+        self.embedding_fn = embedding_fn
+        self.cache = cache
+
+    def __call__(self, input: Sequence[str]) -> List[List[float]]:
+        texts = list(input)
+        cached = self.cache.get_many(texts)
+
+        # 同一批中重复的文本只计算一次
+        missing: Dict[str, List[int]] = {}
+        for i, vector in enumerate(cached):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+        if missing:
+            missing_texts = list(missing)
+            computed = self.embedding_fn(missing_texts)
+            self.cache.put_many(missing_texts, computed)
+            for text, vector in zip(missing_texts, computed):
+                for i in missing[text]:
+                    cached[i] = np.asarray(vector, dtype=np.float32)
+
+        return [vector.tolist() for vector in cached]
+
+    def __getattr__(self, name: str):
+        return getattr(self.embedding_fn, name)
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, cache_dir: Optional[PathLike] = None) -> Optional[EmbeddingCache]:
+    """
+    获取进程级共享的 EmbeddingCache
+    目录默认取 EMBEDDING_CACHE_DIR，其次 DATA_DIR/embedding_cache；EMBEDDING_CACHE=0 或两者都未配置时返回 None
+    """
+    load_dotenv()
+    if os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return None
+
+    if cache_dir is None:
+        cache_dir = os.getenv("EMBEDDING_CACHE_DIR")
+        if not cache_dir:
+            data_dir = os.getenv("DATA_DIR")
+            if not data_dir:
+                return None
+            cache_dir = os.path.join(data_dir, "embedding_cache")
+
+    key = f"{os.path.abspath(cache_dir)}::{model_name}"
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(cache_dir, model_name)
+            _caches[key] = cache
+        return cache
+
+
+def embedding_cache_stats() -> List[Dict[str, Any]]:
+    """所有已打开缓存的统计信息，用于 /api/status"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return [cache.stats() for cache in caches]
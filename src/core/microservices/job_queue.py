@@ -0,0 +1,265 @@
+import os
+import json
+import uuid
+import logging
+import time
+import threading
+import traceback
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+PathLike = Union[str, Path]
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# 一个流水线阶段：(阶段名, 可调用对象)。可调用对象接收共享的 context 字典，
+# 返回的字典会合并回 context，供后续阶段使用。
+# 长时间运行的阶段可以调用 context["report"](fraction)（0~1）报告阶段内进度
+Stage = Tuple[str, Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]]
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _timestamp(value: Optional[str]) -> float:
+    """_now() 格式的时间转为时间戳，缺失或无法解析时视为最旧"""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class JobManager:
+    """
+    后台任务队列：在有界线程池中执行 PDF → Markdown → chunks → vectors 等流水线阶段
+    - submit 立即返回 job_id，不阻塞事件循环
+    - 每个任务的状态和进度持久化为 jobs_dir/{job_id}.json，服务重启后仍可查询
+    - 重启时仍处于 queued/running 的任务会被标记为 failed（进程中断）
+    - 已结束的任务保留 retention_seconds 秒，最多保留 max_finished 个，超出的在提交新任务和启动时清理
+    """
+
+    def __init__(
+        self,
+        jobs_dir: Optional[PathLike] = None,
+        max_workers: Optional[int] = None,
+        retention_seconds: Optional[float] = None,
+        max_finished: Optional[int] = None,
+    ):
+        load_dotenv()
+        if jobs_dir is None:
+            data_dir = os.getenv("DATA_DIR")
+            jobs_dir = os.path.join(data_dir, "jobs") if data_dir else None
+
+        self.jobs_dir: Optional[Path] = Path(jobs_dir) if jobs_dir else None
+        if self.jobs_dir:
+            self.jobs_dir.mkdir(parents=True, exist_ok=True)
+
+        self.max_workers = max_workers or int(os.getenv("JOB_WORKERS", "2"))
+        # 0 表示不限制
+        self.retention_seconds = (
+            retention_seconds if retention_seconds is not None else float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+        )
+        self.max_finished = max_finished if max_finished is not None else int(os.getenv("JOB_MAX_FINISHED", "1000"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline-job")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self._load_persisted_jobs()
+        self._prune()
+
+    def submit(self, job_type: str, username: str, stages: List[Stage], params: Optional[Dict[str, Any]] = None) -> str:
+        """提交一个由多个阶段组成的任务，立即返回 job_id"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "job_type": job_type,
+            "username": username,
+            "params": params or {},
+            "status": JOB_QUEUED,
+            "stages": [name for name, _ in stages],
+            "current_stage": None,
+            "completed_stages": [],
+            "progress": 0.0,
+            "result": None,
+            "error": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        self._prune()
+        with self._lock:
+            self._jobs[job_id] = job
+        self._persist(job)
+
+        future = self._executor.submit(self._run, job_id, stages)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget_future(job_id))
+        logger.info(f"任务已提交: {job_id} ({job_type}, user={username})")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """返回任务状态的副本，不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按创建时间倒序列出任务，可按用户过滤"""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if username is None or job["username"] == username]
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列状态，用于 /api/status"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "max_workers": self.max_workers,
+            "jobs_dir": str(self.jobs_dir) if self.jobs_dir else None,
+            "jobs": counts,
+        }
+
+    def shutdown(self, wait: bool = False):
+        """
+        停止任务队列：尚未开始的任务被取消并标记为 failed；
+        wait=True 时等待运行中的任务结束并保存最终状态，而不是随进程退出被中断
+        """
+        with self._lock:
+            futures = list(self._futures.items())
+        for job_id, future in futures:
+            if future.cancel():
+                self._update(job_id, status=JOB_FAILED, error="服务关闭，任务未开始", finished_at=_now())
+        self._executor.shutdown(wait=wait)
+
+    def _forget_future(self, job_id: str):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _stage_reporter(self, job_id: str, index: int, stage_count: int) -> Callable[[float], None]:
+        """阶段内进度回调：report(fraction) 把任务进度更新为 (index + fraction) / stage_count，最多每秒保存一次"""
+        last_persist = 0.0
+
+        def report(fraction: float):
+            nonlocal last_persist
+            fraction = min(max(float(fraction), 0.0), 1.0)
+            with self._lock:
+                job = self._jobs[job_id]
+                job["progress"] = round((index + fraction) / stage_count, 4)
+            now = time.monotonic()
+            if now - last_persist >= 1.0:
+                last_persist = now
+                self._persist(job)
+
+        return report
+
+    def _run(self, job_id: str, stages: List[Stage]):
+        context: Dict[str, Any] = dict(self._jobs[job_id]["params"])
+        self._update(job_id, status=JOB_RUNNING, started_at=_now())
+
+        try:
+            for index, (name, func) in enumerate(stages):
+                self._update(job_id, current_stage=name)
+                logger.info(f"任务 {job_id} 开始阶段: {name}")
+                context["report"] = self._stage_reporter(job_id, index, len(stages))
+
+                output = func(context)
+                if output:
+                    context.update(output)
+
+                with self._lock:
+                    job = self._jobs[job_id]
+                    job["completed_stages"] = job["completed_stages"] + [name]
+                    job["progress"] = round((index + 1) / len(stages), 4)
+                self._persist(self._jobs[job_id])
+
+            params = self._jobs[job_id]["params"]
+            result = {key: value for key, value in context.items() if key not in params and key != "report"}
+            self._update(job_id, status=JOB_SUCCEEDED, current_stage=None, result=result, finished_at=_now())
+            logger.info(f"✅ 任务完成: {job_id}")
+        except Exception as e:
+            logger.error(f"任务 {job_id} 失败: {e}")
+            traceback.print_exc()
+            self._update(job_id, status=JOB_FAILED, error=str(e), finished_at=_now())
+
+    def _prune(self):
+        """删除过期（finished_at 早于保留期）或超出数量上限（最旧的先删）的已结束任务及其状态文件"""
+        with self._lock:
+            finished = sorted(
+                (job for job in self._jobs.values() if job["status"] in FINISHED_STATUSES),
+                key=lambda job: job.get("finished_at") or "",
+            )
+            expired = []
+            if self.retention_seconds > 0:
+                cutoff = datetime.now().timestamp() - self.retention_seconds
+                expired = [job for job in finished if _timestamp(job.get("finished_at")) < cutoff]
+            overflow = len(finished) - len(expired) - self.max_finished
+            if self.max_finished > 0 and overflow > 0:
+                expired += finished[len(expired) : len(expired) + overflow]
+            for job in expired:
+                del self._jobs[job["job_id"]]
+
+        for job in expired:
+            if self.jobs_dir:
+                try:
+                    (self.jobs_dir / f"{job['job_id']}.json").unlink(missing_ok=True)
+                except OSError as e:
+                    logger.warning(f"删除任务文件失败 {job['job_id']}: {e}")
+        if expired:
+            logger.info(f"已清理 {len(expired)} 个已结束的任务")
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+        self._persist(job)
+
+    def _persist(self, job: Dict[str, Any]):
+        if not self.jobs_dir:
+            return
+        try:
+            with self._lock:
+                payload = json.dumps(job, ensure_ascii=False, indent=2, default=str)
+            job_path = self.jobs_dir / f"{job['job_id']}.json"
+            tmp_path = job_path.with_suffix(".json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, job_path)
+        except Exception as e:
+            logger.warning(f"保存任务状态失败 {job.get('job_id')}: {e}")
+
+    def _load_persisted_jobs(self):
+        if not self.jobs_dir:
+            return
+        for job_path in self.jobs_dir.glob("*.json"):
+            try:
+                with open(job_path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except Exception as e:
+                logger.warning(f"读取任务文件失败 {job_path}: {e}")
+                continue
+
+            if job.get("status") in (JOB_QUEUED, JOB_RUNNING):
+                job["status"] = JOB_FAILED
+                job["error"] = "服务重启，任务被中断"
+                job["finished_at"] = _now()
+                self._jobs[job["job_id"]] = job
+                self._persist(job)
+            else:
+                self._jobs[job["job_id"]] = job
@@ -0,0 +1,212 @@
+"""
+Reranker 模块 - 搜索结果的重排序阶段
+第一阶段（向量检索 / 混合检索）只取少量候选，由重排序器决定最终顺序
+- ScoreBlendReranker：按权重融合检索距离、内容长度和标题匹配度，无模型、微秒级
+- CrossEncoderReranker：本地 cross-encoder 对 (query, 文档) 打分，分批执行并受延迟预算约束
+通过 SEARCH_RERANKER 选择（blend / cross_encoder / none）
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from .bm25_index import tokenize
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 候选格式：{"id", "document", "metadata", "distance"}，按第一阶段的顺序排列；distance 可能为 None（仅 BM25 命中）
+
+
+class Reranker:
+    """重排序器基类：给候选加上 rerank_score 并按分数降序返回，同时记录耗时"""
+
+    name = "none"
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.budget_exceeded = 0
+        self._stats_lock = threading.Lock()
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        ranked = self._rerank(query, candidates)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+        return ranked
+
+    def _rerank(self, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for position, candidate in enumerate(candidates):
+            candidate["rerank_score"] = -float(position)
+        return candidates
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "reranker": self.name,
+                "calls": self.calls,
+                "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+                "budget_exceeded": self.budget_exceeded,
+            }
+
+
+class ScoreBlendReranker(Reranker):
+    """
+    score = distance_weight * 相关度 + length_weight * 长度分 + header_weight * 标题匹配度
+    - 相关度：距离归一化到 [0, 1]（越近越高）；缺少距离时按第一阶段名次归一化
+    - 长度分：min(len, target_length) / target_length，只奖励过短的分块补足内容，不会压过相关度
+    - 标题匹配度：查询词项出现在 header_1/2/3 中的比例
+    """
+
+    name = "blend"
+
+    def __init__(
+        self,
+        distance_weight: float = 1.0,
+        length_weight: float = 0.2,
+        header_weight: float = 0.3,
+        target_length: int = 800,
+    ):
+        super().__init__()
+        self.distance_weight = distance_weight
+        self.length_weight = length_weight
+        self.header_weight = header_weight
+        self.target_length = target_length
+
+    def _rerank(self, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not candidates:
+            return candidates
+
+        distances = [candidate.get("distance") for candidate in candidates]
+        use_distance = all(distance is not None for distance in distances)
+        if use_distance:
+            low, high = min(distances), max(distances)
+            spread = (high - low) or 1.0
+
+        query_terms = set(tokenize(query))
+        count = len(candidates)
+        for position, candidate in enumerate(candidates):
+            if use_distance:
+                relevance = 1.0 - (candidate["distance"] - low) / spread
+            else:
+                relevance = 1.0 - position / count
+
+            length_score = min(len(candidate["document"] or ""), self.target_length) / self.target_length
+
+            header_score = 0.0
+            if query_terms:
+                meta = candidate.get("metadata") or {}
+                header_terms = set(tokenize(" ".join(str(meta.get(key) or "") for key in ("header_1", "header_2", "header_3"))))
+                header_score = len(query_terms & header_terms) / len(query_terms)
+
+            candidate["rerank_score"] = (
+                self.distance_weight * relevance
+                + self.length_weight * length_score
+                + self.header_weight * header_score
+            )
+
+        return sorted(candidates, key=lambda candidate: candidate["rerank_score"], reverse=True)
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    本地 cross-encoder 重排序（sentence_transformers.CrossEncoder，首次使用时加载）
+    按 batch_size 分批打分；累计耗时超过 budget_ms 后停止打分，
+    未打分的候选保持第一阶段顺序排在已打分候选之后
+    """
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str, batch_size: int = 16, budget_ms: float = 200.0):
+        super().__init__()
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"加载 cross-encoder 模型: {self.model_name}")
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def _rerank(self, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not candidates:
+            return candidates
+        model = self._get_model()
+
+        start = time.perf_counter()
+        scored = 0
+        for offset in range(0, len(candidates), self.batch_size):
+            if (time.perf_counter() - start) * 1000 > self.budget_ms:
+                with self._stats_lock:
+                    self.budget_exceeded += 1
+                break
+            batch = candidates[offset : offset + self.batch_size]
+            scores = model.predict([(query, candidate["document"] or "") for candidate in batch])
+            for candidate, score in zip(batch, scores):
+                candidate["rerank_score"] = float(score)
+            scored += len(batch)
+
+        ranked = sorted(candidates[:scored], key=lambda candidate: candidate["rerank_score"], reverse=True)
+        for candidate in candidates[scored:]:
+            candidate["rerank_score"] = None
+        return ranked + candidates[scored:]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({"model": self.model_name, "batch_size": self.batch_size, "budget_ms": self.budget_ms})
+        return stats
+
+
+_rerankers: Dict[str, Reranker] = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(name: Optional[str] = None) -> Reranker:
+    """
+    获取进程内共享的重排序器
+    名称默认取 SEARCH_RERANKER（blend）；cross_encoder 的模型、批大小和延迟预算
+    分别由 RERANK_MODEL、RERANK_BATCH_SIZE、RERANK_BUDGET_MS 配置。
+    cross-encoder 依赖 sentence-transformers，未安装时退回 blend
+    """
+    name = name or os.getenv("SEARCH_RERANKER", "blend")
+    reranker = _rerankers.get(name)
+    if reranker is not None:
+        return reranker
+
+    with _rerankers_lock:
+        reranker = _rerankers.get(name)
+        if reranker is not None:
+            return reranker
+
+        if name == "blend":
+            reranker = ScoreBlendReranker()
+        elif name == "cross_encoder":
+            try:
+                import sentence_transformers  # noqa: F401
+                reranker = CrossEncoderReranker(
+                    os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                    batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+                    budget_ms=float(os.getenv("RERANK_BUDGET_MS", "200")),
+                )
+            except ImportError:
+                logger.warning("未安装 sentence-transformers，cross_encoder 重排序退回 blend")
+                reranker = ScoreBlendReranker()
+        elif name == "none":
+            reranker = Reranker()
+        else:
+            raise ValueError(f"Unsupported reranker: {name}")
+
+        _rerankers[name] = reranker
+        return reranker
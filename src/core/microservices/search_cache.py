@@ -0,0 +1,123 @@
+"""
+Search Cache 模块 - 语义搜索的两级进程内缓存
+- 查询向量 LRU：(模型, 查询文本) -> 向量，跳过重复查询的 embedding 计算
+- 结果 LRU：(集合, 集合版本, 模式, 重排序器, 范围, 查询, n) -> 搜索结果，跳过 HNSW 查询和重排序
+集合每次重新索引都会换一个新版本号，旧版本的结果不会再被命中，并被主动清理
+"""
+
+import os
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class SearchCache:
+    """线程安全的两级 LRU，结果键的第一项固定为集合标识 (db_path, collection_name)，用于按集合失效"""
+
+    def __init__(self, max_embeddings: int = 1024, max_results: int = 2048):
+        self._embeddings = _LRU(max_embeddings)
+        self._results = _LRU(max_results)
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def get_embedding(self, model_name: str, query_text: str) -> Optional[Any]:
+        with self._lock:
+            return self._embeddings.get((model_name, query_text))
+
+    def put_embedding(self, model_name: str, query_text: str, embedding: Any):
+        with self._lock:
+            self._embeddings.put((model_name, query_text), embedding)
+
+    def get_results(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            results = self._results.get(key)
+        return copy.deepcopy(results) if results is not None else None
+
+    def put_results(self, key: Tuple, results: Dict[str, Any]):
+        with self._lock:
+            self._results.put(key, copy.deepcopy(results))
+
+    def invalidate(self, collection_key: Tuple[str, str]):
+        """删除某个集合的所有缓存结果（重新索引后调用）"""
+        with self._lock:
+            stale = [key for key in self._results.entries if key[0] == collection_key]
+            for key in stale:
+                del self._results.entries[key]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._embeddings.entries.clear()
+            self._results.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "query_embeddings": self._embeddings.stats(),
+                "results": self._results.stats(),
+                "invalidations": self.invalidations,
+            }
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_configured = False
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    获取进程级共享的 SearchCache；SEARCH_CACHE=0 时返回 None
+    容量由 SEARCH_EMBEDDING_CACHE_SIZE（默认 1024）和 SEARCH_RESULT_CACHE_SIZE（默认 2048）控制
+    """
+    global _search_cache, _search_cache_configured
+    if _search_cache_configured:
+        return _search_cache
+    with _search_cache_lock:
+        if not _search_cache_configured:
+            load_dotenv()
+            if os.getenv("SEARCH_CACHE", "1") != "0":
+                _search_cache = SearchCache(
+                    max_embeddings=int(os.getenv("SEARCH_EMBEDDING_CACHE_SIZE", "1024")),
+                    max_results=int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "2048")),
+                )
+            _search_cache_configured = True
+        return _search_cache
@@ -1,23 +1,173 @@
 import json
 import os
+import time
+import queue
+import heapq
+import uuid
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Any, Iterator, Iterable, Callable
 import chromadb
 from chromadb.utils import embedding_functions
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .embedding_cache import CachedEmbeddingFunction, embedding_cache_stats, get_embedding_cache
+from .reranker import Reranker, get_reranker
+from .search_cache import get_search_cache
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# all-MiniLM-L6-v2 是一个轻量且高效的通用模型，适合处理中英双语或专业书籍
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# 目录范围元数据（见 merge_toc_content.tag_chunks_with_toc），不参与分块 id
+SCOPE_KEYS = ("chapter_number", "section_id", "sub_section_id", "page")
+
+_embedding_functions: Dict[str, Any] = {}
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_function(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    获取进程内共享的 Embedding 函数
+    SentenceTransformer 模型只从磁盘加载一次，之后所有 VectorStorageManager 复用同一个实例
+    配置了向量缓存时（见 embedding_cache.get_embedding_cache）先查磁盘缓存，只对未见过的文本调用模型
+    """
+    embedding_fn = _embedding_functions.get(model_name)
+    if embedding_fn is not None:
+        return embedding_fn
+
+    with _embedding_lock:
+        embedding_fn = _embedding_functions.get(model_name)
+        if embedding_fn is None:
+            logger.info(f"加载 Embedding 模型: {model_name}")
+            embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=model_name
+            )
+            cache = get_embedding_cache(model_name)
+            if cache is not None:
+                embedding_fn = CachedEmbeddingFunction(embedding_fn, cache)
+            _embedding_functions[model_name] = embedding_fn
+        return embedding_fn
+
+
+# 存储布局
+# - per_collection：每个集合一个独立的数据库文件夹 db_path/{collection}/（旧布局）
+# - shared：db_path 下一个共享的 PersistentClient 保存该用户的所有集合
+LAYOUT_PER_COLLECTION = "per_collection"
+LAYOUT_SHARED = "shared"
+
+_chroma_clients: Dict[str, Any] = {}
+_chroma_clients_lock = threading.Lock()
+
+
+def get_shared_chroma_client(db_path: str):
+    """
+    获取 db_path 对应的进程内共享 PersistentClient（shared 布局）
+    设置了 VECTOR_MEMORY_LIMIT_MB 时按 LRU 卸载不常用集合的 HNSW 索引，限制常驻内存
+    """
+    key = os.path.abspath(db_path)
+    with _chroma_clients_lock:
+        client = _chroma_clients.get(key)
+        if client is None:
+            Path(key).mkdir(parents=True, exist_ok=True)
+            memory_limit_mb = os.getenv("VECTOR_MEMORY_LIMIT_MB")
+            if memory_limit_mb:
+                settings = chromadb.config.Settings(
+                    chroma_segment_cache_policy="LRU",
+                    chroma_memory_limit_bytes=int(float(memory_limit_mb) * 1024 * 1024),
+                )
+                client = chromadb.PersistentClient(path=key, settings=settings)
+            else:
+                client = chromadb.PersistentClient(path=key)
+            _chroma_clients[key] = client
+        return client
+
+
+def _stop_chroma_client(client, name: str):
+    """
+    释放 ChromaDB 客户端（SQLite 连接与 HNSW 索引），尽力而为
+    Chroma 按路径缓存 System 实例，停止后需要同时移出缓存，否则下次打开同一路径会拿到已停止的实例
+    """
+    try:
+        system = getattr(client, "_system", None)
+        identifier = getattr(client, "_identifier", None)
+        if system is not None:
+            system.stop()
+        shared_cache = getattr(chromadb.api.client.SharedSystemClient, "_identifier_to_system", None)
+        if shared_cache is not None and identifier in shared_cache:
+            shared_cache.pop(identifier, None)
+    except Exception as e:
+        logger.warning(f"关闭 '{name}' 的客户端失败: {e}")
+
+
+def bm25_index_path(db_path: str, collection_name: str, layout: str) -> str:
+    """集合配套的 BM25 索引文件：per_collection 放在集合文件夹内，shared 放在 db_path/bm25/ 下"""
+    if layout == LAYOUT_SHARED:
+        return os.path.join(db_path, "bm25", f"{collection_name}.json")
+    return os.path.join(db_path, collection_name, "bm25.json")
+
+
+def close_shared_chroma_clients():
+    """关闭所有共享的 PersistentClient，在服务关闭时调用"""
+    with _chroma_clients_lock:
+        clients = list(_chroma_clients.items())
+        _chroma_clients.clear()
+    for path, client in clients:
+        _stop_chroma_client(client, path)
+
+
+def build_scope_filter(
+    chapter_number: Optional[int] = None,
+    section_id: Optional[str] = None,
+    page_start: Optional[int] = None,
+    page_end: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    把目录范围编译成 Chroma where 过滤条件，没有任何条件时返回 None
+    - section_id 为 "1.8" 时匹配该小节及其所有子小节；"1.8.2" 这样的三级编号匹配 sub_section_id
+    - 页码范围按分块所属目录节点的起始页过滤
+    """
+    clauses: List[Dict[str, Any]] = []
+    if chapter_number is not None:
+        clauses.append({"chapter_number": chapter_number})
+    if section_id:
+        field = "sub_section_id" if section_id.count(".") >= 2 else "section_id"
+        clauses.append({field: section_id})
+    if page_start is not None:
+        clauses.append({"page": {"$gte": page_start}})
+    if page_end is not None:
+        clauses.append({"page": {"$lte": page_end}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
 class VectorStorageManager:
-    def __init__(self, collection_name: str, db_path: Optional[str] = None):
+    def __init__(
+        self,
+        collection_name: str,
+        db_path: Optional[str] = None,
+        embedding_fn: Optional[Any] = None,
+        layout: Optional[str] = None,
+    ):
         """
         初始化向量数据库管理
         :param collection_name: 向量集合名称
         :param db_path: 本地数据库存储路径前缀（可选，默认使用 DATA_DIR/chroma_db）
+        :param embedding_fn: Embedding 函数（可选，默认使用进程内共享的 SentenceTransformer）
+        :param layout: 存储布局 per_collection 或 shared（可选，默认使用 VECTOR_STORE_LAYOUT 或 per_collection）
         """
         load_dotenv()
         self.collection_name = collection_name
@@ -29,18 +179,24 @@ class VectorStorageManager:
                 raise ValueError("DATA_DIR 环境变量未配置")
             db_path = os.path.join(data_dir, "chroma_db")
         
-        # 为每个 collection 创建单独的 db 文件夹
-        self.db_path = os.path.join(db_path, collection_name)
-        Path(self.db_path).mkdir(parents=True, exist_ok=True)
-        
+        self.layout = layout or os.getenv("VECTOR_STORE_LAYOUT", LAYOUT_PER_COLLECTION)
+        if self.layout not in (LAYOUT_PER_COLLECTION, LAYOUT_SHARED):
+            raise ValueError(f"Unsupported vector store layout: {self.layout}")
+
         # 1. 初始化 ChromaDB 持久化客户端
-        self.client = chromadb.PersistentClient(path=self.db_path)
+        if self.layout == LAYOUT_SHARED:
+            # 该路径下的所有集合共用一个客户端，由 close_shared_chroma_clients 统一关闭
+            self.db_path = db_path
+            self.client = get_shared_chroma_client(db_path)
+        else:
+            # 为每个 collection 创建单独的 db 文件夹
+            self.db_path = os.path.join(db_path, collection_name)
+            Path(self.db_path).mkdir(parents=True, exist_ok=True)
+            self.client = chromadb.PersistentClient(path=self.db_path)
         
-        # 2. 定义 Embedding 函数 (使用本地 Sentence-Transformers 模型)
-        # all-MiniLM-L6-v2 是一个轻量且高效的通用模型，适合处理中英双语或专业书籍
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # 2. 定义 Embedding 函数 (使用本地 Sentence-Transformers 模型，进程内共享)
+        self.embedding_fn = embedding_fn or get_embedding_function()
+        self.embedding_key = DEFAULT_EMBEDDING_MODEL if embedding_fn is None else f"custom-{id(embedding_fn)}"
         
         # 3. 创建或获取集合
         self.collection = self.client.get_or_create_collection(
@@ -48,102 +204,482 @@ class VectorStorageManager:
             embedding_function=self.embedding_fn
         )
 
+        # 4. 配套的 BM25 词法索引（首次使用时加载）
+        self.bm25_path = bm25_index_path(db_path, collection_name, self.layout)
+        self._bm25: Optional[BM25Index] = None
+        self._bm25_lock = threading.Lock()
+
+        # 5. 集合版本：每次写入后更换，搜索结果缓存以此区分新旧索引
+        self.cache_key = (self.db_path, collection_name)
+        self.version = uuid.uuid4().hex
+
     def load_chunks(self, json_path: str) -> List[Dict]:
-        """读取 chunks.json 文件"""
+        """读取 chunks.json（JSON 数组）或 chunks.jsonl（每行一个分块）文件"""
+        return list(self.iter_chunks(json_path))
+
+    def iter_chunks(self, json_path: str) -> Iterator[Dict]:
+        """
+        逐个读取分块；.jsonl 文件按行惰性读取，不会把整本书载入内存
+        文件不存在时立即抛出 FileNotFoundError，而不是等到第一次迭代
+        """
         if not os.path.exists(json_path):
             raise FileNotFoundError(f"找不到分块文件: {json_path}")
+        return self._read_chunks(json_path)
+
+    def count_chunks(self, json_path: str) -> int:
+        """分块文件中的分块数（.jsonl 只数非空行，不解析），用于报告写入进度"""
+        if json_path.endswith(".jsonl"):
+            with open(json_path, "r", encoding="utf-8") as f:
+                return sum(1 for line in f if line.strip())
+        return sum(1 for _ in self.iter_chunks(json_path))
+
+    @staticmethod
+    def _read_chunks(json_path: str) -> Iterator[Dict]:
         with open(json_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+            if json_path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from json.load(f)
+
+    @staticmethod
+    def enrich_chunk(chunk: Dict) -> Tuple[str, Dict]:
+        """
+        标题注入并修复元数据，返回 (enriched_text, metadata)
+        兼容 chunker 直接输出的 {"content", "Header"} 格式（没有 metadata 字段）
+        chunk 带有 scope 时（chapter_number / section_id / sub_section_id / page）一并写入元数据
+        """
+        content = chunk["content"]
+        meta = dict(chunk.get("metadata") or {"header_1": chunk.get("Header", "")}) # 复制一份，避免直接修改原始数据
+
+        # 目录范围（见 merge_toc_content.tag_chunks_with_toc），用于按章节/页码过滤搜索
+        meta.update(chunk.get("scope") or {})
+        
+        # --- 修复逻辑：处理空列表 ---
+        # ChromaDB 元数据不支持空列表。我们将列表转为逗号分隔的字符串。
+        if "referenced_images" in meta:
+            if isinstance(meta["referenced_images"], list):
+                # 如果列表不为空，用逗号拼接；如果为空，设为空字符串
+                meta["referenced_images"] = ", ".join(meta["referenced_images"])
+        
+        # --- 标题路径注入 ---
+        headers = [meta.get("header_1", ""), meta.get("header_2", ""), meta.get("header_3", "")]
+        header_path = " > ".join([h for h in headers if h]).strip()
+        
+        enriched_text = f"Section: {header_path}\nContent: {content}"
+        return enriched_text, meta
+
+    @staticmethod
+    def chunk_id(enriched_text: str, meta: Dict) -> str:
+        """
+        基于内容的稳定分块 id：内容和元数据不变则 id 不变，与分块在书中的位置无关
+        目录范围不参与 id，解析目录后重新标注只需更新元数据，不必重新计算向量
+        """
+        identity = {key: value for key, value in meta.items() if key not in SCOPE_KEYS}
+        payload = enriched_text + "\x00" + json.dumps(identity, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
 
-    def process_and_store(self, chunks: List[Dict]):
+    def identify_chunks(self, chunks: Iterable[Dict], seen_ids: Optional[set] = None) -> Iterator[Tuple[str, str, Dict]]:
+        """
+        惰性产出 (chunk_id, enriched_text, metadata)
+        重复内容（例如书中多次出现的相同段落）按出现顺序追加序号以保证 id 唯一，seen_ids 记录已产出的 id
+        """
+        seen_ids = set() if seen_ids is None else seen_ids
+        for chunk in chunks:
+            enriched_text, meta = self.enrich_chunk(chunk)
+            base_id = self.chunk_id(enriched_text, meta)
+            chunk_id = base_id
+            duplicates = 0
+            while chunk_id in seen_ids:
+                duplicates += 1
+                chunk_id = f"{base_id}_{duplicates}"
+            seen_ids.add(chunk_id)
+            yield chunk_id, enriched_text, meta
+
+    def update_scope(self, chunks: Iterable[Dict], batch_size: Optional[int] = None) -> int:
+        """
+        只更新已入库分块的目录范围元数据：不计算向量，不新增也不删除分块
+        chunks 中不在集合里的分块（例如集合由其他分块文件构建）直接忽略
+        :return: 目录范围有变化的分块数
+        """
+        batch_size = batch_size or int(os.getenv("VECTOR_BATCH_SIZE", "100"))
+        updated = 0
+
+        def flush(batch: List[Tuple[str, Dict]]) -> int:
+            stored = self.collection.get(ids=[chunk_id for chunk_id, _ in batch], include=["metadatas"])
+            stored_scopes = {
+                chunk_id: {key: (meta or {}).get(key) for key in SCOPE_KEYS}
+                for chunk_id, meta in zip(stored["ids"], stored["metadatas"])
+            }
+            # 值为 None 的键会从元数据中删除，清掉旧的范围
+            changed = [(chunk_id, scope) for chunk_id, scope in batch if chunk_id in stored_scopes and stored_scopes[chunk_id] != scope]
+            if changed:
+                self.collection.update(ids=[chunk_id for chunk_id, _ in changed], metadatas=[scope for _, scope in changed])
+            return len(changed)
+
+        batch: List[Tuple[str, Dict]] = []
+        for chunk_id, _, meta in self.identify_chunks(chunks):
+            batch.append((chunk_id, {key: meta.get(key) for key in SCOPE_KEYS}))
+            if len(batch) >= batch_size:
+                updated += flush(batch)
+                batch = []
+        if batch:
+            updated += flush(batch)
+
+        if updated:
+            self._bump_version()
+        logger.info(f"✅ 集合 '{self.collection_name}' 更新了 {updated} 个分块的目录范围。")
+        return updated
+
+    def process_and_store(
+        self,
+        chunks: Iterable[Dict],
+        batch_size: Optional[int] = None,
+        queue_depth: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        mode: str = "skip",
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> int:
         """
         执行标题注入并入库，修复元数据中空列表导致的错误
-        如果集合已有数据，则跳过向量化（幂等性）
+        分块 id 由内容哈希生成（见 chunk_id），与位置无关
+
+        mode:
+        - "skip"（默认）：如果集合已有数据，则跳过向量化（幂等性）
+        - "sync"：增量同步，只对新增/修改的分块计算向量，并删除已不存在的分块，
+          修改少量内容后重新索引只需几秒；未变分块的目录范围有变化时只更新元数据
+          （例如先向量化、后解析目录的流水线）
+
+        生产者/消费者流水线，三个阶段互相重叠：
+        - 调用线程：逐个读取并注入上下文，凑满 batch_size 后提交 embedding 任务（chunks 可以是惰性生成器）
+        - embedding 线程池：并行计算各批次的向量
+        - 写入线程：按提交顺序等待向量结果并 collection.add
+        queue_depth 限制已提交但未写入的批次数，超过时生产者阻塞（背压）
+
+        :param batch_size: 每批分块数（默认 VECTOR_BATCH_SIZE 或 100）
+        :param queue_depth: 最多排队的批次数（默认 VECTOR_QUEUE_DEPTH 或 4）
+        :param embed_workers: embedding 并发线程数（默认 VECTOR_EMBED_WORKERS 或 2）
+        :param mode: "skip" 或 "sync"
+        :param progress: 每写入一批后以已读取的分块数调用（在写入线程中），全部处理完后再调用一次
+        :return: 新写入的分块数
         """
-        # 检查集合是否已有数据
+        if mode not in ("skip", "sync"):
+            raise ValueError(f"Unsupported mode: {mode}")
+
+        existing_scopes: Dict[str, Dict[str, Any]] = {}
         collection_count = self.collection.count()
         if collection_count > 0:
-            logger.info(f"⏭️  集合 '{self.collection_name}' 已存在 {collection_count} 个分块，跳过向量化。")
-            return
-        
-        documents = []
-        metadatas = []
-        ids = []
+            if mode == "skip":
+                # 检查集合是否已有数据
+                logger.info(f"⏭️  集合 '{self.collection_name}' 已存在 {collection_count} 个分块，跳过向量化。")
+                return 0
+            existing = self.collection.get(include=["metadatas"])
+            existing_scopes = {
+                chunk_id: {key: (meta or {}).get(key) for key in SCOPE_KEYS}
+                for chunk_id, meta in zip(existing["ids"], existing["metadatas"])
+            }
 
-        logger.info(f"开始处理 {len(chunks)} 个分块并注入上下文...")
+        bm25 = self.bm25
 
-        for i, chunk in enumerate(tqdm(chunks)):
-            content = chunk["content"]
-            meta = chunk["metadata"].copy() # 复制一份，避免直接修改原始数据
-            
-            # --- 修复逻辑：处理空列表 ---
-            # ChromaDB 元数据不支持空列表。我们将列表转为逗号分隔的字符串。
-            if "referenced_images" in meta:
-                if isinstance(meta["referenced_images"], list):
-                    # 如果列表不为空，用逗号拼接；如果为空，设为空字符串
-                    meta["referenced_images"] = ", ".join(meta["referenced_images"])
-            
-            # --- 标题路径注入 ---
-            headers = [meta.get("header_1", ""), meta.get("header_2", ""), meta.get("header_3", "")]
-            header_path = " > ".join([h for h in headers if h]).strip()
-            
-            enriched_text = f"Section: {header_path}\nContent: {content}"
-            
-            documents.append(enriched_text)
-            metadatas.append(meta)
-            ids.append(f"chunk_{i}")
-
-        # 分批写入数据库
-        batch_size = 100
-        for j in range(0, len(documents), batch_size):
-            self.collection.add(
-                documents=documents[j : j + batch_size],
-                metadatas=metadatas[j : j + batch_size],
-                ids=ids[j : j + batch_size]
+        batch_size = batch_size or int(os.getenv("VECTOR_BATCH_SIZE", "100"))
+        queue_depth = queue_depth or int(os.getenv("VECTOR_QUEUE_DEPTH", "4"))
+        embed_workers = embed_workers or int(os.getenv("VECTOR_EMBED_WORKERS", "2"))
+
+        logger.info(f"开始流水线向量化 (batch_size={batch_size}, queue_depth={queue_depth}, embed_workers={embed_workers})...")
+
+        pending: "queue.Queue" = queue.Queue(maxsize=queue_depth)
+        seen_ids = set()
+        unchanged = 0
+        rescoped: List[Tuple[str, Dict[str, Any]]] = []
+        writer_errors: List[BaseException] = []
+        stored = 0
+
+        def embed_batch(documents, metadatas, ids, processed):
+            return documents, metadatas, ids, self.embedding_fn(documents), processed
+
+        def writer():
+            nonlocal stored
+            while True:
+                future = pending.get()
+                if future is None:
+                    return
+                if writer_errors:
+                    continue  # 已失败：继续取出剩余任务，避免生产者阻塞
+                try:
+                    documents, metadatas, ids, embeddings, processed = future.result()
+                    self.collection.add(
+                        documents=documents,
+                        embeddings=embeddings,
+                        metadatas=metadatas,
+                        ids=ids
+                    )
+                    stored += len(ids)
+                    if progress:
+                        progress(processed)
+                except BaseException as e:
+                    writer_errors.append(e)
+
+        writer_thread = threading.Thread(target=writer, name=f"chroma-writer-{self.collection_name}", daemon=True)
+        writer_thread.start()
+
+        with ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="embedding") as embed_pool:
+            try:
+                documents, metadatas, ids = [], [], []
+                for chunk_id, enriched_text, meta in self.identify_chunks(tqdm(chunks), seen_ids):
+                    if writer_errors:
+                        break
+
+                    if chunk_id in existing_scopes:
+                        unchanged += 1
+                        scope = {key: meta.get(key) for key in SCOPE_KEYS}
+                        if scope != existing_scopes[chunk_id]:
+                            # 值为 None 的键会从元数据中删除，清掉旧的范围
+                            rescoped.append((chunk_id, scope))
+                        continue
+
+                    documents.append(enriched_text)
+                    metadatas.append(meta)
+                    ids.append(chunk_id)
+                    bm25.add(chunk_id, enriched_text)
+
+                    if len(documents) >= batch_size:
+                        pending.put(embed_pool.submit(embed_batch, documents, metadatas, ids, len(seen_ids)))
+                        documents, metadatas, ids = [], [], []
+
+                if documents and not writer_errors:
+                    pending.put(embed_pool.submit(embed_batch, documents, metadatas, ids, len(seen_ids)))
+            finally:
+                pending.put(None)
+                writer_thread.join()
+
+        if writer_errors:
+            bm25.load()  # 丢弃未写入向量库的分块
+            if stored:
+                self._bump_version()
+            raise writer_errors[0]
+
+        # 增量同步：删除已不存在（被删除或被修改）的旧分块
+        removed_ids = list(existing_scopes.keys() - seen_ids)
+        for j in range(0, len(removed_ids), batch_size):
+            self.collection.delete(ids=removed_ids[j : j + batch_size])
+        for chunk_id in removed_ids:
+            bm25.remove(chunk_id)
+        bm25.save()
+
+        # 目录范围变化：只更新元数据
+        for j in range(0, len(rescoped), batch_size):
+            batch = rescoped[j : j + batch_size]
+            self.collection.update(ids=[chunk_id for chunk_id, _ in batch], metadatas=[scope for _, scope in batch])
+
+        if stored or removed_ids or rescoped:
+            self._bump_version()
+        if progress:
+            progress(len(seen_ids))
+
+        if mode == "sync":
+            logger.info(
+                f"✅ 增量同步完成：新增 {stored}，未变 {unchanged}（其中 {len(rescoped)} 个更新目录范围），删除 {len(removed_ids)}。"
             )
+        else:
+            logger.info(f"✅ 成功向量化 {stored} 个分块并保存。")
+        return stored
+
+    def embed_query(self, query_text: str):
+        """计算单个查询向量（见 embed_queries）"""
+        return self.embed_queries([query_text])[0]
+
+    def embed_queries(self, query_texts: List[str]) -> List[Any]:
+        """
+        计算查询向量；优先使用 embed_query（查询向量不写入磁盘向量缓存）
+        重复查询命中进程内 LRU，其余查询合并为一次模型前向计算
+        """
+        cache = get_search_cache()
+        embeddings: List[Any] = [None] * len(query_texts)
+        if cache is not None:
+            for i, query_text in enumerate(query_texts):
+                embeddings[i] = cache.get_embedding(self.embedding_key, query_text)
+
+        missing = list(dict.fromkeys(query_texts[i] for i, e in enumerate(embeddings) if e is None))
+        if missing:
+            embed = getattr(self.embedding_fn, "embed_query", None) or self.embedding_fn
+            computed = dict(zip(missing, embed(missing)))
+            for i, query_text in enumerate(query_texts):
+                if embeddings[i] is None:
+                    embeddings[i] = computed[query_text]
+            if cache is not None:
+                for query_text, embedding in computed.items():
+                    cache.put_embedding(self.embedding_key, query_text, embedding)
+        return embeddings
 
-        logger.info(f"✅ 成功向量化 {len(documents)} 个分块并保存。")
+    def _bump_version(self):
+        """集合内容变化后调用：更换版本号并清除该集合的搜索结果缓存"""
+        self.version = uuid.uuid4().hex
+        cache = get_search_cache()
+        if cache is not None:
+            cache.invalidate(self.cache_key)
 
-    def search(self, query_text: str, n_results: int = 3):
-        """执行语义搜索并按内容质量排序"""
-        # 获取更多结果用于重排序
-        fetch_count = min(max(n_results * 3, 10), 50)  # 获取n_results的3倍或最多50个
+    def query_by_embedding(self, query_embedding, n_results: int, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """按距离升序返回最多 n_results 条结果：{"id", "document", "metadata", "distance"}"""
+        return self.query_by_embeddings([query_embedding], n_results, where=where)[0]
+
+    def query_by_embeddings(
+        self,
+        query_embeddings: List[Any],
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """多个查询向量合并为一次 collection.query，按输入顺序返回每个查询的结果；where 为元数据过滤条件"""
+        count = self.collection.count()
+        if count == 0 or not query_embeddings:
+            return [[] for _ in query_embeddings]
         results = self.collection.query(
-            query_texts=[query_text],
-            n_results=fetch_count
+            query_embeddings=list(query_embeddings),
+            n_results=min(n_results, count),
+            where=where,
         )
-        
-        # 如果没有结果，直接返回
-        if not results.get('documents') or len(results['documents']) == 0:
-            return results
-        
-        # 重排序：按distance升序，但优先考虑内容长度
-        documents = results['documents'][0]
-        metadatas = results['metadatas'][0]
-        distances = results.get('distances', [[]])[0]
-        
-        # 创建排序元组列表
-        items = list(zip(documents, metadatas, distances))
-        
-        # 排序策略：先按内容长度（降序），再按distance（升序）
-        # 这样会优先返回内容更丰富的结果
-        items.sort(key=lambda x: (
-            -len(x[0]),  # 内容长度降序（负号使其降序）
-            x[2]          # distance升序
-        ))
-        
-        # 只保留前n_results个结果
-        items = items[:n_results]
-        
-        # 重新拆分回原格式
-        sorted_docs, sorted_metas, sorted_dists = zip(*items) if items else ([], [], [])
-        
-        return {
-            'documents': [list(sorted_docs)],
-            'metadatas': [list(sorted_metas)],
-            'distances': [list(sorted_dists)]
-        }
-    
+        return [
+            [
+                {"id": chunk_id, "document": doc, "metadata": meta or {}, "distance": dist}
+                for chunk_id, doc, meta, dist in zip(ids, documents, metadatas, distances)
+            ]
+            for ids, documents, metadatas, distances in zip(
+                results["ids"],
+                results["documents"],
+                results["metadatas"],
+                results["distances"],
+            )
+        ]
+
+    def search(
+        self,
+        query_text: str,
+        n_results: int = 3,
+        mode: str = "dense",
+        reranker: Optional[Reranker] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        两阶段搜索：先取少量候选，再由重排序器决定最终顺序
+        - dense：向量检索候选
+        - hybrid：BM25 与向量检索的 RRF 融合候选（见 hybrid_candidates）
+        候选数为 min(max(2n, 10), 30)；重排序器默认由 SEARCH_RERANKER 决定（见 reranker.get_reranker）
+        where 限定搜索范围（见 build_scope_filter），只在匹配的分块中检索
+        结果按 (集合, 集合版本, 模式, 重排序器, 范围, 查询, n) 缓存，集合重新索引后自动失效
+        """
+        return self.search_batch([query_text], n_results=n_results, mode=mode, reranker=reranker, where=where)[0]
+
+    def search_batch(
+        self,
+        query_texts: List[str],
+        n_results: int = 3,
+        mode: str = "dense",
+        reranker: Optional[Reranker] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        批量搜索，按输入顺序返回与 search 相同格式的结果
+        命中结果缓存的查询直接返回；其余查询的向量一次算完，并合并为一次 collection.query
+        """
+        if mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unsupported search mode: {mode}")
+        reranker = reranker or get_reranker()
+        cache = get_search_cache()
+
+        batch_results: List[Optional[Dict[str, Any]]] = [None] * len(query_texts)
+        scope_key = json.dumps(where, sort_keys=True) if where else None
+        result_keys = [(self.cache_key, self.version, mode, reranker.name, scope_key, q, n_results) for q in query_texts]
+        if cache is not None:
+            for i, key in enumerate(result_keys):
+                batch_results[i] = cache.get_results(key)
+
+        pending = list(dict.fromkeys(q for q, r in zip(query_texts, batch_results) if r is None))
+        if pending:
+            fetch_count = min(max(n_results * 2, 10), 30)
+            dense_hits = self.query_by_embeddings(self.embed_queries(pending), fetch_count, where=where)
+
+            computed: Dict[str, Dict[str, Any]] = {}
+            for query_text, hits in zip(pending, dense_hits):
+                if mode == "hybrid":
+                    candidates = self.hybrid_candidates(query_text, fetch_count, dense_hits=hits, where=where)
+                else:
+                    candidates = hits
+                ranked = reranker.rerank(query_text, candidates)[:n_results]
+                computed[query_text] = {
+                    'ids': [[hit["id"] for hit in ranked]],
+                    'documents': [[hit["document"] for hit in ranked]],
+                    'metadatas': [[hit["metadata"] for hit in ranked]],
+                    'distances': [[hit["distance"] for hit in ranked]],
+                    'scores': [[hit.get("rerank_score") for hit in ranked]],
+                }
+
+            for i, query_text in enumerate(query_texts):
+                if batch_results[i] is None:
+                    batch_results[i] = computed[query_text]
+                    if cache is not None:
+                        cache.put_results(result_keys[i], computed[query_text])
+        return batch_results
+
+    @property
+    def bm25(self) -> BM25Index:
+        """
+        集合的 BM25 索引；在索引功能之前创建的集合没有索引文件，首次访问时从已存储的文档构建
+        """
+        if self._bm25 is None:
+            with self._bm25_lock:
+                if self._bm25 is None:
+                    index = BM25Index(self.bm25_path)
+                    if not index.exists() and self.collection.count() > 0:
+                        logger.info(f"为集合 '{self.collection_name}' 构建 BM25 索引...")
+                        stored = self.collection.get(include=["documents"])
+                        index.add_many(zip(stored["ids"], stored["documents"]))
+                        index.save()
+                    self._bm25 = index
+        return self._bm25
+
+    def hybrid_candidates(
+        self,
+        query_text: str,
+        fetch_count: int,
+        rrf_k: int = 60,
+        dense_hits: Optional[List[Dict[str, Any]]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        混合检索候选：向量检索和 BM25 各取 fetch_count 个，用 Reciprocal Rank Fusion 合并后取前 fetch_count 个
+        只在 BM25 中命中的分块没有向量距离，distance 为 None；fusion_score 为 RRF 融合分数
+        :param dense_hits: 已经查好的向量检索结果（批量搜索时传入，避免重复查询）
+        :param where: 范围过滤；BM25 不保存元数据，多取一些词法候选后用 collection.get 过滤掉范围外的分块
+        """
+        if dense_hits is None:
+            dense_hits = self.query_by_embedding(self.embed_query(query_text), fetch_count, where=where)
+        if where:
+            lexical_hits = self.bm25.search(query_text, fetch_count * 3)
+            if lexical_hits:
+                in_scope = set(self.collection.get(ids=[chunk_id for chunk_id, _ in lexical_hits], where=where, include=[])["ids"])
+                lexical_hits = [hit for hit in lexical_hits if hit[0] in in_scope][:fetch_count]
+        else:
+            lexical_hits = self.bm25.search(query_text, fetch_count)
+
+        fused = reciprocal_rank_fusion(
+            [[hit["id"] for hit in dense_hits], [chunk_id for chunk_id, _ in lexical_hits]],
+            k=rrf_k,
+        )[:fetch_count]
+
+        by_id = {hit["id"]: hit for hit in dense_hits}
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+        if missing:
+            stored = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, doc, meta in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                by_id[chunk_id] = {"id": chunk_id, "document": doc, "metadata": meta or {}, "distance": None}
+
+        candidates = []
+        for chunk_id, score in fused:
+            if chunk_id in by_id:
+                by_id[chunk_id]["fusion_score"] = score
+                candidates.append(by_id[chunk_id])
+        return candidates
+
     def collection_exists(self) -> bool:
         """检查集合是否存在且有数据"""
         try:
@@ -152,6 +688,227 @@ class VectorStorageManager:
         except Exception:
             return False
 
+    def close(self):
+        """释放 per_collection 布局下独占的客户端；shared 布局的客户端由其他集合共用，不在此关闭"""
+        if self.layout == LAYOUT_SHARED:
+            return
+        _stop_chroma_client(self.client, self.collection_name)
+
+
+class _PoolEntry:
+    """注册表中的一个 manager：最近使用时间、当前租用数，以及是否已被移出注册表（retired）"""
+
+    __slots__ = ("manager", "last_used", "leases", "retired")
+
+    def __init__(self, manager: VectorStorageManager, now: float):
+        self.manager = manager
+        self.last_used = now
+        self.leases = 0
+        self.retired = False
+
+
+class VectorStoreRegistry:
+    """
+    进程级 VectorStorageManager 池
+    - Embedding 模型在进程内只加载一次（可在启动时通过 warmup 预加载）
+    - 按 (db_path, collection_name) 缓存已打开的 Chroma 客户端，LRU 淘汰，超过上限时关闭最久未使用的
+    - 空闲超过 idle_timeout 秒的客户端在下次访问注册表时被关闭
+    - shared 布局下同一用户的所有集合共用一个客户端，淘汰只释放集合句柄
+    - 通过 lease() 租用 manager：租用期间（搜索、长时间的 process_and_store）不会被淘汰或关闭，
+      所有租用都在使用时，池会暂时超过 max_clients，最后一个租用归还时再收缩
+    """
+
+    def __init__(self, max_clients: Optional[int] = None, idle_timeout: Optional[float] = None):
+        self.max_clients = max_clients or int(os.getenv("VECTOR_POOL_SIZE", "16"))
+        self.idle_timeout = idle_timeout or float(os.getenv("VECTOR_POOL_IDLE_SECONDS", "600"))
+        self._managers: "OrderedDict[Tuple[str, str], _PoolEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.search_workers = int(os.getenv("VECTOR_SEARCH_WORKERS", "8"))
+        self._search_pool: Optional[ThreadPoolExecutor] = None
+
+    def warmup(self, model_name: str = DEFAULT_EMBEDDING_MODEL):
+        """预加载 Embedding 模型，避免第一次请求承担模型加载时间"""
+        get_embedding_function(model_name)
+
+    @contextmanager
+    def lease(self, collection_name: str, db_path: Optional[str] = None) -> Iterator[VectorStorageManager]:
+        """
+        租用（或创建并缓存）指定集合的 VectorStorageManager，with 块结束时归还
+        租用中的 manager 不会被 LRU / 空闲淘汰关闭
+        """
+        entry = self._acquire(collection_name, db_path)
+        try:
+            yield entry.manager
+        finally:
+            self._release(entry)
+
+    def _acquire(self, collection_name: str, db_path: Optional[str]) -> _PoolEntry:
+        key = (os.path.abspath(db_path) if db_path else "", collection_name)
+        now = time.monotonic()
+
+        with self._lock:
+            stale = self._evict_idle(now)
+
+            entry = self._managers.get(key)
+            if entry is not None:
+                self._managers.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = _PoolEntry(VectorStorageManager(collection_name, db_path=db_path), now)
+                self._managers[key] = entry
+            entry.leases += 1
+            entry.last_used = now
+            stale += self._evict_overflow()
+
+        for manager in stale:
+            manager.close()
+        return entry
+
+    def _release(self, entry: _PoolEntry):
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            # invalidate 时仍在使用的 manager 由最后一个租用者关闭
+            stale = [entry.manager] if entry.retired and entry.leases == 0 else []
+            stale += self._evict_overflow()
+
+        for manager in stale:
+            manager.close()
+
+    def list_collections(self, db_path: str) -> List[str]:
+        """列出 db_path 下的所有集合名（按当前存储布局）"""
+        if not os.path.isdir(db_path):
+            return []
+        if os.getenv("VECTOR_STORE_LAYOUT", LAYOUT_PER_COLLECTION) == LAYOUT_SHARED:
+            # chromadb 0.6+ 返回集合名，更早的版本返回 Collection 对象
+            return sorted(getattr(c, "name", c) for c in get_shared_chroma_client(db_path).list_collections())
+        return sorted(
+            name for name in os.listdir(db_path)
+            if os.path.isfile(os.path.join(db_path, name, "chroma.sqlite3"))
+        )
+
+    def search_collections(
+        self,
+        query_text: str,
+        db_path: str,
+        collection_names: Optional[List[str]] = None,
+        n_results: int = 5,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        跨集合搜索：并行查询多个集合，按距离做全局 top-k 归并
+        - 查询向量只计算一次，所有集合共用（同一个 Embedding 模型）
+        - 每个集合最多返回 n_results 条并已按距离升序，用堆做 k 路归并后取前 n_results
+        - 单个集合失败不影响其他集合，错误记录在 errors 中
+        - 查询期间租用所有涉及的 manager，集合数超过 max_clients 时池会暂时超出上限
+        :param collection_names: 要搜索的集合（默认该用户的所有集合）
+        :param where: 元数据过滤条件（见 build_scope_filter），对每个集合生效
+        :return: {"results": [...], "searched": [...], "errors": {...}}
+        """
+        available = self.list_collections(db_path)
+        errors: Dict[str, str] = {}
+        if collection_names is None:
+            names = available
+        else:
+            # 不存在的集合不打开（lease 会创建空集合），直接记为错误
+            names = [name for name in collection_names if name in available]
+            errors.update({name: "集合不存在" for name in collection_names if name not in available})
+        if not names:
+            return {"results": [], "searched": [], "errors": errors}
+
+        def query_one(name: str, manager: VectorStorageManager) -> List[Dict[str, Any]]:
+            hits = manager.query_by_embedding(query_embedding, n_results, where=where)
+            for hit in hits:
+                hit["collection_name"] = name
+            return hits
+
+        with self._lock:
+            if self._search_pool is None:
+                self._search_pool = ThreadPoolExecutor(max_workers=self.search_workers, thread_name_prefix="vector-search")
+
+        per_collection = []
+        with ExitStack() as leases:
+            # 提交前先租用所有要查询的 manager：集合数超过 max_clients 时，
+            # 并行查询中打开新集合也不会淘汰另一个线程正在查询的 manager
+            managers: Dict[str, VectorStorageManager] = {}
+            for name in names:
+                try:
+                    managers[name] = leases.enter_context(self.lease(name, db_path=db_path))
+                except Exception as e:
+                    logger.warning(f"打开集合 '{name}' 失败: {e}")
+                    errors[name] = str(e)
+            if not managers:
+                return {"results": [], "searched": [], "errors": errors}
+
+            query_embedding = next(iter(managers.values())).embed_query(query_text)
+            futures = {name: self._search_pool.submit(query_one, name, manager) for name, manager in managers.items()}
+
+            for name, future in futures.items():
+                try:
+                    per_collection.append(future.result())
+                except Exception as e:
+                    logger.warning(f"搜索集合 '{name}' 失败: {e}")
+                    errors[name] = str(e)
+
+        merged = list(islice(heapq.merge(*per_collection, key=lambda hit: hit["distance"]), n_results))
+        return {"results": merged, "searched": [name for name in names if name not in errors], "errors": errors}
+
+    def invalidate(self, collection_name: str, db_path: Optional[str] = None):
+        """移除并关闭指定集合的缓存客户端（例如集合被删除或重建后）；仍被租用时在归还后关闭"""
+        key = (os.path.abspath(db_path) if db_path else "", collection_name)
+        with self._lock:
+            entry = self._managers.pop(key, None)
+            if entry is None:
+                return
+            entry.retired = True
+            if entry.leases:
+                return
+        entry.manager.close()
+
+    def _evict_idle(self, now: float) -> List[VectorStorageManager]:
+        """移出空闲超时且未被租用的 manager，返回待关闭的 manager（在锁外关闭）"""
+        expired = [
+            key for key, entry in self._managers.items()
+            if not entry.leases and now - entry.last_used > self.idle_timeout
+        ]
+        return [self._retire(key) for key in expired]
+
+    def _evict_overflow(self) -> List[VectorStorageManager]:
+        """超过 max_clients 时按 LRU 顺序移出未被租用的 manager，返回待关闭的 manager"""
+        overflow = len(self._managers) - self.max_clients
+        if overflow <= 0:
+            return []
+        idle = [key for key, entry in self._managers.items() if not entry.leases][:overflow]
+        return [self._retire(key) for key in idle]
+
+    def _retire(self, key: Tuple[str, str]) -> VectorStorageManager:
+        entry = self._managers.pop(key)
+        entry.retired = True
+        self.evictions += 1
+        return entry.manager
+
+    def stats(self) -> Dict[str, Any]:
+        """返回连接池状态，用于 /api/status"""
+        with self._lock:
+            return {
+                "open_clients": len(self._managers),
+                "leased_clients": sum(1 for entry in self._managers.values() if entry.leases),
+                "max_clients": self.max_clients,
+                "idle_timeout_seconds": self.idle_timeout,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "layout": os.getenv("VECTOR_STORE_LAYOUT", LAYOUT_PER_COLLECTION),
+                "shared_clients": len(_chroma_clients),
+                "embedding_models_loaded": list(_embedding_functions.keys()),
+                "embedding_cache": embedding_cache_stats(),
+                "reranker": get_reranker().stats(),
+            }
+
 # # --- 运行主流程 ---
 # if __name__ == "__main__":
 #     # 1. 实例化管理器
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Compare the ToC title matchers used by merge_toc_content.map_chunks_to_toc.
+
+Usage:
+  python scripts/benchmark_toc_matching.py --book data/hizan/output/java_short/hybrid_auto
+  python scripts/benchmark_toc_matching.py --book path/to/hybrid_auto --scale 20 --repeat 5
+
+Both matchers are built from the book's chunker_step_1.json and queried with every
+chapter, section and sub-section title of textbook_toc.json, in the same order
+map_chunks_to_toc uses. --scale adds N times as many synthetic headers (numbered
+pseudo-word titles) to simulate a longer book; the ToC stays the same.
+
+Reported per matcher: build time, total lookup time for all nodes, matched nodes, and "verified"
+matches, i.e. nodes whose matched header starts with the node's own number
+("2.1 Values and types" for section 2.1). Agreement counts nodes where both matchers
+returned the same header.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List, Tuple
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.merge_toc_content import (
+    _NUMBER_PREFIX_RE,
+    LinearTitleMatcher,
+    TitleIndex,
+    build_content_map,
+)
+
+
+def toc_queries(toc_data: Dict) -> List[Tuple[str, str]]:
+    """(node number, title) for every ToC node, in reading order."""
+    queries = []
+    for chapter in toc_data.get("chapters", []):
+        queries.append((str(chapter.get("chapter_number", "")), chapter.get("chapter_title", "")))
+        for section in chapter.get("sections", []):
+            queries.append((str(section.get("section_id", "")), section.get("section_title", "")))
+            for sub_section in section.get("sub_sections", []):
+                queries.append((str(sub_section.get("sub_section_id", "")), sub_section.get("sub_section_title", "")))
+    return queries
+
+
+def scaled_content_map(content_map: Dict[str, str], scale: int, seed: int = 0) -> Dict[str, str]:
+    """Add scale * len(content_map) numbered headers made of random pseudo-words."""
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vo", "xi", "zu", "bra", "dre", "gli", "pho", "stu"]
+    # Synthetic headers come first, so a scan has to get past them before reaching the book
+    scaled = {}
+    for i in range(scale * len(content_map)):
+        words = ("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(2, 6)))
+        scaled.setdefault(f"{rng.randint(1, 40)}.{i} " + " ".join(words), f"synthetic {i}")
+    scaled.update(content_map)
+    return scaled
+
+
+def run_matcher(name: str, matcher_cls, content_map: Dict[str, str], queries, repeat: int) -> Dict:
+    # Map content back to its header so both matchers can be compared by header
+    header_by_content = {}
+    for header, content in content_map.items():
+        header_by_content.setdefault(content, header)
+
+    # A fresh matcher per pass, so lazily built structures are paid for in every lookup pass
+    build_ms = lookup_ms = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matcher = matcher_cls(content_map)
+        built = time.perf_counter()
+        results = [matcher.find(title, number) for number, title in queries]
+        done = time.perf_counter()
+        build_ms = min(build_ms, (built - start) * 1000)
+        lookup_ms = min(lookup_ms, (done - built) * 1000)
+
+    headers = [header_by_content.get(content) if content else None for content in results]
+    verified = 0
+    for (number, _), header in zip(queries, headers):
+        match = _NUMBER_PREFIX_RE.match(header.strip()) if header else None
+        if match and number and match.group(1) == number:
+            verified += 1
+
+    return {
+        "matcher": name,
+        "build_ms": round(build_ms, 3),
+        "lookup_ms": round(lookup_ms, 3),
+        "matched": sum(1 for header in headers if header),
+        "verified": verified,
+        "headers": headers,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--book", required=True, help="folder holding textbook_toc.json and chunker_step_1.json")
+    p.add_argument("--chunks", default="chunker_step_1.json", help="chunk file name inside --book")
+    p.add_argument("--scale", type=int, default=0, help="synthetic headers to add, as a multiple of the real ones")
+    p.add_argument("--repeat", type=int, default=3, help="passes per matcher; the fastest build and lookup are reported")
+    p.add_argument("--show-diff", action="store_true", help="print the nodes on which the matchers disagree")
+    args = p.parse_args()
+
+    with open(os.path.join(args.book, "textbook_toc.json"), "r", encoding="utf-8") as f:
+        toc_data = json.load(f)
+    with open(os.path.join(args.book, args.chunks), "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    content_map = scaled_content_map(build_content_map(chunks), args.scale)
+    queries = toc_queries(toc_data)
+    print(f"{len(queries)} ToC nodes, {len(content_map)} headers")
+
+    linear = run_matcher("linear", LinearTitleMatcher, content_map, queries, args.repeat)
+    indexed = run_matcher("indexed", TitleIndex, content_map, queries, args.repeat)
+
+    print(f"{'matcher':<10}{'build ms':>12}{'lookup ms':>12}{'matched':>10}{'verified':>10}")
+    for report in (linear, indexed):
+        print(f"{report['matcher']:<10}{report['build_ms']:>12}{report['lookup_ms']:>12}{report['matched']:>10}{report['verified']:>10}")
+
+    agree = sum(1 for a, b in zip(linear["headers"], indexed["headers"]) if a == b)
+    linear_total = linear["build_ms"] + linear["lookup_ms"]
+    indexed_total = indexed["build_ms"] + indexed["lookup_ms"]
+    print(f"agreement: {agree}/{len(queries)}  build + lookup: {linear_total:.3f} ms vs {indexed_total:.3f} ms")
+
+    if args.show_diff:
+        for (number, title), a, b in zip(queries, linear["headers"], indexed["headers"]):
+            if a != b:
+                print(f"- {number} {title!r}\n    linear:  {a!r}\n    indexed: {b!r}")
+
+
+if __name__ == "__main__":
+    main()
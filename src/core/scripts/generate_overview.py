@@ -93,6 +93,7 @@ def main():
     p.add_argument("--provider", default="openai", choices=["openai", "deepseek", "google"])
     p.add_argument("--model", default=None)
     p.add_argument("--temperature", type=float, default=0.3, help="temperature for JSON generation (defaults to 0.3)")
+    p.add_argument("--no-cache", action="store_true", help="bypass the persistent LLM response cache")
     args = p.parse_args()
 
     if not os.path.exists(args.markdown):
@@ -105,13 +106,14 @@ def main():
     sections = split_sections(md)
 
     # Delegate to the reusable function
-    generate_overview(args.markdown, args.out, args.provider, model_name=args.model, temperature=args.temperature)
+    generate_overview(args.markdown, args.out, args.provider, model_name=args.model, temperature=args.temperature, use_cache=not args.no_cache)
 
 
-def generate_overview(markdown_path: str, out_path: str, provider_str: str = "openai", model_name: str = None, temperature: float = 0.3) -> dict:
+def generate_overview(markdown_path: str, out_path: str, provider_str: str = "openai", model_name: str = None, temperature: float = 0.3, use_cache: bool = True) -> dict:
     """Generate overview JSON from a markdown file.
 
-    Returns the overview dict and writes it to `out_path`.
+    Returns the overview dict and writes it to `out_path`. With `use_cache`, identical section
+    prompts are answered from the persistent LLM response cache.
     """
     if not os.path.exists(markdown_path):
         raise FileNotFoundError(markdown_path)
@@ -127,7 +129,7 @@ def generate_overview(markdown_path: str, out_path: str, provider_str: str = "op
     provider = provider_map[provider_str]
 
     # Create a client; JSON generation uses temperature=0.3 internally, but we still pass temperature to client creation.
-    client = LLMFactory.create_client(provider, model_name=model_name, temperature=temperature)
+    client = LLMFactory.create_client(provider, model_name=model_name, temperature=temperature, use_cache=use_cache)
 
     overview = {"source": os.path.basename(markdown_path), "sections": []}
 
@@ -1,5 +1,7 @@
+import bisect
 import json
 import os
+import re
 from pathlib import Path
 import logging
 
@@ -7,96 +9,244 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def map_chunks_to_toc(toc_path, chunks_path, output_path):
+_NUMBER_PREFIX_RE = re.compile(r"^(?:chapter\s+)?(\d+(?:\.\d+)*)[.:]?\s+", re.IGNORECASE)
+# Appendices and their sections: "Appendix A", "A.1 Translations", "B.2.3 ..."
+_APPENDIX_NUMBER_RE = re.compile(r"^(?:appendix\s+([A-Z])|([A-Z](?:\.\d+)+))\s+", re.IGNORECASE)
+
+
+def clean_title(title):
+    """Cleans title for better matching (lowercase, strip whitespace)"""
+    return str(title).strip().lower()
+
+
+def build_content_map(chunks_data):
+    """Header -> content; chunks sharing a header are concatenated in order"""
+    content_map = {}
+    for chunk in chunks_data:
+        header = chunk.get("Header", "")
+        content = chunk.get("content", "")
+        if header:
+            if header in content_map:
+                content_map[header] += "\n\n" + content
+            else:
+                content_map[header] = content
+    return content_map
+
+
+class LinearTitleMatcher:
+    """
+    The original lookup: exact match, then number-stripped match, then a bidirectional
+    substring scan over every header. O(headers) per miss, so O(nodes x headers) per book.
+    Kept as the baseline for scripts/benchmark_toc_matching.py
+    """
+
+    def __init__(self, content_map):
+        self.content_map = content_map
+        self.normalized_content_map = {clean_title(k): v for k, v in content_map.items()}
+
+    def find(self, title, number=None):
+        norm_title = clean_title(title)
+        if norm_title in self.normalized_content_map:
+            return self.normalized_content_map[norm_title]
+
+        # Try matching without number prefixes (e.g., "1.1 Creativity" -> "creativity")
+        parts = norm_title.split(' ', 1)
+        if len(parts) > 1 and parts[0].replace('.', '').isdigit():
+            sub_title = parts[1]
+            if sub_title in self.normalized_content_map:
+                return self.normalized_content_map[sub_title]
+
+        for header, content in self.content_map.items():
+            if norm_title in clean_title(header) or clean_title(header) in norm_title:
+                return content
+        return ""
+
+
+class TitleIndex:
+    """
+    Precomputed header index for ToC title lookups, built once per book.
+
+    - Exact, number-stripped and compact matches are dictionary hits. Titles are compared
+      as "compact" strings (alphanumerics only), so MinerU spacing artifacts such as
+      "Modi f ying Eclip se" still match.
+    - Anything else goes through a character-trigram inverted index, built on the first such
+      lookup (books whose ToC matches exactly never pay for it). Candidates come from
+      the query's rarest trigrams only, so a lookup touches a handful of headers instead of
+      all of them, and are scored by trigram Dice similarity. A containment match (one title
+      inside the other, as in the old substring fallback) needs at least min_contained_chars
+      characters on the shorter side, so short headers like "A" or "Files" no longer swallow
+      every title that contains them.
+    - When several headers match equally well (every chapter has its own "Glossary"), the one
+      numbered like the ToC node wins, otherwise the earliest.
+    """
+
+    def __init__(self, content_map, min_score=0.75, min_contained_chars=8, candidate_grams=3):
+        self.min_score = min_score
+        self.min_contained_chars = min_contained_chars
+        self.candidate_grams = candidate_grams
+
+        self.contents = []
+        self.numbers = []
+        self.compacts = []
+        self.grams = None
+        self.exact = {}
+        self.by_compact = {}
+        self.postings = None
+        for header, content in content_map.items():
+            index = len(self.contents)
+            self.contents.append(content)
+            norm = clean_title(header)
+            match = _NUMBER_PREFIX_RE.match(norm)
+            self.numbers.append(match.group(1) if match else None)
+            self.exact.setdefault(norm, []).append(index)
+
+            compact = self._compact(norm)
+            self.compacts.append(compact)
+            self.by_compact.setdefault(compact, []).append(index)
+
+    @staticmethod
+    def _compact(norm_title):
+        norm_title = _NUMBER_PREFIX_RE.sub("", norm_title)
+        return re.sub(r"[^0-9a-z\u4e00-\u9fff]", "", norm_title)
+
+    @staticmethod
+    def _grams(compact):
+        if len(compact) < 3:
+            return {compact} if compact else set()
+        return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+    def _build_grams(self):
+        """Trigram postings, built on the first lookup that needs them"""
+        self.grams = [self._grams(compact) for compact in self.compacts]
+        self.postings = {}
+        for index, grams in enumerate(self.grams):
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(index)
+
+    def _pick(self, candidates, number):
+        if number:
+            for candidate in candidates:
+                if self.numbers[candidate] == number:
+                    return candidate
+        return candidates[0]
+
+    def find(self, title, number=None):
+        index = self.lookup(title, number)
+        return self.contents[index] if index is not None else ""
+
+    def lookup(self, title, number=None):
+        """Returns the index of the best matching header, or None. number is the ToC node's id ("2.1")"""
+        norm_title = clean_title(title)
+        number = str(number) if number not in (None, "") else None
+        if norm_title in self.exact:
+            return self._pick(self.exact[norm_title], number)
+
+        parts = norm_title.split(' ', 1)
+        if len(parts) > 1 and parts[0].replace('.', '').isdigit() and parts[1] in self.exact:
+            return self._pick(self.exact[parts[1]], number)
+
+        compact = self._compact(norm_title)
+        if compact in self.by_compact:
+            return self._pick(self.by_compact[compact], number)
+
+        query_grams = self._grams(compact)
+        if not query_grams:
+            return None
+        if self.postings is None:
+            self._build_grams()
+
+        # Any header containing the title (or close to it) shares its rarest trigrams,
+        # while common trigrams such as "ing" are never expanded
+        rare_grams = sorted((g for g in query_grams if g in self.postings), key=lambda g: len(self.postings[g]))
+        candidates = set()
+        for gram in rare_grams[:self.candidate_grams]:
+            candidates.update(self.postings[gram])
+
+        best_key, best_index = None, None
+        for candidate in candidates:
+            header_compact = self.compacts[candidate]
+            shorter = min(len(compact), len(header_compact))
+            if shorter >= self.min_contained_chars and (compact in header_compact or header_compact in compact):
+                score = 1.0
+            else:
+                header_grams = self.grams[candidate]
+                score = 2 * len(query_grams & header_grams) / (len(query_grams) + len(header_grams))
+            if score < self.min_score:
+                continue
+            key = (score, number is not None and self.numbers[candidate] == number, -candidate)
+            if best_key is None or key > best_key:
+                best_key, best_index = key, candidate
+        return best_index
+
+
+def map_chunks_to_toc(toc_path, chunks_path, output_path, content_list_path=None, inline_content=False):
     """
     Maps content from chunker_step_1.json to the structure of textbook_toc.json.
+    Each node receives the contiguous chunks from its heading up to the next node (see
+    align_toc_to_chunks). content_list_path defaults to the MinerU *_content_list.json
+    next to the chunk file.
+
+    By default nodes only store "chunk_start" / "chunk_end" (null when unmatched) and the root
+    records "chunk_source" (the chunk file, relative to output_path) and "chunk_count";
+    read content through llm.textbook_content. inline_content=True writes the text into a
+    "content" field instead, as older versions did.
     """
     try:
         # Load ToC
         with open(toc_path, 'r', encoding='utf-8') as f:
             toc_data = json.load(f)
         
-        # Load Chunks
+        # Load Chunks (JSON array, or one chunk per line for .jsonl)
         with open(chunks_path, 'r', encoding='utf-8') as f:
-            chunks_data = json.load(f)
+            if str(chunks_path).endswith('.jsonl'):
+                chunks_data = [json.loads(line) for line in f if line.strip()]
+            else:
+                chunks_data = json.load(f)
             
         logger.info(f"Loaded {len(chunks_data)} chunks and ToC for '{toc_data.get('book_title', 'Unknown')}'")
 
-        # Create a mapping of section/chapter titles to content
-        # We use a case-insensitive match or substring match if needed, 
-        # but let's start with exact matches on headers.
-        content_map = {}
-        for chunk in chunks_data:
-            header = chunk.get("Header", "")
-            content = chunk.get("content", "")
-            if header:
-                # Store content by header. If multiple chunks have the same header, append them.
-                if header in content_map:
-                    content_map[header] += "\n\n" + content
-                else:
-                    content_map[header] = content
-
-        def clean_title(title):
-            """Cleans title for better matching (lowercase, strip whitespace)"""
-            return str(title).strip().lower()
-
-        # Build a lookup for normalized headers
-        normalized_content_map = {clean_title(k): v for k, v in content_map.items()}
-
-        def find_content(title):
-            """Tries to find content by title in the normalized map"""
-            norm_title = clean_title(title)
-            # Try exact match first
-            if norm_title in normalized_content_map:
-                return normalized_content_map[norm_title]
-            
-            # Try matching without number prefixes (e.g., "1.1 Creativity" -> "creativity")
-            # This is a bit risky but common in textbook output
-            parts = norm_title.split(' ', 1)
-            if len(parts) > 1 and parts[0].replace('.', '').isdigit():
-                sub_title = parts[1]
-                if sub_title in normalized_content_map:
-                    return normalized_content_map[sub_title]
-            
-            # Fallback: check if the title is contained in any header
-            # (Expensive, but might find "1 Why should..." matching "1 Why should you learn to write programs? 1")
-            for header, content in content_map.items():
-                if norm_title in clean_title(header) or clean_title(header) in norm_title:
-                    return content
-                    
-            return ""
-
-        # Recursive function to inject content into ToC nodes
-        def process_node(node):
-            if isinstance(node, dict):
-                # Calculate titles to check
-                titles_to_check = []
-                if "chapter_title" in node:
-                    titles_to_check.append(node["chapter_title"])
-                if "section_title" in node:
-                    titles_to_check.append(node["section_title"])
-                if "sub_section_title" in node:
-                    titles_to_check.append(node["sub_section_title"])
-                
-                # Try to find content
-                node_content = ""
-                for title in titles_to_check:
-                    found = find_content(title)
-                    if found:
-                        node_content = found
-                        break
-                
-                node["content"] = node_content
-                
-                # Recurse into children
-                for key in ["chapters", "sections", "sub_sections"]:
-                    if key in node:
-                        for child in node[key]:
-                            process_node(child)
-
-        # Start processing from root
-        process_node(toc_data)
-        
+        # Pages let the alignment bound each node to its printed page; without them it aligns on headers alone
+        if content_list_path is None:
+            content_list_path = find_content_list(chunks_path)
+        pages = None
+        if content_list_path and os.path.exists(content_list_path):
+            with open(content_list_path, 'r', encoding='utf-8') as f:
+                pages = chunk_pages(chunks_data, json.load(f))
+
+        aligned = align_toc_to_chunks(toc_data, chunks_data, pages)
+        placed = 0
+        title_index = None
+        for entry, start, end in aligned:
+            node = entry["node"]
+            if start is not None:
+                placed += 1
+            else:
+                # Nodes the alignment could not place fall back to a title lookup: the first chunk
+                # carrying the best matching header
+                if title_index is None:
+                    first_chunk = {}
+                    for index, chunk in enumerate(chunks_data):
+                        if chunk.get("Header"):
+                            first_chunk.setdefault(chunk["Header"], index)
+                    title_index = TitleIndex(first_chunk)
+                match = title_index.lookup(entry["title"], entry["number"])
+                if match is not None:
+                    start = title_index.contents[match]
+                    end = start + 1
+
+            if inline_content:
+                node["content"] = "\n\n".join(chunk.get("content", "") for chunk in chunks_data[start:end]) if start is not None else ""
+            else:
+                # References into the chunk file; llm.textbook_content materializes the text on demand
+                node["chunk_start"] = start
+                node["chunk_end"] = end
+
+        if not inline_content:
+            toc_data["chunk_source"] = os.path.relpath(chunks_path, os.path.dirname(os.path.abspath(output_path)))
+            toc_data["chunk_count"] = len(chunks_data)
+
+        logger.info(f"Aligned {placed}/{len(aligned)} ToC nodes to chunk ranges ({'with' if pages else 'without'} page numbers)")
+
         # Save merged data
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(toc_data, f, ensure_ascii=False, indent=4)
@@ -110,6 +260,204 @@ def map_chunks_to_toc(toc_path, chunks_path, output_path):
         traceback.print_exc()
         return False
 
+def _normalize_title(title):
+    """Lowercase, drop a leading "1.2" / "Chapter 3" number and collapse whitespace"""
+    title = _NUMBER_PREFIX_RE.sub("", str(title).strip().lower())
+    return re.sub(r"\s+", " ", title)
+
+
+def flatten_toc(toc_data):
+    """
+    Flattens the ToC into reading order. Each entry carries the scope a chunk under it belongs to:
+    {"title", "number", "chapter_number", "section_id", "sub_section_id", "page", "node"}
+    where "node" is the original ToC dict
+    """
+    nodes = []
+    for chapter in toc_data.get("chapters", []):
+        chapter_scope = {"chapter_number": chapter.get("chapter_number"), "page": chapter.get("start_page")}
+        nodes.append(dict(chapter_scope, title=chapter.get("chapter_title", ""), number=str(chapter.get("chapter_number", "")), node=chapter))
+        for section in chapter.get("sections", []):
+            section_scope = dict(chapter_scope, section_id=section.get("section_id"), page=section.get("page"))
+            nodes.append(dict(section_scope, title=section.get("section_title", ""), number=str(section.get("section_id", "")), node=section))
+            for sub_section in section.get("sub_sections", []):
+                sub_scope = dict(section_scope, sub_section_id=sub_section.get("sub_section_id"), page=sub_section.get("page"))
+                nodes.append(dict(sub_scope, title=sub_section.get("sub_section_title", ""), number=str(sub_section.get("sub_section_id", "")), node=sub_section))
+    return nodes
+
+
+def tag_chunks_with_toc(chunks, toc_data):
+    """
+    Yields chunks with a "scope" dict (chapter_number / section_id / sub_section_id / page)
+    so the vector store can filter searches by chapter, section or page range.
+
+    Chunks are walked in reading order. A chunk whose header matches a ToC title (or a
+    "2.1"-style number) moves the cursor to that node; other chunks inherit the current
+    scope. Repeated titles such as "Glossary" resolve to the next occurrence after the
+    cursor, so every chapter's "Exercises" lands in the right chapter. Chunks before the
+    first match (front matter) get no scope.
+    """
+    nodes = flatten_toc(toc_data)
+    by_title, by_number = {}, {}
+    for index, node in enumerate(nodes):
+        by_title.setdefault(_normalize_title(node["title"]), []).append(index)
+        if node["number"]:
+            by_number.setdefault(node["number"], []).append(index)
+
+    cursor = -1
+    for chunk in chunks:
+        header = str(chunk.get("Header") or (chunk.get("metadata") or {}).get("header_1") or "")
+        if header:
+            # Only trust "2.1 ..." or "Chapter 2" numbers; a bare "1: ..." is usually an exercise label
+            match = _NUMBER_PREFIX_RE.match(header.strip())
+            trusted = match and ("." in match.group(1) or header.strip().lower().startswith("chapter"))
+            candidates = by_number.get(match.group(1), []) if trusted else []
+            candidates = candidates or by_title.get(_normalize_title(header), [])
+            if candidates:
+                # Prefer the next occurrence after the cursor; jump back only if there is none
+                # (e.g. a contents listing near the front already moved the cursor ahead)
+                cursor = next((i for i in candidates if i > cursor), candidates[0])
+
+        if cursor >= 0:
+            node = nodes[cursor]
+            chunk = dict(chunk)
+            chunk["scope"] = {
+                key: node[key]
+                for key in ("chapter_number", "section_id", "sub_section_id", "page")
+                if node.get(key) is not None
+            }
+        yield chunk
+
+
+def find_content_list(chunks_path):
+    """MinerU's {name}_content_list.json next to the chunk file, if there is one"""
+    candidates = sorted(Path(chunks_path).parent.glob("*_content_list.json"))
+    return candidates[0] if candidates else None
+
+
+def _heading_key(text):
+    """Lowercased alphanumerics of a heading, number included ("1.13 Glossary" -> "113glossary")"""
+    return re.sub(r"[^0-9a-z\u4e00-\u9fff]", "", str(text).lower())
+
+
+def chunk_pages(chunks, content_list, lookahead=16):
+    """
+    Returns the page_idx (0-based PDF page) each chunk starts on, or None before the first
+    located heading. Chunk headers are matched in order against the content_list headings
+    (items with a text_level); chunks split on "#" lines that are not headings, such as
+    comments in code blocks, keep the page of the previous chunk. One pass over both lists.
+    """
+    headings = [
+        (_heading_key(item.get("text", "")), item.get("page_idx"))
+        for item in content_list
+        if item.get("text_level")
+    ]
+    pages, cursor, page = [], 0, None
+    for chunk in chunks:
+        key = _heading_key(chunk.get("Header", ""))
+        if key:
+            for i in range(cursor, min(cursor + lookahead, len(headings))):
+                if headings[i][0] == key:
+                    page, cursor = headings[i][1], i + 1
+                    break
+        pages.append(page)
+    return pages
+
+
+def _chunk_key(chunk):
+    """(compact title without its number, trusted number or None) of a chunk header"""
+    # Trailing space so a bare "Chapter 2" / "Appendix A" header still matches the prefix patterns
+    header = str(chunk.get("Header") or "").strip() + " "
+    appendix = _APPENDIX_NUMBER_RE.match(header)
+    if appendix:
+        return TitleIndex._compact(clean_title(header[appendix.end():])), (appendix.group(1) or appendix.group(2)).upper()
+    match = _NUMBER_PREFIX_RE.match(header)
+    # Only trust "2.1 ..." or "Chapter 2" numbers; a bare "1: ..." is usually an exercise label
+    trusted = match and ("." in match.group(1) or header.lower().startswith("chapter"))
+    return TitleIndex._compact(clean_title(header)), match.group(1) if trusted else None
+
+
+def _page_offset(nodes, keys, pages):
+    """
+    Median of (page_idx - printed ToC page) over nodes whose title occurs exactly once among
+    the chunk headers. None when there is no such anchor.
+    """
+    positions = {}
+    for index, (compact, _) in enumerate(keys):
+        if compact:
+            positions.setdefault(compact, []).append(index)
+
+    offsets = []
+    for node in nodes:
+        found = positions.get(TitleIndex._compact(clean_title(node["title"])), [])
+        if len(found) == 1 and pages[found[0]] is not None and isinstance(node.get("page"), int):
+            offsets.append(pages[found[0]] - node["page"])
+    if not offsets:
+        return None
+    offsets.sort()
+    return offsets[len(offsets) // 2]
+
+
+def align_toc_to_chunks(toc_data, chunks, pages=None, page_slack=2, max_skip=64):
+    """
+    Aligns the ToC with the ordered chunk stream in one forward pass.
+    Returns (entry, start, end) for every flatten_toc entry: the node owns chunks[start:end],
+    i.e. from its own heading up to the next placed node. Unplaced nodes get (entry, None, None).
+
+    Both sequences are in reading order, so a single cursor moves forward through the chunks:
+    each node is placed at the first chunk after the cursor whose header carries its number
+    ("2.1", "Chapter 2", "A.1") or its title, found by bisecting the sorted positions of that
+    number / title. Repeated titles such as "Glossary" therefore land in their own chapter.
+    With pages (see chunk_pages) the printed ToC page, shifted by the book's page offset, bounds
+    the match to page_slack pages around the expected page, which also skips the contents listing
+    at the front. Without pages a node may be at most max_skip chunks past the previous one.
+    Chunks before the first placed node (front matter) belong to no node.
+    """
+    nodes = flatten_toc(toc_data)
+    keys = [_chunk_key(chunk) for chunk in chunks]
+    offset = _page_offset(nodes, keys, pages) if pages else None
+
+    by_title, by_number = {}, {}
+    for index, (compact, number) in enumerate(keys):
+        if compact:
+            by_title.setdefault(compact, []).append(index)
+        if number:
+            by_number.setdefault(number, []).append(index)
+
+    starts = [None] * len(nodes)
+    cursor, placed = 0, False
+    for k, node in enumerate(nodes):
+        expected = node["page"] + offset if offset is not None and isinstance(node.get("page"), int) else None
+        best = None
+        for positions in (by_number.get(node["number"], []), by_title.get(TitleIndex._compact(clean_title(node["title"])), [])):
+            for j in positions[bisect.bisect_left(positions, cursor):]:
+                if best is not None and j >= best:
+                    break
+                page = pages[j] if pages else None
+                if expected is not None and page is not None:
+                    if page > expected + page_slack:
+                        break
+                    if page < expected - page_slack:
+                        continue
+                elif placed and j - cursor > max_skip:
+                    break
+                best = j
+                break
+        if best is not None:
+            starts[k] = best
+            cursor, placed = best + 1, True
+
+    aligned = []
+    end = len(chunks)
+    for k in range(len(nodes) - 1, -1, -1):
+        if starts[k] is None:
+            aligned.append((nodes[k], None, None))
+        else:
+            aligned.append((nodes[k], starts[k], end))
+            end = starts[k]
+    aligned.reverse()
+    return aligned
+
+
 if __name__ == "__main__":
     base_dir = Path(r"data\hizan\output\java_short\hybrid_auto")
     toc_file = base_dir / "textbook_toc.json"
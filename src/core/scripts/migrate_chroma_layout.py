@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Migrate per-collection Chroma folders into one shared store per user.
+
+Usage:
+  python scripts/migrate_chroma_layout.py --user hizan
+  python scripts/migrate_chroma_layout.py --all --delete-legacy
+
+The old layout keeps every collection in its own database folder:
+
+  DATA_DIR/{user}/chroma_db/{collection}/chroma.sqlite3
+
+The shared layout (VECTOR_STORE_LAYOUT=shared) keeps all of a user's collections
+in one database:
+
+  DATA_DIR/{user}/chroma_db/chroma.sqlite3
+
+Documents, metadata, ids and the stored embeddings are copied page by page, so
+nothing is re-embedded. BM25 index files are copied alongside. A collection whose
+target already holds at least as many records as the source is skipped. The
+script is therefore safe to re-run.
+Legacy folders are only removed with --delete-legacy, and only after the counts match.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+from typing import Dict, List
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv
+
+from microservices.vectorization import (
+    LAYOUT_PER_COLLECTION,
+    LAYOUT_SHARED,
+    VectorStorageManager,
+    bm25_index_path,
+    close_shared_chroma_clients,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def find_legacy_collections(user_db_path: str) -> List[str]:
+    """Return the sub-folders of chroma_db that are standalone Chroma databases."""
+    if not os.path.isdir(user_db_path):
+        return []
+    return sorted(
+        name for name in os.listdir(user_db_path)
+        if os.path.isfile(os.path.join(user_db_path, name, "chroma.sqlite3"))
+    )
+
+
+def migrate_collection(user_db_path: str, collection_name: str, page_size: int = 500, dry_run: bool = False) -> Dict:
+    """Copy one legacy collection into the user's shared store and return a small report."""
+    legacy = VectorStorageManager(collection_name, db_path=user_db_path, layout=LAYOUT_PER_COLLECTION)
+    try:
+        return _copy_collection(legacy.collection, user_db_path, collection_name, page_size, dry_run)
+    finally:
+        legacy.close()
+
+
+def _copy_collection(source, user_db_path: str, collection_name: str, page_size: int, dry_run: bool) -> Dict:
+    source_count = source.count()
+    report = {"collection": collection_name, "source_count": source_count, "copied": 0, "skipped": False}
+    if dry_run:
+        return report
+
+    target = VectorStorageManager(collection_name, db_path=user_db_path, layout=LAYOUT_SHARED).collection
+    if target.count() >= source_count:
+        report["skipped"] = True
+        report["target_count"] = target.count()
+        return report
+
+    for offset in range(0, source_count, page_size):
+        page = source.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        target.upsert(
+            ids=page["ids"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+            embeddings=page["embeddings"],
+        )
+        report["copied"] += len(page["ids"])
+
+    report["target_count"] = target.count()
+
+    # The BM25 index is keyed by the same chunk ids, so it can be copied as is
+    legacy_bm25 = bm25_index_path(user_db_path, collection_name, LAYOUT_PER_COLLECTION)
+    if os.path.exists(legacy_bm25):
+        shared_bm25 = bm25_index_path(user_db_path, collection_name, LAYOUT_SHARED)
+        os.makedirs(os.path.dirname(shared_bm25), exist_ok=True)
+        shutil.copyfile(legacy_bm25, shared_bm25)
+    return report
+
+
+def migrate_user(data_dir: str, username: str, page_size: int = 500, dry_run: bool = False, delete_legacy: bool = False) -> List[Dict]:
+    user_db_path = os.path.join(data_dir, username, "chroma_db")
+    reports = []
+    for collection_name in find_legacy_collections(user_db_path):
+        try:
+            report = migrate_collection(user_db_path, collection_name, page_size=page_size, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"[{username}] {collection_name}: migration failed: {e}")
+            reports.append({"collection": collection_name, "error": str(e)})
+            continue
+
+        logger.info(f"[{username}] {report}")
+        if delete_legacy and not dry_run and report.get("target_count", 0) >= report["source_count"]:
+            shutil.rmtree(os.path.join(user_db_path, collection_name))
+            report["legacy_deleted"] = True
+        reports.append(report)
+    return reports
+
+
+def main():
+    load_dotenv()
+    p = argparse.ArgumentParser()
+    p.add_argument("--data-dir", default=os.getenv("DATA_DIR"), help="defaults to DATA_DIR")
+    who = p.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user", help="migrate a single user")
+    who.add_argument("--all", action="store_true", help="migrate every user under DATA_DIR")
+    p.add_argument("--page-size", type=int, default=500, help="records copied per request")
+    p.add_argument("--dry-run", action="store_true", help="only list the collections that would be migrated")
+    p.add_argument("--delete-legacy", action="store_true", help="remove legacy folders once their records are copied")
+    args = p.parse_args()
+
+    if not args.data_dir:
+        print("DATA_DIR is not configured")
+        raise SystemExit(1)
+
+    users = [args.user] if args.user else sorted(
+        name for name in os.listdir(args.data_dir)
+        if os.path.isdir(os.path.join(args.data_dir, name, "chroma_db"))
+    )
+
+    try:
+        for username in users:
+            migrate_user(args.data_dir, username, page_size=args.page_size, dry_run=args.dry_run, delete_legacy=args.delete_legacy)
+    finally:
+        close_shared_chroma_clients()
+
+    if not args.dry_run:
+        print("Done. Set VECTOR_STORE_LAYOUT=shared to serve from the migrated stores.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture
+def tiny_embeddings(monkeypatch):
+    """Replace the SentenceTransformer model with a 3-dimensional hash embedding (no model download)"""
+    from chromadb import EmbeddingFunction
+    import microservices.vectorization as vectorization
+
+    class TinyEmbedding(EmbeddingFunction):
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            return [[float(len(text) % 7), float(sum(map(ord, text)) % 11), 1.0] for text in input]
+
+        @staticmethod
+        def name():
+            return "tiny"
+
+        def get_config(self):
+            return {}
+
+        @staticmethod
+        def build_from_config(config):
+            return TinyEmbedding()
+
+    monkeypatch.setattr(vectorization, "get_embedding_function", lambda model_name=None: TinyEmbedding())
+    monkeypatch.setenv("VECTOR_STORE_LAYOUT", "per_collection")
+    return TinyEmbedding
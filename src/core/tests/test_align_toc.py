@@ -0,0 +1,93 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from scripts.merge_toc_content import align_toc_to_chunks, chunk_pages
+
+SAMPLE_BOOKS = Path(__file__).resolve().parents[3] / "data" / "hizan" / "output"
+
+TOC = {"chapters": [
+    {"chapter_number": 1, "chapter_title": "Basics", "start_page": 1, "sections": [
+        {"section_id": "1.1", "section_title": "Variables", "page": 2, "sub_sections": [
+            {"sub_section_id": "1.1.1", "sub_section_title": "Not in the book", "page": 2},
+        ]},
+        {"section_id": "1.2", "section_title": "Glossary", "page": 3, "sub_sections": []},
+    ]},
+    {"chapter_number": 2, "chapter_title": "Objects", "start_page": 6, "sections": [
+        {"section_id": "2.1", "section_title": "Classes", "page": 7, "sub_sections": []},
+        {"section_id": "2.2", "section_title": "Glossary", "page": 8, "sub_sections": []},
+    ]},
+]}
+
+# (header, page_idx): the printed page plus a 4-page offset, after a contents listing
+CHUNKS = [
+    ("Contents", 0),
+    ("Chapter 1 Basics", 1),  # contents listing entry, not the chapter itself
+    ("Chapter 1 Basics", 5),
+    ("1.1 Variables", 6),
+    ("x = 1", 6),  # a "#" comment in a code block split the chunk
+    ("Glossary", 7),
+    ("Chapter 2 Objects", 10),
+    ("2.1 Classes", 11),
+    ("Glossary", 12),
+    ("Exercises", 12),
+]
+
+
+def ranges(aligned):
+    return {entry["number"]: (start, end) for entry, start, end in aligned}
+
+
+def test_alignment_assigns_contiguous_ranges_in_reading_order():
+    chunks = [{"Header": header, "content": header} for header, _ in CHUNKS]
+    aligned = align_toc_to_chunks(TOC, chunks, pages=[page for _, page in CHUNKS])
+
+    assert ranges(aligned) == {
+        "1": (2, 3),
+        "1.1": (3, 5),
+        "1.1.1": (None, None),
+        "1.2": (5, 6),
+        "2": (6, 7),
+        "2.1": (7, 8),
+        "2.2": (8, 10),
+    }
+    # Scope fields come from flatten_toc, so the repeated "Glossary" titles stay distinguishable
+    assert [entry["chapter_number"] for entry, start, _ in aligned if start in (5, 8)] == [1, 2]
+
+
+def test_without_pages_the_contents_listing_is_taken_for_the_chapter():
+    chunks = [{"Header": header, "content": header} for header, _ in CHUNKS]
+    placed = ranges(align_toc_to_chunks(TOC, chunks))
+    # Headers alone cannot tell the listing from the chapter; everything after it still aligns
+    assert placed["1"] == (1, 3)
+    assert placed["1.2"] == (5, 6) and placed["2.2"] == (8, 10)
+
+
+def test_chunk_pages_follow_content_list_headings():
+    chunks = [{"Header": "Preface"}, {"Header": "1.1 Variables"}, {"Header": "x = 1"}, {"Header": "1.2 Glossary"}]
+    content_list = [
+        {"text": "1.1  Variables", "text_level": 1, "page_idx": 6},
+        {"text": "body", "page_idx": 6},
+        {"text": "1.2 Glossary", "text_level": 1, "page_idx": 7},
+    ]
+    assert chunk_pages(chunks, content_list) == [None, 6, 6, 7]
+
+
+def test_sample_book_glossaries_land_in_their_own_chapter():
+    book = SAMPLE_BOOKS / "pyhton_short" / "hybrid_auto"
+    if not book.exists():
+        pytest.skip("sample book not available")
+    with open(book / "textbook_toc.json", encoding="utf-8") as f:
+        toc = json.load(f)
+    with open(book / "chunker_step_1.json", encoding="utf-8") as f:
+        chunks = json.load(f)
+    with open(book / "pyhton_short_content_list.json", encoding="utf-8") as f:
+        pages = chunk_pages(chunks, json.load(f))
+
+    aligned = align_toc_to_chunks(toc, chunks, pages)
+    glossaries = [(entry["number"], chunks[start]["Header"]) for entry, start, _ in aligned if entry["title"] == "Glossary" and start is not None]
+    assert len(glossaries) > 5
+    assert all(header.startswith(number + " ") for number, header in glossaries)
+    starts = [start for _, start, _ in aligned if start is not None]
+    assert starts == sorted(starts)
@@ -0,0 +1,238 @@
+import copy
+import json
+import random
+import re
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("google.generativeai")
+
+from llm.analyze_textbook import TextbookAnalyzer  # noqa: E402
+from llm.llm_client import RateLimiter  # noqa: E402
+
+_HEADER_RE = re.compile(r"^Section Header: (.*)$", re.MULTILINE)
+_BATCH_ITEM_RE = re.compile(r"^--- Section key: (\S+) ---\nSection Header: (.*)$", re.MULTILINE)
+
+
+class FakeLLM:
+    """Answers every section with {"topic": <header>}; batched prompts are answered per section key"""
+
+    provider = None
+
+    def __init__(self, max_delay=0.0):
+        self.max_delay = max_delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, system_prompt=None):
+        time.sleep(random.uniform(0, self.max_delay))
+        items = _BATCH_ITEM_RE.findall(prompt)
+        with self.lock:
+            self.calls.append([header for _, header in items] or _HEADER_RE.findall(prompt))
+        if items:
+            return {key: {"topic": header} for key, header in items}
+        return {"topic": _HEADER_RE.search(prompt).group(1)}
+
+
+def textbook(chapters=2, sections=3, parts=1):
+    return {"chapters": [
+        {"chapter_number": c + 1, "chapter_title": f"Chapter {c + 1}", "sections": [
+            {
+                "section_id": f"{c + 1}.{s + 1}",
+                "section_title": f"Section {c + 1}.{s + 1}",
+                "content": f"Body of section {c + 1}.{s + 1}",
+                "sub_sections": [
+                    {
+                        "sub_section_id": f"{c + 1}.{s + 1}.{p + 1}",
+                        "sub_section_title": f"Part {c + 1}.{s + 1}.{p + 1}",
+                        "content": f"Body of part {c + 1}.{s + 1}.{p + 1}",
+                    }
+                    for p in range(parts)
+                ],
+            }
+            for s in range(sections)
+        ]}
+        for c in range(chapters)
+    ]}
+
+
+def write_textbook(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def analyses(data):
+    return {
+        node.get("sub_section_id") or node["section_id"]: node.get("key_topics_analysis")
+        for chapter in data["chapters"]
+        for section in chapter["sections"]
+        for node in [section, *section["sub_sections"]]
+    }
+
+
+def test_concurrent_analysis_matches_sequential(tmp_path):
+    data = textbook()
+    sequential = TextbookAnalyzer(llm_client=FakeLLM()).generate_chapter_analysis(
+        write_textbook(tmp_path / "sequential.json", copy.deepcopy(data)), max_workers=1, batch_token_budget=0
+    )
+    concurrent = TextbookAnalyzer(llm_client=FakeLLM(max_delay=0.02)).generate_chapter_analysis(
+        write_textbook(tmp_path / "concurrent.json", copy.deepcopy(data)), max_workers=4, batch_token_budget=0
+    )
+
+    assert analyses(concurrent) == analyses(sequential)
+    assert all(analysis["topic"].endswith(node_id) for node_id, analysis in analyses(concurrent).items())
+    # Written back to disk once, and the journal is gone after a completed run
+    assert json.loads((tmp_path / "concurrent.json").read_text(encoding="utf-8")) == concurrent
+    assert not (tmp_path / "concurrent.journal.jsonl").exists()
+
+
+def test_rate_limiter_bounds_concurrent_requests():
+    limiter = RateLimiter(requests_per_minute=1200)  # 20 per second, bursts of 20
+    start = time.monotonic()
+    workers = [threading.Thread(target=lambda: [limiter.acquire() for _ in range(10)]) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # 30 requests: the first 20 are the burst, the other 10 wait for refills at 20/s
+    assert time.monotonic() - start >= 0.45
+
+
+class CrashingLLM(FakeLLM):
+    """Dies (like a killed process) on the given call; KeyboardInterrupt bypasses the per-section error handling"""
+
+    def __init__(self, crash_on_call):
+        super().__init__()
+        self.crash_on_call = crash_on_call
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, system_prompt=None):
+        if len(self.calls) + 1 == self.crash_on_call:
+            raise KeyboardInterrupt("crash")
+        return super().generate_json(prompt, schema, max_tokens, system_prompt)
+
+
+def test_resume_replays_journal_after_crash(tmp_path):
+    path = write_textbook(tmp_path / "book.json", textbook(chapters=1, sections=2))
+
+    with pytest.raises(KeyboardInterrupt):
+        TextbookAnalyzer(llm_client=CrashingLLM(crash_on_call=3)).generate_chapter_analysis(path, max_workers=1, batch_token_budget=0)
+    # The document itself was never rewritten; the two finished nodes live in the journal
+    assert (tmp_path / "book.journal.jsonl").exists()
+    assert all(analysis is None for analysis in analyses(json.loads((tmp_path / "book.json").read_text(encoding="utf-8"))).values())
+
+    resumed = FakeLLM()
+    result = TextbookAnalyzer(llm_client=resumed).generate_chapter_analysis(path, max_workers=1, batch_token_budget=0)
+
+    assert resumed.calls == [["Section 1.2"], ["Part 1.2.1"]]
+    assert analyses(result) == {
+        "1.1": {"topic": "Section 1.1"},
+        "1.1.1": {"topic": "Part 1.1.1"},
+        "1.2": {"topic": "Section 1.2"},
+        "1.2.1": {"topic": "Part 1.2.1"},
+    }
+    assert not (tmp_path / "book.journal.jsonl").exists()
+
+
+class PartialBatchLLM(FakeLLM):
+    """Batched responses drop the first section and garble the second; single-section prompts work"""
+
+    def __init__(self, whole_batch=None):
+        super().__init__()
+        self.whole_batch = whole_batch
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, system_prompt=None):
+        response = super().generate_json(prompt, schema, max_tokens, system_prompt)
+        if not _BATCH_ITEM_RE.search(prompt):
+            return response
+        if self.whole_batch is not None:
+            return self.whole_batch
+        keys = list(response)
+        response.pop(keys[0])
+        response[keys[1]] = "not an object"
+        return response
+
+
+def test_batch_packs_siblings_and_falls_back_to_single_calls(tmp_path):
+    path = write_textbook(tmp_path / "book.json", textbook(chapters=1, sections=1, parts=4))
+    llm = PartialBatchLLM()
+    result = TextbookAnalyzer(llm_client=llm).generate_chapter_analysis(path, max_workers=1, batch_token_budget=1000)
+
+    # The section is alone (its parent differs from its sub-sections'); the four siblings share one request
+    assert llm.calls == [
+        ["Section 1.1"],
+        ["Part 1.1.1", "Part 1.1.2", "Part 1.1.3", "Part 1.1.4"],
+        ["Part 1.1.1"],
+        ["Part 1.1.2"],
+    ]
+    assert analyses(result) == {
+        "1.1": {"topic": "Section 1.1"},
+        **{f"1.1.{p}": {"topic": f"Part 1.1.{p}"} for p in range(1, 5)},
+    }
+
+
+@pytest.mark.parametrize("whole_batch", [["not", "an", "object"], {}])
+def test_unusable_batch_response_falls_back_for_every_section(tmp_path, whole_batch):
+    path = write_textbook(tmp_path / "book.json", textbook(chapters=1, sections=1, parts=3))
+    llm = PartialBatchLLM(whole_batch=whole_batch)
+    result = TextbookAnalyzer(llm_client=llm).generate_chapter_analysis(path, max_workers=1, batch_token_budget=1000)
+
+    assert llm.calls[2:] == [["Part 1.1.1"], ["Part 1.1.2"], ["Part 1.1.3"]]
+    assert all("error" not in analysis for analysis in analyses(result).values())
+
+
+def test_oversized_nodes_are_sent_alone(tmp_path):
+    data = textbook(chapters=1, sections=1, parts=3)
+    data["chapters"][0]["sections"][0]["sub_sections"][1]["content"] = "x" * 2000  # ~500 tokens, over half the budget
+    llm = FakeLLM()
+    TextbookAnalyzer(llm_client=llm).generate_chapter_analysis(write_textbook(tmp_path / "book.json", data), max_workers=1, batch_token_budget=600)
+
+    assert llm.calls == [["Section 1.1"], ["Part 1.1.1"], ["Part 1.1.2"], ["Part 1.1.3"]]
+
+
+_TOC_CHAPTER_RE = re.compile(r"^(\d+) ([A-Z][a-z]+) (\d+)$", re.MULTILINE)
+TOC_TEXT = "\n".join(f"{n} {title} {page}\n{n}.1 Overview {page + 1}" for n, title, page in [
+    (1, "Basics", 1), (2, "Objects", 9), (3, "Files", 20), (4, "Networks", 31),
+])
+
+
+class FakeTocLLM:
+    """Parses "N Title page" chapter lines; like a real fragment request, numbering restarts at 1 in every prompt"""
+
+    provider = None
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, system_prompt=None):
+        with self.lock:
+            self.prompts.append(prompt)
+        if self.fail_part and f"(Part {self.fail_part} of" in prompt:
+            raise ValueError("output truncated")
+        return {"book_title": "Book", "chapters": [
+            {"chapter_number": i, "chapter_title": title, "start_page": int(page), "sections": []}
+            for i, (_, title, page) in enumerate(_TOC_CHAPTER_RE.findall(prompt), start=1)
+        ]}
+
+
+def test_long_toc_is_parsed_in_fragments_and_stitched(monkeypatch):
+    monkeypatch.setenv("TOC_FRAGMENT_CHARS", "50")
+    llm = FakeTocLLM()
+    toc = TextbookAnalyzer(llm_client=llm).parse_table_of_content(TOC_TEXT, save_to_disk=False, strategy="llm")
+
+    assert len(llm.prompts) == 4
+    assert [(c["chapter_number"], c["chapter_title"]) for c in toc["chapters"]] == [(1, "Basics"), (2, "Objects"), (3, "Files"), (4, "Networks")]
+
+
+def test_failed_fragment_falls_back_to_one_request(monkeypatch):
+    monkeypatch.setenv("TOC_FRAGMENT_CHARS", "50")
+    llm = FakeTocLLM(fail_part=2)
+    toc = TextbookAnalyzer(llm_client=llm).parse_table_of_content(TOC_TEXT, save_to_disk=False, strategy="llm")
+
+    assert len(llm.prompts) == 5
+    assert "(Part" not in llm.prompts[-1]
+    assert [c["chapter_number"] for c in toc["chapters"]] == [1, 2, 3, 4]
@@ -0,0 +1,41 @@
+import pytest
+
+from microservices.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenizer_keeps_identifiers_whole_and_split():
+    assert tokenize("JTextField") == ["jtextfield", "j", "text", "field"]
+    assert tokenize("onDraw() HTMLParser") == ["ondraw", "on", "draw", "htmlparser", "html", "parser"]
+    assert tokenize("seek_bar_2 max") == ["seek_bar_2", "seek", "bar", "2", "max"]
+    assert tokenize("Loops loop") == ["loops", "loop"]
+    assert tokenize("变量x") == ["变", "量", "x"]
+
+
+def test_exact_identifier_ranks_first_and_survives_reload(tmp_path):
+    index = BM25Index(tmp_path / "bm25.json")
+    index.add_many([
+        ("a", "Text fields accept user input"),
+        ("b", "A JTextField is a single-line text field"),
+        ("c", "Buttons trigger actions"),
+    ])
+    # The whole identifier only occurs in b; its parts also match a, which ranks below
+    assert [chunk_id for chunk_id, _ in index.search("JTextField")] == ["b", "a"]
+
+    index.remove("b")
+    index.save()
+    reloaded = BM25Index(tmp_path / "bm25.json")
+    assert len(reloaded) == 2
+    assert [chunk_id for chunk_id, _ in reloaded.search("JTextField")] == ["a"]
+    assert reloaded.search("jtextfield") == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = ["a", "b", "c"]
+    lexical = ["d", "b", "e"]
+    fused = reciprocal_rank_fusion([dense, lexical], k=60)
+
+    # b is second in both lists and beats items that are first in only one
+    assert [chunk_id for chunk_id, _ in fused] == ["b", "a", "d", "c", "e"]
+    assert dict(fused)["b"] == pytest.approx(2 / 62)
+    assert dict(fused)["a"] == pytest.approx(1 / 61)
+    assert dict(fused)["e"] == pytest.approx(1 / 63)
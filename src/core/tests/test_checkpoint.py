@@ -0,0 +1,38 @@
+from llm.checkpoint import CheckpointJournal
+
+
+def test_replay_after_crash_skips_torn_record(tmp_path):
+    document = tmp_path / "textbook_with_content.json"
+    journal = CheckpointJournal(document)
+    journal.append("0.0", {"topic": "first"})
+    journal.append("0.1", {"topic": "second"})
+    # Crash mid-write: the process dies without closing the journal, leaving half a record
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"node_id": "0.2", "analys')
+
+    recovered = CheckpointJournal(document)
+    assert recovered.path == tmp_path / "textbook_with_content.journal.jsonl"
+    assert list(recovered.replay()) == [("0.0", {"topic": "first"}), ("0.1", {"topic": "second"})]
+
+    nodes = {"0.0": {}, "0.1": {"key_topics_analysis": {"error": "stale"}}, "0.2": {}}
+    assert recovered.compact_into(nodes, "key_topics_analysis") == 2
+    assert nodes == {
+        "0.0": {"key_topics_analysis": {"topic": "first"}},
+        "0.1": {"key_topics_analysis": {"topic": "second"}},
+        "0.2": {},
+    }
+
+    recovered.remove()
+    journal.close()
+    assert not recovered.exists()
+
+
+def test_later_record_for_a_node_wins(tmp_path):
+    journal = CheckpointJournal(tmp_path / "book.json")
+    journal.append("1.0", {"error": "timeout"})
+    journal.append("1.0", {"topic": "retried"})
+    journal.close()
+
+    nodes = {"1.0": {}}
+    CheckpointJournal(tmp_path / "book.json").compact_into(nodes, "key_topics_analysis")
+    assert nodes["1.0"]["key_topics_analysis"] == {"topic": "retried"}
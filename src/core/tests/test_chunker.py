@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from microservices.chunker import MarkdownChunker, count_tokens  # noqa: E402
+
+
+def paragraph(label, words):
+    return f"{label} " + " ".join(f"word{i % 7}" for i in range(words))
+
+
+def chunk(header, body=""):
+    return {"content": f"# {header}\n{body}".strip(), "Header": header}
+
+
+@pytest.fixture
+def chunker(tmp_path):
+    return MarkdownChunker(env_file=str(tmp_path / "missing.env"))
+
+
+def test_undersized_chunks_merge_forward_and_the_tail_merges_back(chunker):
+    chunks = [
+        chunk("1 Basics"),
+        chunk("1.1 Variables", paragraph("vars", 60)),
+        chunk("2 Objects"),
+        chunk("2.1 Classes", paragraph("classes", 60)),
+        chunk("Index"),  # short trailing chunk with nothing after it
+    ]
+    windowed = chunker.enforce_token_window(chunks, min_tokens=20, max_tokens=300)
+
+    assert [c["Header"] for c in windowed] == ["1 Basics", "2 Objects"]
+    assert all(20 <= count_tokens(c["content"]) <= 300 for c in windowed)
+    assert windowed[-1]["content"].endswith("# Index")
+    # Merging only concatenates; no text is dropped or reordered
+    assert "\n\n".join(c["content"] for c in windowed) == "\n\n".join(c["content"] for c in chunks)
+
+
+def test_oversized_chunks_are_split_into_the_window(chunker):
+    chunks = [chunk("1 Basics", "\n\n".join(paragraph(f"p{i}", 40) for i in range(12))), chunk("Index")]
+    windowed = chunker.enforce_token_window(chunks, min_tokens=20, max_tokens=100)
+
+    assert len(windowed) > 2
+    assert all(count_tokens(c["content"]) <= 100 for c in windowed)
+    assert {c["Header"] for c in windowed} == {"1 Basics"}
+    # The short tail is folded into the last split part instead of becoming its own window
+    assert all(count_tokens(c["content"]) >= 20 for c in windowed)
+
+
+def test_token_window_streams_with_bounded_lookahead(chunker):
+    pulled = []
+
+    def source():
+        for i in range(50):
+            pulled.append(i)
+            yield chunk(f"{i} Section", paragraph(f"s{i}", 40))
+
+    windows = chunker.iter_token_window(source(), min_tokens=20, max_tokens=300)
+    first = next(windows)
+    assert first["Header"] == "0 Section"
+    assert len(pulled) <= 3
+    assert [first, *windows] == chunker.enforce_token_window(
+        [chunk(f"{i} Section", paragraph(f"s{i}", 40)) for i in range(50)], min_tokens=20, max_tokens=300
+    )
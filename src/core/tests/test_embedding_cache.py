@@ -0,0 +1,49 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from microservices.embedding_cache import EmbeddingCache
+
+
+def vector(seed, dim=4):
+    return [float(seed)] * dim
+
+
+def test_instances_sharing_a_directory_never_cross_rows(tmp_path):
+    # Separate instances stand in for the server and a script using the same DATA_DIR
+    server = EmbeddingCache(tmp_path, "model")
+    script = EmbeddingCache(tmp_path, "model")
+
+    server.put_many(["alpha"], [vector(1)])
+    script.put_many(["beta", "gamma"], [vector(2), vector(3)])
+    server.put_many(["delta"], [vector(4)])
+
+    for cache in (server, script, EmbeddingCache(tmp_path, "model")):
+        found = cache.get_many(["alpha", "beta", "gamma", "delta"])
+        assert [float(v[0]) for v in found] == [1.0, 2.0, 3.0, 4.0]
+
+
+def _append(cache_dir, worker):
+    cache = EmbeddingCache(cache_dir, "model")
+    for batch in range(10):
+        texts = [f"w{worker}-{batch}-{i}" for i in range(5)]
+        cache.put_many(texts, [vector(worker * 1000 + batch * 10 + i) for i in range(5)])
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_processes_append_consistently(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_append, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(30)
+        assert process.exitcode == 0
+
+    cache = EmbeddingCache(tmp_path, "model")
+    texts = [f"w{w}-{b}-{i}" for w in range(4) for b in range(10) for i in range(5)]
+    expected = [w * 1000 + b * 10 + i for w in range(4) for b in range(10) for i in range(5)]
+    found = cache.get_many(texts)
+    assert np.allclose([v[0] for v in found], expected)
+    assert cache.stats()["entries"] == len(texts)
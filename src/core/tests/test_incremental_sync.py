@@ -0,0 +1,48 @@
+from microservices.vectorization import VectorStorageManager
+
+CHUNKS = [
+    {"content": "Variables hold values", "Header": "1.1 Variables"},
+    {"content": "Loops repeat work", "Header": "1.2 Loops"},
+    {"content": "Classes group state", "Header": "2.1 Classes"},
+]
+
+
+def recording_embeddings(manager):
+    embedded = []
+    embedding_fn = manager.embedding_fn
+    manager.embedding_fn = lambda texts: embedded.extend(texts) or embedding_fn(texts)
+    return embedded
+
+
+def test_sync_only_embeds_changed_chunks_and_deletes_removed_ones(tiny_embeddings, tmp_path):
+    manager = VectorStorageManager("book_sync", db_path=str(tmp_path))
+    assert manager.process_and_store(CHUNKS) == 3
+    ids_before = set(manager.collection.get(include=[])["ids"])
+    embedded = recording_embeddings(manager)
+
+    # Default mode is idempotent: a populated collection is left alone
+    assert manager.process_and_store(CHUNKS) == 0
+    assert embedded == []
+
+    edited = [
+        CHUNKS[0],
+        {"content": "Loops repeat work until a condition fails", "Header": "1.2 Loops"},
+        {"content": "Interfaces define contracts", "Header": "2.2 Interfaces"},
+    ]
+    assert manager.process_and_store(edited, mode="sync", batch_size=1) == 2
+    assert len(embedded) == 2
+    assert all("Variables" not in text for text in embedded)
+
+    stored = manager.collection.get(include=["documents"])
+    assert len(stored["ids"]) == 3
+    assert len(set(stored["ids"]) & ids_before) == 1  # only the untouched chunk kept its id
+    assert not any("Classes group state" in document for document in stored["documents"])
+    # The keyword index follows the same changes
+    assert manager.bm25.search("Classes") == []
+    assert manager.bm25.search("Interfaces")
+
+    # Re-syncing the same input is a no-op
+    embedded.clear()
+    assert manager.process_and_store(edited, mode="sync") == 0
+    assert embedded == []
+    manager.close()
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+from microservices.job_queue import JOB_FAILED, JOB_SUCCEEDED, JobManager
+
+
+def wait_finished(manager, job_id):
+    for _ in range(200):
+        if manager.get_job(job_id)["status"] == JOB_SUCCEEDED:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_finished_jobs_are_capped(tmp_path):
+    manager = JobManager(jobs_dir=tmp_path, max_workers=1, max_finished=2)
+    job_ids = []
+    for _ in range(4):
+        job_ids.append(manager.submit("noop", "alice", [("noop", lambda context: None)]))
+        wait_finished(manager, job_ids[-1])
+    manager.shutdown(wait=True)
+
+    # Pruning runs on submit: the newest job plus the two most recent finished ones before it
+    assert sorted(job["job_id"] for job in manager.list_jobs()) == sorted(job_ids[1:])
+    assert sorted(path.stem for path in tmp_path.glob("*.json")) == sorted(job_ids[1:])
+
+
+def test_expired_jobs_are_dropped_on_startup(tmp_path):
+    old = {"job_id": "old", "username": "alice", "status": "failed", "created_at": "2020-01-01T00:00:00", "finished_at": "2020-01-01T00:00:01"}
+    (tmp_path / "old.json").write_text(json.dumps(old), encoding="utf-8")
+
+    manager = JobManager(jobs_dir=tmp_path, max_workers=1, retention_seconds=3600)
+    assert manager.get_job("old") is None
+    assert not (tmp_path / "old.json").exists()
+    manager.shutdown()
+
+
+def test_stage_reports_progress_within_a_stage(tmp_path):
+    manager = JobManager(jobs_dir=tmp_path, max_workers=1)
+    halfway = threading.Event()
+    release = threading.Event()
+
+    def long_stage(context):
+        context["report"](0.5)
+        halfway.set()
+        release.wait(5)
+        return {"rows": 3}
+
+    job_id = manager.submit("noop", "alice", [("first", lambda context: None), ("long", long_stage)])
+    assert halfway.wait(5)
+    assert manager.get_job(job_id)["progress"] == 0.75
+    release.set()
+    wait_finished(manager, job_id)
+    assert manager.get_job(job_id)["result"] == {"rows": 3}
+    manager.shutdown(wait=True)
+
+
+def test_shutdown_fails_queued_jobs_and_waits_for_running_ones(tmp_path):
+    manager = JobManager(jobs_dir=tmp_path, max_workers=1)
+    started = threading.Event()
+
+    def slow_stage(context):
+        started.set()
+        time.sleep(0.2)
+
+    running = manager.submit("noop", "alice", [("slow", slow_stage)])
+    queued = manager.submit("noop", "alice", [("noop", lambda context: None)])
+    assert started.wait(5)
+    manager.shutdown(wait=True)
+
+    assert manager.get_job(running)["status"] == JOB_SUCCEEDED
+    assert manager.get_job(queued)["status"] == JOB_FAILED
+    assert json.loads((tmp_path / f"{queued}.json").read_text(encoding="utf-8"))["status"] == JOB_FAILED
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("google.generativeai")
+
+from llm.llm_cache import CachedLLMClient, LLMResponseCache, get_llm_cache  # noqa: E402
+from llm.llm_client import LLMClient, ModelProvider  # noqa: E402
+
+
+class CountingClient(LLMClient):
+    provider = ModelProvider.OPENAI
+
+    def __init__(self):
+        super().__init__("key", "model")
+        self.calls = 0
+
+    def generate_text(self, prompt, max_tokens=None, system_prompt=None, temperature=0.7):
+        self.calls += 1
+        return f"{prompt} #{self.calls}"
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, system_prompt=None):
+        self.calls += 1
+        return {"call": self.calls}
+
+
+def test_size_limit_holds_across_processes(tmp_path):
+    # Two instances on one file stand in for two processes sharing the cache
+    db_path = tmp_path / "llm_cache.sqlite3"
+    first = LLMResponseCache(db_path, max_bytes=1000)
+    second = LLMResponseCache(db_path, max_bytes=1000)
+
+    for index in range(20):
+        (first if index % 2 else second).put(f"key-{index}", "x" * 98)  # 100 bytes as JSON
+
+    assert first.stats()["size_bytes"] <= 1000
+    assert second.stats()["size_bytes"] == first.stats()["size_bytes"]
+    assert first.get("key-19") == "x" * 98
+    assert first.get("key-0") is None
+
+
+def test_sampled_text_is_never_cached(tmp_path):
+    client = CachedLLMClient(CountingClient(), LLMResponseCache(tmp_path / "cache.sqlite3"))
+
+    assert client.generate_text("explain", temperature=0.7) != client.generate_text("explain", temperature=0.7)
+    assert list(client.stream_text("explain", temperature=0.7)) != list(client.stream_text("explain", temperature=0.7))
+    assert client.generate_text("explain", temperature=0) == client.generate_text("explain", temperature=0)
+    assert client.generate_json("topics") == client.generate_json("topics")
+
+
+def test_json_key_includes_temperature(tmp_path):
+    cache = LLMResponseCache(tmp_path / "cache.sqlite3")
+    client = CachedLLMClient(CountingClient(), cache)
+    first = client.generate_json("topics")
+    client.json_temperature = 0.0
+    assert client.generate_json("topics") != first
+
+
+def test_cache_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("LLM_CACHE", raising=False)
+    assert get_llm_cache() is None
+    monkeypatch.setenv("LLM_CACHE", "1")
+    assert get_llm_cache() is not None
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("google.generativeai")
+
+from llm import llm_client  # noqa: E402
+from llm.llm_client import DeepseekClient, LLMClient, OpenAIClient  # noqa: E402
+
+
+class FakeSDK:
+    """Stands in for OpenAI/AsyncOpenAI; records construction so pool sharing can be observed"""
+
+    def __init__(self, api_key=None, base_url=None, http_client=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.http_client = http_client
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_sdk(monkeypatch):
+    monkeypatch.setattr(llm_client, "OpenAI", FakeSDK)
+    monkeypatch.setattr(llm_client, "AsyncOpenAI", FakeSDK)
+    monkeypatch.setattr(llm_client, "_sdk_clients", {})
+
+
+def test_clients_share_one_pool_per_key(fake_sdk):
+    first, second = OpenAIClient(api_key="k1"), OpenAIClient(api_key="k1", model_name="gpt-4o-mini")
+    assert first.client is second.client
+    assert first.async_client is second.async_client
+    assert first.client is not first.async_client
+    assert OpenAIClient(api_key="k2").client is not first.client
+    deepseek = DeepseekClient(api_key="k1")
+    assert deepseek.client is not first.client
+    assert deepseek.client.base_url == "https://api.deepseek.com"
+
+
+def test_close_shared_clients_only_drops_async_pools(fake_sdk):
+    client = OpenAIClient(api_key="k1")
+    async_client = client.async_client
+    asyncio.run(llm_client.close_shared_clients())
+    assert async_client.closed
+    # The sync pool stays usable; the next async access builds a fresh pool
+    assert OpenAIClient(api_key="k1").client is client.client
+    assert client.async_client is not async_client
+
+
+class SlowClient(LLMClient):
+    """Only implements the sync interface, so the async methods use the default thread offload"""
+
+    def __init__(self):
+        super().__init__(api_key="unused", model_name="slow")
+        self.threads = set()
+
+    def generate_text(self, prompt, max_tokens=None, system_prompt=None, temperature=0.7):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.2)
+        return prompt
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, system_prompt=None):
+        return {"answer": self.generate_text(prompt)}
+
+
+def test_default_async_methods_do_not_block_the_event_loop():
+    client = SlowClient()
+
+    async def run():
+        start = time.monotonic()
+        results = await asyncio.gather(*(client.agenerate_json(str(i)) for i in range(4)))
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(run())
+    assert results == [{"answer": str(i)} for i in range(4)]
+    # Four 0.2s calls overlap in worker threads instead of running back to back on the loop
+    assert elapsed < 0.6
+    assert threading.get_ident() not in client.threads
@@ -0,0 +1,80 @@
+import sys
+import time
+
+import pytest
+
+from microservices import reranker as reranker_module
+from microservices.reranker import CrossEncoderReranker, ScoreBlendReranker, get_reranker
+
+
+def candidate(chunk_id, distance, document="x" * 800, header=""):
+    return {"id": chunk_id, "document": document, "metadata": {"header_1": header}, "distance": distance}
+
+
+def ids(ranked):
+    return [c["id"] for c in ranked]
+
+
+def test_blend_orders_by_distance_then_header_and_length():
+    reranker = ScoreBlendReranker()
+    assert ids(reranker.rerank("loops", [candidate("far", 0.9), candidate("near", 0.1), candidate("mid", 0.5)])) == ["near", "mid", "far"]
+
+    # A matching header lifts a slightly farther chunk; a stub loses to a full chunk at similar distance
+    ranked = reranker.rerank("for loops", [
+        candidate("best", 0.10),
+        candidate("plain", 0.18),
+        candidate("stub", 0.19, document="For"),
+        candidate("titled", 0.20, header="For Loops"),
+        candidate("far", 0.50, header="For Loops"),
+    ])
+    assert ids(ranked) == ["titled", "best", "plain", "stub", "far"]
+
+
+def test_blend_falls_back_to_first_stage_order_without_distances():
+    reranker = ScoreBlendReranker(header_weight=0.0)
+    ranked = reranker.rerank("q", [candidate("first", None), candidate("second", 0.2), candidate("third", None)])
+    assert ids(ranked) == ["first", "second", "third"]
+
+
+class SlowModel:
+    """Scores by document length and takes `delay` seconds per batch"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.batches = 0
+
+    def predict(self, pairs):
+        self.batches += 1
+        time.sleep(self.delay)
+        return [float(len(document)) for _, document in pairs]
+
+
+def test_cross_encoder_stops_scoring_when_the_budget_runs_out():
+    reranker = CrossEncoderReranker("unused", batch_size=2, budget_ms=10)
+    reranker._model = SlowModel(delay=0.05)
+    candidates = [candidate(str(i), None, document="x" * i) for i in range(1, 7)]
+
+    ranked = reranker.rerank("q", candidates)
+
+    # Only the first batch fit the budget: it is reordered, the rest keep first-stage order unscored
+    assert reranker._model.batches == 1
+    assert ids(ranked) == ["2", "1", "3", "4", "5", "6"]
+    assert [c["rerank_score"] for c in ranked[2:]] == [None] * 4
+    assert reranker.stats()["budget_exceeded"] == 1
+
+
+def test_cross_encoder_scores_everything_within_budget():
+    reranker = CrossEncoderReranker("unused", batch_size=2, budget_ms=1000)
+    reranker._model = SlowModel(delay=0)
+    ranked = reranker.rerank("q", [candidate(str(i), None, document="x" * i) for i in range(1, 6)])
+    assert ids(ranked) == ["5", "4", "3", "2", "1"]
+    assert reranker.stats()["budget_exceeded"] == 0
+
+
+def test_cross_encoder_falls_back_to_blend_without_sentence_transformers(monkeypatch):
+    monkeypatch.setattr(reranker_module, "_rerankers", {})
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+    assert isinstance(get_reranker("cross_encoder"), ScoreBlendReranker)
+    assert get_reranker("cross_encoder") is get_reranker("cross_encoder")
+    with pytest.raises(ValueError):
+        get_reranker("unknown")
@@ -0,0 +1,70 @@
+from microservices.vectorization import VectorStorageManager, build_scope_filter
+from scripts.merge_toc_content import tag_chunks_with_toc
+
+CHUNKS = [
+    {"content": "Preface text", "Header": "Preface"},
+    {"content": "Variables hold values", "Header": "1.1 Variables"},
+    {"content": "Loops repeat work", "Header": "1.2 Loops"},
+    {"content": "Classes group state", "Header": "2.1 Classes"},
+]
+
+TOC = {
+    "book_title": "Intro",
+    "chapters": [
+        {"chapter_number": 1, "chapter_title": "Basics", "start_page": 1, "sections": [
+            {"section_id": "1.1", "section_title": "Variables", "page": 2, "sub_sections": []},
+            {"section_id": "1.2", "section_title": "Loops", "page": 5, "sub_sections": []},
+        ]},
+        {"chapter_number": 2, "chapter_title": "Objects", "start_page": 9, "sections": [
+            {"section_id": "2.1", "section_title": "Classes", "page": 10, "sub_sections": []},
+        ]},
+    ],
+}
+
+
+def test_sync_after_toc_only_updates_scope_metadata(tiny_embeddings, tmp_path):
+    manager = VectorStorageManager("book_scope", db_path=str(tmp_path))
+    # Pipeline order: vectorize before the ToC exists, so chunks carry no scope
+    assert manager.process_and_store(CHUNKS) == 4
+    assert manager.collection.get(where=build_scope_filter(chapter_number=1))["ids"] == []
+    ids_before = set(manager.collection.get(include=[])["ids"])
+
+    embedded = []
+    embedding_fn = manager.embedding_fn
+    manager.embedding_fn = lambda texts: embedded.extend(texts) or embedding_fn(texts)
+
+    assert manager.process_and_store(tag_chunks_with_toc(CHUNKS, TOC), mode="sync") == 0
+    assert embedded == []
+    assert set(manager.collection.get(include=[])["ids"]) == ids_before
+    assert len(manager.collection.get(where=build_scope_filter(chapter_number=1))["ids"]) == 2
+    assert len(manager.collection.get(where=build_scope_filter(section_id="2.1"))["ids"]) == 1
+
+    # A revised ToC moves "Loops" into chapter 2; its stale section_id must not linger
+    revised = {"chapters": [
+        TOC["chapters"][0] | {"sections": TOC["chapters"][0]["sections"][:1]},
+        {"chapter_number": 2, "chapter_title": "Loops", "start_page": 5, "sections": []},
+    ]}
+    manager.process_and_store(tag_chunks_with_toc(CHUNKS, revised), mode="sync")
+    assert manager.collection.get(where=build_scope_filter(section_id="1.2"))["ids"] == []
+    assert len(manager.collection.get(where=build_scope_filter(chapter_number=2))["ids"]) == 2
+    manager.close()
+
+
+def test_update_scope_never_adds_or_removes_chunks(tiny_embeddings, tmp_path):
+    manager = VectorStorageManager("book_scope", db_path=str(tmp_path))
+    # The collection was built from a different chunk file than the one being tagged
+    extra = {"content": "Appendix text", "Header": "Appendix"}
+    manager.process_and_store(CHUNKS[1:] + [extra])
+    ids_before = set(manager.collection.get(include=[])["ids"])
+
+    embedded = []
+    embedding_fn = manager.embedding_fn
+    manager.embedding_fn = lambda texts: embedded.extend(texts) or embedding_fn(texts)
+
+    other_file = [CHUNKS[0], CHUNKS[1], {"content": "Not stored", "Header": "1.2 Loops"}, CHUNKS[3]]
+    assert manager.update_scope(tag_chunks_with_toc(other_file, TOC), batch_size=2) == 2
+    assert embedded == []
+    assert set(manager.collection.get(include=[])["ids"]) == ids_before
+    assert len(manager.collection.get(where=build_scope_filter(chapter_number=1))["ids"]) == 1
+    assert len(manager.collection.get(where=build_scope_filter(section_id="2.1"))["ids"]) == 1
+    manager.close()
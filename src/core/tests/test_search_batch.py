@@ -0,0 +1,47 @@
+import pytest
+
+import microservices.vectorization as vectorization
+from microservices.vectorization import VectorStorageManager, build_scope_filter
+
+CHUNKS = [
+    {"content": "Variables hold values", "Header": "1.1 Variables", "scope": {"chapter_number": 1}},
+    {"content": "Loops repeat work", "Header": "1.2 Loops", "scope": {"chapter_number": 1}},
+    {"content": "Classes group state", "Header": "2.1 Classes", "scope": {"chapter_number": 2}},
+    {"content": "A JTextField is a single-line text field", "Header": "2.2 Swing", "scope": {"chapter_number": 2}},
+]
+QUERIES = ["loops", "JTextField", "classes and state", "loops"]
+
+
+@pytest.fixture
+def manager(tiny_embeddings, monkeypatch, tmp_path):
+    monkeypatch.setattr(vectorization, "get_search_cache", lambda: None)
+    manager = VectorStorageManager("book_batch", db_path=str(tmp_path))
+    manager.process_and_store(CHUNKS)
+    yield manager
+    manager.close()
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+@pytest.mark.parametrize("where", [None, build_scope_filter(chapter_number=2)])
+def test_batch_matches_individual_searches(manager, mode, where):
+    individual = [manager.search(query, n_results=2, mode=mode, where=where) for query in QUERIES]
+    assert manager.search_batch(QUERIES, n_results=2, mode=mode, where=where) == individual
+    assert all(len(result["ids"][0]) == 2 for result in individual)
+    if where:
+        assert all(meta["chapter_number"] == 2 for result in individual for meta in result["metadatas"][0])
+
+
+def test_batch_embeds_and_queries_once(manager):
+    embedded, queried = [], []
+    embedding_fn = manager.embedding_fn
+    manager.embedding_fn = lambda texts: embedded.append(list(texts)) or embedding_fn(texts)
+    query_by_embeddings = manager.query_by_embeddings
+    manager.query_by_embeddings = lambda embeddings, *args, **kwargs: queried.append(len(embeddings)) or query_by_embeddings(embeddings, *args, **kwargs)
+
+    results = manager.search_batch(QUERIES, n_results=2)
+
+    # Duplicate queries are computed once and answered in input order
+    assert embedded == [["loops", "JTextField", "classes and state"]]
+    assert queried == [3]
+    assert len(results) == 4
+    assert results[0] == results[3]
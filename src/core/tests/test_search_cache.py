@@ -0,0 +1,64 @@
+import pytest
+
+import microservices.vectorization as vectorization
+from microservices.search_cache import SearchCache
+from microservices.vectorization import VectorStorageManager
+
+CHUNKS = [
+    {"content": "Variables hold values", "Header": "1.1 Variables"},
+    {"content": "Loops repeat work", "Header": "1.2 Loops"},
+    {"content": "Classes group state", "Header": "2.1 Classes"},
+]
+
+
+@pytest.fixture
+def search_cache(monkeypatch):
+    cache = SearchCache()
+    monkeypatch.setattr(vectorization, "get_search_cache", lambda: cache)
+    return cache
+
+
+def counting_queries(manager):
+    calls = []
+    query_by_embeddings = manager.query_by_embeddings
+    manager.query_by_embeddings = lambda embeddings, *args, **kwargs: calls.append(len(embeddings)) or query_by_embeddings(embeddings, *args, **kwargs)
+    return calls
+
+
+def test_store_bumps_the_version_and_the_next_search_misses(tiny_embeddings, search_cache, tmp_path):
+    manager = VectorStorageManager("book_cache", db_path=str(tmp_path))
+    manager.process_and_store(CHUNKS)
+    queries = counting_queries(manager)
+
+    first = manager.search("loops", n_results=5)
+    assert manager.search("loops", n_results=5) == first
+    assert queries == [1]
+    assert search_cache.stats()["results"]["hits"] == 1
+
+    # Different parameters are different entries
+    manager.search("loops", n_results=2)
+    assert queries == [1, 1]
+
+    version = manager.version
+    manager.process_and_store(CHUNKS + [{"content": "Interfaces define contracts", "Header": "2.2 Interfaces"}], mode="sync")
+    assert manager.version != version
+    assert search_cache.stats()["results"]["entries"] == 0
+
+    refreshed = manager.search("loops", n_results=5)
+    assert queries == [1, 1, 1]
+    assert len(refreshed["ids"][0]) == 4
+    # The query embedding is still reused; only results depend on the collection version
+    assert search_cache.stats()["query_embeddings"]["hits"] >= 2
+    manager.close()
+
+
+def test_unchanged_sync_keeps_cached_results(tiny_embeddings, search_cache, tmp_path):
+    manager = VectorStorageManager("book_cache", db_path=str(tmp_path))
+    manager.process_and_store(CHUNKS)
+    manager.search("loops")
+    version = manager.version
+
+    manager.process_and_store(CHUNKS, mode="sync")
+    assert manager.version == version
+    assert search_cache.stats()["results"]["entries"] == 1
+    manager.close()
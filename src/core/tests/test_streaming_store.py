@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from microservices.vectorization import VectorStorageManager
+from scripts.merge_toc_content import tag_chunks_with_toc
+
+TOC = {"chapters": [{"chapter_number": 1, "chapter_title": "Basics", "start_page": 1, "sections": []}]}
+
+
+def test_store_consumes_chunk_stream_incrementally(tiny_embeddings, tmp_path):
+    chunks_path = tmp_path / "chunks.jsonl"
+    with open(chunks_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"content": "intro", "Header": "Basics"}) + "\n")
+        for index in range(39):
+            f.write(json.dumps({"content": f"paragraph {index}", "Header": f"Part {index}"}) + "\n")
+
+    manager = VectorStorageManager("book_stream", db_path=str(tmp_path / "db"))
+    pulled = 0
+
+    def source():
+        nonlocal pulled
+        for chunk in manager.iter_chunks(str(chunks_path)):
+            pulled += 1
+            yield chunk
+
+    pulled_at_write = []
+    add = manager.collection.add
+    manager.collection.add = lambda **kwargs: pulled_at_write.append(pulled) or add(**kwargs)
+
+    reports = []
+    stored = manager.process_and_store(
+        tag_chunks_with_toc(source(), TOC), batch_size=4, queue_depth=1, embed_workers=1, progress=reports.append
+    )
+
+    assert stored == 40
+    assert reports == sorted(reports) and reports[0] < 40 and reports[-1] == 40
+    assert manager.count_chunks(str(chunks_path)) == 40
+    # With one queued batch the producer can only run a few batches ahead of the writer
+    assert pulled_at_write[0] <= 4 * 4
+    assert manager.collection.get(where={"chapter_number": 1}, include=[])["ids"]
+    manager.close()
+
+
+def test_iter_chunks_reports_missing_file_before_iteration(tiny_embeddings, tmp_path):
+    manager = VectorStorageManager("book_stream", db_path=str(tmp_path / "db"))
+    # Raised on the call itself, so skip mode (which never iterates) still reports a bad path
+    with pytest.raises(FileNotFoundError):
+        manager.iter_chunks(str(tmp_path / "missing.jsonl"))
+    manager.close()
@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from scripts.benchmark_toc_matching import toc_queries
+from scripts.merge_toc_content import _NUMBER_PREFIX_RE, LinearTitleMatcher, TitleIndex, build_content_map, clean_title
+
+SAMPLE_BOOKS = Path(__file__).resolve().parents[3] / "data" / "hizan" / "output"
+
+
+def load_book(name):
+    book = SAMPLE_BOOKS / name / "hybrid_auto"
+    if not book.exists():
+        pytest.skip(f"sample book {name} not available")
+    with open(book / "chunker_step_1.json", encoding="utf-8") as f:
+        content_map = build_content_map(json.load(f))
+    with open(book / "textbook_toc.json", encoding="utf-8") as f:
+        return content_map, toc_queries(json.load(f))
+
+
+def numbered_as(header, number):
+    match = _NUMBER_PREFIX_RE.match(clean_title(header or ""))
+    return bool(match) and match.group(1) == number
+
+
+@pytest.mark.parametrize("book", ["java_short", "pyhton_short"])
+def test_title_index_agrees_with_linear_matcher_on_sample_toc(book):
+    content_map, queries = load_book(book)
+    header_by_content = {}
+    for header, content in content_map.items():
+        header_by_content.setdefault(content, header)
+    linear, index = LinearTitleMatcher(content_map), TitleIndex(content_map)
+
+    verified = {"linear": 0, "index": 0}
+    for number, title in queries:
+        expected, actual = linear.find(title, number), index.find(title, number)
+        assert actual, f"{number} {title} is unmatched"
+        norm = clean_title(title)
+        if norm in linear.normalized_content_map:
+            # Exact hits are dictionary lookups in both matchers
+            assert actual == expected
+        linear_header, index_header = header_by_content.get(expected), header_by_content.get(actual)
+        # Where they differ, the index never gives up a header numbered like the node
+        assert numbered_as(index_header, number) or not numbered_as(linear_header, number), (number, title)
+        verified["linear"] += numbered_as(linear_header, number)
+        verified["index"] += numbered_as(index_header, number)
+    assert verified["index"] >= verified["linear"]
+
+
+def test_short_headers_do_not_swallow_longer_titles():
+    index = TitleIndex({"A": "sidebar", "1.11 Debugging": "ch1", "2.13 Debugging": "ch2", "Modi f ying Eclip se": "spaced"})
+    assert index.find("Java on Windows, macOS, and Linux") == ""
+    assert index.find("Debugging", "2.13") == "ch2"
+    assert index.find("Debugging") == "ch1"
+    assert index.find("Modifying Eclipse") == "spaced"
+    assert LinearTitleMatcher({"A": "sidebar"}).find("Java on Windows, macOS, and Linux") == "sidebar"
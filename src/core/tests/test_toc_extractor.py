@@ -0,0 +1,83 @@
+import pytest
+
+from llm.toc_extractor import extract_toc_from_text, split_toc_text, stitch_toc_fragments
+
+
+def chapters(toc):
+    return [(chapter["chapter_number"], chapter["chapter_title"]) for chapter in toc["chapters"]]
+
+
+def test_bare_number_marks_a_chapter_only_in_sequence():
+    toc = extract_toc_from_text("\n".join([
+        "1 Basics 1",
+        "1.1 Variables 2",
+        "42",  # stray page number
+        "Exercises 5",
+        "2",  # chapter number set on its own line
+        "Objects 9",
+        "2.1 Classes 10",
+    ]))
+    assert chapters(toc) == [(1, "Basics"), (2, "Objects")]
+    assert [section["section_title"] for section in toc["chapters"][0]["sections"]] == ["Variables", "Exercises"]
+
+
+def test_explicit_chapter_marker_may_skip_ahead():
+    toc = extract_toc_from_text("1 Basics 1\n1.1 Variables 2\nChapter 7\nObjects 9")
+    assert chapters(toc) == [(1, "Basics"), (7, "Objects")]
+
+
+TOC_TEXT = "\n".join([
+    "Contents",
+    "Preface vii",
+    "1 Basics 1",
+    "1.1 Variables 2",
+    "12",  # stray page number inside chapter 1
+    "2 Objects 9",
+    "2.1 Classes 10",
+    "3 Files 20",
+    "Appendix",
+    "Tools 30",
+])
+
+
+def test_split_toc_text_cuts_only_at_chapter_boundaries():
+    fragments = split_toc_text(TOC_TEXT, max_chars=1)
+    assert [fragment.splitlines()[0] for fragment in fragments] == ["Contents", "2 Objects 9", "3 Files 20", "Appendix"]
+    assert "Tools 30" in fragments[-1]
+    assert "\n".join(fragments) == TOC_TEXT
+
+    # Whole chapters are packed together up to max_chars
+    assert len(split_toc_text(TOC_TEXT, max_chars=60)) == 2
+    assert split_toc_text("Variables\nClasses", max_chars=1) == ["Variables\nClasses"]
+
+
+def fragment(*chapters):
+    return {"book_title": "", "chapters": [
+        {"chapter_number": number, "chapter_title": title, "start_page": str(page), "sections": [
+            {"section_id": f"{number}.{i + 1}", "section_title": section, "page": page + i + 1}
+            for i, section in enumerate(sections)
+        ]}
+        for number, title, page, sections in chapters
+    ]}
+
+
+def test_stitch_renumbers_restarted_fragments_and_merges_split_chapters():
+    toc = stitch_toc_fragments([
+        fragment((1, "Basics", 1, ["Variables"])),
+        # The second request could not see chapter 1 and numbered from 1 again
+        fragment((1, "Objects", 9, ["Classes"]), (2, "Files", 20, [])),
+        # Chapter "Files" continues across the fragment boundary
+        fragment((3, "Files", 20, ["Reading"]), ("A", "Tools", 30, [])),
+    ])
+
+    assert [(c["chapter_number"], c["chapter_title"]) for c in toc["chapters"]] == [(1, "Basics"), (2, "Objects"), (3, "Files"), (4, "Tools")]
+    assert toc["chapters"][1]["sections"][0]["section_id"] == "2.1"
+    assert toc["chapters"][2]["sections"] == [{"section_id": "3.1", "section_title": "Reading", "page": 21, "sub_sections": []}]
+    assert toc["chapters"][0]["start_page"] == 1
+
+
+def test_stitch_rejects_unusable_fragments():
+    with pytest.raises(ValueError):
+        stitch_toc_fragments([fragment((1, "Basics", 1, [])), {"error": "truncated"}])
+    with pytest.raises(ValueError):
+        stitch_toc_fragments([fragment((1, "Basics", 1, []), (3, "Files", 20, []), (2, "Objects", 9, []))])
@@ -0,0 +1,75 @@
+import time
+
+from microservices.vectorization import VectorStorageManager, VectorStoreRegistry
+
+
+def make_collections(db_path, names):
+    for name in names:
+        manager = VectorStorageManager(name, db_path=db_path)
+        manager.collection.add(
+            ids=[f"{name}-a", f"{name}-b"],
+            documents=[f"alpha {name}", f"beta {name}"],
+            metadatas=[{"header_1": name}, {"header_1": name}],
+        )
+        manager.close()
+
+
+def test_leased_manager_survives_lru_overflow(tiny_embeddings, tmp_path):
+    make_collections(str(tmp_path), ["book_a", "book_b", "book_c"])
+    registry = VectorStoreRegistry(max_clients=1)
+
+    with registry.lease("book_a", db_path=str(tmp_path)) as held:
+        for name in ("book_b", "book_c"):
+            with registry.lease(name, db_path=str(tmp_path)) as manager:
+                assert manager.collection.count() == 2
+        # "book_a" is older than "book_b" and "book_c" but still leased, so it must not have been closed
+        assert held.collection.count() == 2
+        assert registry.stats()["leased_clients"] == 1
+        assert registry.evictions == 2
+
+    assert registry.stats()["open_clients"] == 1
+
+
+def test_idle_timeout_skips_leased_managers(tiny_embeddings, tmp_path):
+    make_collections(str(tmp_path), ["book_a", "book_b"])
+    registry = VectorStoreRegistry(idle_timeout=0.01)
+
+    with registry.lease("book_a", db_path=str(tmp_path)) as held:
+        time.sleep(0.05)
+        with registry.lease("book_b", db_path=str(tmp_path)):
+            pass
+        assert held.collection.count() == 2
+    assert registry.evictions == 0
+
+
+def test_invalidate_closes_after_last_release(tiny_embeddings, tmp_path):
+    make_collections(str(tmp_path), ["book_a"])
+    registry = VectorStoreRegistry()
+
+    with registry.lease("book_a", db_path=str(tmp_path)) as held:
+        registry.invalidate("book_a", db_path=str(tmp_path))
+        assert held.collection.count() == 2
+        assert registry.stats()["open_clients"] == 0
+
+
+def test_search_collections_with_more_collections_than_pool_size(tiny_embeddings, tmp_path, monkeypatch):
+    names = [f"book_{i:02d}" for i in range(30)]
+    make_collections(str(tmp_path), names)
+
+    # Slow queries keep every pool thread busy while the others open their collections
+    query_by_embedding = VectorStorageManager.query_by_embedding
+
+    def slow_query(self, *args, **kwargs):
+        time.sleep(0.05)
+        return query_by_embedding(self, *args, **kwargs)
+
+    monkeypatch.setattr(VectorStorageManager, "query_by_embedding", slow_query)
+    registry = VectorStoreRegistry(max_clients=2)
+
+    searched = registry.search_collections("alpha", str(tmp_path), n_results=5)
+
+    assert searched["errors"] == {}
+    assert sorted(searched["searched"]) == names
+    assert len(searched["results"]) == 5
+    assert registry.stats()["open_clients"] == 2
+    assert registry.stats()["leased_clients"] == 0